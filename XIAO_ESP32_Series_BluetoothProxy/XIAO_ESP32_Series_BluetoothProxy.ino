@@ -127,6 +127,11 @@
  #define BTHOME_SERVICE_UUID_L 0xD2
  #define BTHOME_SERVICE_UUID_H 0xFC
  #define BTHOME_BINARY_MOTION  0x21
+
+// Allowlist pushed by the backend (gateway/{id}/cmd, gateway/all/cmd)
+// 后端下发的白名单（gateway/{id}/cmd、gateway/all/cmd）
+#define ALLOWLIST_MAX     1024   // Max MACs kept (8 bytes each) | 最多保存的 MAC 数（每个 8 字节）
+#define MQTT_BUFFER_SIZE  2048   // Fits one allowlist chunk | 可容纳一个名单分片
  
  // =============================================================================
  // BLE Scan Parameters | BLE 扫描参数
@@ -200,6 +205,26 @@
  // BLE initialization flag
  // BLE 初始化标志
  bool bleInitialized = false;
+
+// Allowlist state: sorted MACs, swapped in when a full list has been received
+// 白名单状态：有序 MAC 列表，完整名单接收完毕后整体替换
+// Read from the BLE task, written from the MQTT loop, guarded by allowlistMux
+// BLE 任务读取、MQTT 循环写入，由 allowlistMux 保护
+uint64_t allowlist[ALLOWLIST_MAX];
+uint64_t allowlistStaging[ALLOWLIST_MAX];
+size_t allowlistCount = 0;
+size_t stagingCount = 0;
+int stagingNextPart = -1;
+uint32_t stagingEpoch = 0;
+uint32_t stagingVersion = 0;
+bool allowlistActive = false;     // false: forward everything | false：全部转发
+bool allowlistOverflow = false;   // List larger than ALLOWLIST_MAX | 名单超出容量
+uint32_t allowlistEpoch = 0;
+uint32_t allowlistVersion = 0;
+unsigned long discoveryIntervalMs = 0;
+unsigned long lastDiscovery = 0;
+bool discoveryStarted = false;
+portMUX_TYPE allowlistMux = portMUX_INITIALIZER_UNLOCKED;
  
  // =============================================================================
  // Function Declarations | 函数声明
@@ -210,6 +235,8 @@ void initGatewayId();
 void publishGatewayInfo(const char* action);
 void mqttCallback(char* topic, byte* payload, unsigned int length);
 void startIdentify();
+bool isAllowed(const uint8_t* addr);
+void handleAllowlistCommand(JsonDocument& doc);
  
  // =============================================================================
  // WiFiManager Callbacks | WiFiManager 回调函数
@@ -357,6 +384,12 @@ void startIdentify();
                  return 0;
              }
              
+             // Drop sensors not in the backend allowlist
+             // 丢弃不在后端白名单中的传感器
+             if (!isAllowed(event->disc.addr.val)) {
+                 return 0;
+             }
+             
              // Format MAC address
              // 格式化 MAC 地址
              char macStr[18];
@@ -516,6 +549,10 @@ void connectMQTT() {
         mqttClient.subscribe(cmdTopic.c_str());
         Serial.printf("[MQTT] Subscribed to %s\n", cmdTopic.c_str());
         
+        // Broadcast commands (allowlist updates)
+        // 广播命令（白名单更新）
+        mqttClient.subscribe("gateway/all/cmd");
+        
         // Publish gateway info on connect
         // 连接时发布网关信息
         publishGatewayInfo("online");
@@ -553,6 +590,224 @@ void mqttCallback(char* topic, byte* payload, unsigned int length) {
         // Publish gateway info
         // 发布网关信息
         publishGatewayInfo("info");
+    } else if (strcmp(cmd, "allowlist") == 0) {
+        handleAllowlistCommand(doc);
+    }
+}
+
+// =============================================================================
+// Allowlist | 白名单
+// =============================================================================
+
+/**
+ * Pack 12 hex chars into a MAC value (same byte order as the topic MAC)
+ * 把 12 位十六进制字符转换为 MAC 数值（与 topic 中 MAC 的字节顺序一致）
+ */
+static bool parseMac(const char* hex, uint64_t* out) {
+    uint64_t value = 0;
+    for (int i = 0; i < 12; i++) {
+        char c = hex[i];
+        uint8_t nibble;
+        if (c >= '0' && c <= '9') nibble = c - '0';
+        else if (c >= 'a' && c <= 'f') nibble = c - 'a' + 10;
+        else if (c >= 'A' && c <= 'F') nibble = c - 'A' + 10;
+        else return false;
+        value = (value << 4) | nibble;
+    }
+    *out = value;
+    return true;
+}
+
+/**
+ * Index of the first entry >= mac
+ * 第一个 >= mac 的位置
+ */
+static size_t lowerBound(const uint64_t* list, size_t count, uint64_t mac) {
+    size_t lo = 0, hi = count;
+    while (lo < hi) {
+        size_t mid = (lo + hi) / 2;
+        if (list[mid] < mac) lo = mid + 1; else hi = mid;
+    }
+    return lo;
+}
+
+/**
+ * Whether an advertisement from addr should be forwarded.
+ * Unlisted sensors are still forwarded once per discovery interval so the backend can discover them.
+ * 是否转发该地址的广播；名单外的传感器每个发现间隔仍转发一次，供后端发现未映射传感器
+ */
+bool isAllowed(const uint8_t* addr) {
+    uint64_t mac = 0;
+    for (int i = 5; i >= 0; i--) {
+        mac = (mac << 8) | addr[i];
+    }
+    bool allowed = true;
+    portENTER_CRITICAL(&allowlistMux);
+    if (allowlistActive) {
+        size_t i = lowerBound(allowlist, allowlistCount, mac);
+        allowed = i < allowlistCount && allowlist[i] == mac;
+        if (!allowed && discoveryIntervalMs > 0) {
+            unsigned long now = millis();
+            if (!discoveryStarted || now - lastDiscovery >= discoveryIntervalMs) {
+                lastDiscovery = now;
+                discoveryStarted = true;
+                allowed = true;
+            }
+        }
+    }
+    portEXIT_CRITICAL(&allowlistMux);
+    return allowed;
+}
+
+/**
+ * Apply an allowlist command; report our version back (ack, or resync request when out of step)
+ * 应用白名单命令；之后上报本机名单版本（作为回执，或版本不符时请求补发）
+ */
+void handleAllowlistCommand(JsonDocument& doc) {
+    const char* op = doc["op"] | "";
+    uint32_t epoch = doc["epoch"] | 0;
+    uint32_t version = doc["version"] | 0;
+
+    if (strcmp(op, "off") == 0) {
+        portENTER_CRITICAL(&allowlistMux);
+        allowlistActive = false;
+        allowlistOverflow = false;
+        allowlistCount = 0;
+        allowlistEpoch = 0;
+        allowlistVersion = 0;
+        portEXIT_CRITICAL(&allowlistMux);
+        stagingNextPart = -1;
+        Serial.println("[Allowlist] Disabled, forwarding all sensors");
+        publishGatewayInfo("allowlist");
+
+    } else if (strcmp(op, "announce") == 0) {
+        // Overflowed gateways also report, the backend resends the full list once it fits again
+        // 超出容量的网关也上报，名单缩小到容量以内后后端会重发完整名单
+        if (allowlistOverflow || epoch != allowlistEpoch || version != allowlistVersion) {
+            publishGatewayInfo("allowlist");
+        }
+
+    } else if (strcmp(op, "full") == 0) {
+        int part = doc["part"] | 0;
+        int parts = doc["parts"] | 1;
+        size_t count = doc["count"] | 0;
+        const char* macs = doc["macs"] | "";
+
+        if (part == 0) {
+            stagingNextPart = 0;
+            stagingCount = 0;
+            stagingEpoch = epoch;
+            stagingVersion = version;
+        }
+        if (part != stagingNextPart || epoch != stagingEpoch || version != stagingVersion) {
+            // Missing chunk or the list changed mid-transfer: ask again
+            // 缺分片或名单在传输中变化：请求重发
+            stagingNextPart = -1;
+            publishGatewayInfo("allowlist");
+            return;
+        }
+        size_t len = strlen(macs);
+        for (size_t i = 0; i + 12 <= len; i += 12) {
+            uint64_t mac;
+            if (stagingCount < ALLOWLIST_MAX && parseMac(macs + i, &mac)) {
+                allowlistStaging[stagingCount] = mac;
+            }
+            stagingCount++;
+        }
+        stagingNextPart++;
+        if (stagingNextPart < parts) {
+            return;
+        }
+        stagingNextPart = -1;
+        if (stagingCount != count) {
+            publishGatewayInfo("allowlist");
+            return;
+        }
+
+        portENTER_CRITICAL(&allowlistMux);
+        allowlistOverflow = count > ALLOWLIST_MAX;
+        allowlistCount = allowlistOverflow ? 0 : count;
+        memcpy(allowlist, allowlistStaging, allowlistCount * sizeof(uint64_t));
+        allowlistActive = !allowlistOverflow;
+        allowlistEpoch = epoch;
+        allowlistVersion = version;
+        discoveryIntervalMs = (unsigned long)((doc["discovery"] | 0.0) * 1000);
+        portEXIT_CRITICAL(&allowlistMux);
+
+        if (allowlistOverflow) {
+            Serial.printf("[Allowlist] %u MACs exceed capacity %d, forwarding all\n", (unsigned)count, ALLOWLIST_MAX);
+        } else {
+            Serial.printf("[Allowlist] v%u: %u MACs\n", version, (unsigned)count);
+        }
+        publishGatewayInfo("allowlist");
+
+    } else if (strcmp(op, "delta") == 0) {
+        uint32_t base = doc["base"] | 0;
+        if (epoch == allowlistEpoch && version == allowlistVersion) {
+            return;  // Already applied | 已应用
+        }
+        // Without a usable list (none yet, or overflowed) a delta cannot be applied: report without
+        // advancing the version, the backend answers with a full list
+        // 没有可用名单（尚未收到或已超出容量）时无法应用增量：不推进版本直接上报，后端改发完整名单
+        if (epoch != allowlistEpoch || base != allowlistVersion || !allowlistActive) {
+            publishGatewayInfo("allowlist");
+            return;
+        }
+        const char* add = doc["add"] | "";
+        const char* remove = doc["remove"] | "";
+        size_t addLen = strlen(add);
+        size_t removeLen = strlen(remove);
+
+        // Edit a copy in the staging buffer (only this task writes the list), then swap it in briefly
+        // 在暂存区的副本上修改（只有本任务写名单），再在临界区内整体替换
+        stagingNextPart = -1;
+        size_t count = allowlistCount;
+        bool overflow = false;
+        memcpy(allowlistStaging, allowlist, count * sizeof(uint64_t));
+        for (size_t i = 0; i + 12 <= removeLen; i += 12) {
+            uint64_t mac;
+            if (!parseMac(remove + i, &mac)) continue;
+            size_t pos = lowerBound(allowlistStaging, count, mac);
+            if (pos < count && allowlistStaging[pos] == mac) {
+                memmove(&allowlistStaging[pos], &allowlistStaging[pos + 1], (count - pos - 1) * sizeof(uint64_t));
+                count--;
+            }
+        }
+        for (size_t i = 0; i + 12 <= addLen && !overflow; i += 12) {
+            uint64_t mac;
+            if (!parseMac(add + i, &mac)) continue;
+            size_t pos = lowerBound(allowlistStaging, count, mac);
+            if (pos < count && allowlistStaging[pos] == mac) continue;
+            if (count >= ALLOWLIST_MAX) {
+                overflow = true;
+                break;
+            }
+            memmove(&allowlistStaging[pos + 1], &allowlistStaging[pos], (count - pos) * sizeof(uint64_t));
+            allowlistStaging[pos] = mac;
+            count++;
+        }
+
+        portENTER_CRITICAL(&allowlistMux);
+        if (overflow) {
+            // The list no longer fits: forward everything and keep the old version, so the report
+            // below is not mistaken for "in sync"
+            // 名单放不下：全部转发，版本保持不变，下面的上报不会被当作已同步
+            allowlistCount = 0;
+            allowlistOverflow = true;
+            allowlistActive = false;
+        } else {
+            memcpy(allowlist, allowlistStaging, count * sizeof(uint64_t));
+            allowlistCount = count;
+            allowlistVersion = version;
+        }
+        portEXIT_CRITICAL(&allowlistMux);
+
+        if (overflow) {
+            Serial.printf("[Allowlist] v%u exceeds capacity %d, forwarding all\n", version, ALLOWLIST_MAX);
+        } else {
+            Serial.printf("[Allowlist] v%u: %u MACs\n", version, (unsigned)count);
+        }
+        publishGatewayInfo("allowlist");
     }
 }
 
@@ -583,6 +838,13 @@ void publishGatewayInfo(const char* action) {
             mac[0], mac[1], mac[2], mac[3], mac[4], mac[5]);
     doc["mac"] = macStr;
     
+    // Allowlist version, lets the backend send missing updates
+    // 白名单版本，后端据此补发缺失的更新
+    doc["allowlist_epoch"] = allowlistEpoch;
+    doc["allowlist_version"] = allowlistVersion;
+    doc["allowlist_overflow"] = allowlistOverflow;
+    doc["allowlist_capacity"] = ALLOWLIST_MAX;
+    
     String payload;
     serializeJson(doc, payload);
     
@@ -833,6 +1095,7 @@ void updateLed() {
      // MQTT and BLE Initialization | MQTT 和 BLE 初始化
      // =========================================================================
      
+     mqttClient.setBufferSize(MQTT_BUFFER_SIZE);
      connectMQTT();
      initBLE();
      
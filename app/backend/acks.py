@@ -0,0 +1,175 @@
+"""
+屏幕播放确认跟踪
+每条实际发出的播放指令带 cmd_id，屏幕开始播放后在 screen/{id}/status 回报 {"cmd_id": .., "status": "playing"}。
+按 cmd_id 关联发送与确认，统计各屏幕的送达延迟分位数；超过 timeout 未确认的指令移入未确认列表，
+之后才到的确认计为迟到
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from latency import summarize_ms
+
+
+class PendingCommand:
+    __slots__ = ("cmd_id", "screen", "payload", "sent_at", "sent_ts")
+
+    def __init__(self, cmd_id: str, screen: str, payload, sent_at: float):
+        self.cmd_id = cmd_id
+        self.screen = screen
+        self.payload = payload
+        self.sent_at = sent_at  # monotonic，计算延迟
+        self.sent_ts = time.time()  # 展示用
+
+    def to_dict(self, now: float) -> dict:
+        try:
+            body = json.loads(self.payload)
+        except (TypeError, ValueError):
+            body = {}
+        return {
+            "cmd_id": self.cmd_id,
+            "screen": self.screen,
+            "sku": body.get("sku", ""),
+            "video": body.get("video", ""),
+            "sent_at": self.sent_ts,
+            "age_s": round(now - self.sent_at, 3),
+        }
+
+
+class ScreenAcks:
+    __slots__ = ("sent", "acked", "errors", "late", "expired", "latencies")
+
+    def __init__(self, window: int):
+        self.sent = 0
+        self.acked = 0
+        self.errors = 0  # 屏幕回报播放失败
+        self.late = 0  # 超时之后才到的确认
+        self.expired = 0
+        self.latencies: deque = deque(maxlen=window)
+
+
+class AckTracker:
+    def __init__(self, timeout: float = 5.0, window: int = 1000, keep_expired: int = 200):
+        self.timeout = timeout
+        self.window = window
+        self._prefix = f"{int(time.time()) & 0xFFFFFF:06x}"  # 区分重启前后的指令
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending: OrderedDict[str, PendingCommand] = OrderedDict()  # 按发送时间排列
+        self._expired: OrderedDict[str, PendingCommand] = OrderedDict()
+        self._keep_expired = keep_expired
+        self._screens: dict[str, ScreenAcks] = {}
+        # 确认先于发送登记到达时暂存（进程内 broker 同步投递时可能出现）：cmd_id → (状态, 接收时间)
+        self._early: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self.unknown = 0  # cmd_id 无法识别（重启前发出、或早已被挤出未确认列表）
+
+    def next_id(self) -> str:
+        return f"{self._prefix}-{next(self._ids):x}"
+
+    def _screen(self, screen: str) -> ScreenAcks:
+        acks = self._screens.get(screen)
+        if acks is None:
+            acks = self._screens[screen] = ScreenAcks(self.window)
+        return acks
+
+    def sent(self, screen: str, cmd_id: str, payload):
+        """播放指令已发出（调度线程调用）"""
+        if not cmd_id:
+            return
+        now = time.monotonic()
+        with self._lock:
+            command = self._pending[cmd_id] = PendingCommand(cmd_id, screen, payload, now)
+            self._screen(screen).sent += 1
+            early = self._early.pop(cmd_id, None)
+            if early is not None:
+                del self._pending[cmd_id]
+                self._record(command, early[0], now, late=False)
+            self._expire(now)
+
+    def ack(self, screen: str, cmd_id: str, status: str, received_at: float) -> Optional[float]:
+        """屏幕确认；返回送达延迟（秒），无法关联时返回 None"""
+        with self._lock:
+            command = self._pending.pop(cmd_id, None)
+            late = command is None
+            if late:
+                command = self._expired.pop(cmd_id, None)
+                if command is None:
+                    self._early[cmd_id] = (status, received_at)
+                    if len(self._early) > 256:
+                        self._early.popitem(last=False)
+                        self.unknown += 1
+                    return None
+            return self._record(command, status, received_at, late)
+
+    def _record(self, command: PendingCommand, status: str, received_at: float, late: bool) -> float:
+        acks = self._screen(command.screen)
+        latency = max(0.0, received_at - command.sent_at)
+        if late:
+            acks.late += 1
+        if status == "error":
+            acks.errors += 1
+        else:
+            acks.acked += 1
+            acks.latencies.append(latency)
+        return latency
+
+    def _expire(self, now: float):
+        while self._pending:
+            command = next(iter(self._pending.values()))
+            if now - command.sent_at <= self.timeout:
+                break
+            del self._pending[command.cmd_id]
+            self._screen(command.screen).expired += 1
+            self._expired[command.cmd_id] = command
+            if len(self._expired) > self._keep_expired:
+                self._expired.popitem(last=False)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def counts(self, field: str) -> dict[tuple[str], int]:
+        with self._lock:
+            self._expire(time.monotonic())
+            return {(screen,): getattr(acks, field) for screen, acks in self._screens.items()}
+
+    def unacked(self, limit: int = 50) -> dict:
+        """等待确认中的指令与最近超时未确认的指令（新的在前）"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            waiting = [c.to_dict(now) for c in reversed(self._pending.values())][:limit]
+            expired = [c.to_dict(now) for c in reversed(self._expired.values())][:limit]
+        return {"timeout_s": self.timeout, "waiting": waiting, "expired": expired}
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._expire(time.monotonic())
+            screens = {
+                screen: {
+                    "sent": acks.sent,
+                    "acked": acks.acked,
+                    "errors": acks.errors,
+                    "late": acks.late,
+                    "expired": acks.expired,
+                    "latency_ms": summarize_ms(acks.latencies),
+                }
+                for screen, acks in self._screens.items()
+            }
+            waiting = len(self._pending)
+            latencies = [v for acks in self._screens.values() for v in acks.latencies]
+        return {
+            "timeout_s": self.timeout,
+            "waiting": waiting,
+            "unknown": self.unknown + len(self._early),
+            **{
+                key: sum(s[key] for s in screens.values())
+                for key in ("sent", "acked", "errors", "late", "expired")
+            },
+            "latency_ms": summarize_ms(latencies),
+            "screens": screens,
+        }
@@ -0,0 +1,148 @@
+"""
+网关白名单
+由 product_map 中的 MAC 生成有序列表下发给 ESP32 网关，网关只转发名单内传感器的广播，
+未映射的传感器在网关侧就被丢弃，不再经过 broker 和后端。
+
+协议（gateway/{id}/cmd 单播，gateway/all/cmd 广播，MAC 为 12 位小写十六进制直接拼接）:
+    full      {"cmd":"allowlist","op":"full","epoch":E,"version":V,"part":i,"parts":n,"count":N,"discovery":30,"macs":"aabb.."}
+    delta     {"cmd":"allowlist","op":"delta","epoch":E,"base":B,"version":V,"add":"..","remove":".."}
+    announce  {"cmd":"allowlist","op":"announce","epoch":E,"version":V}
+    off       {"cmd":"allowlist","op":"off"}
+epoch 为后端启动时间，重启后网关上的名单一律视为过期。网关在 gateway/{id}/info 中带上
+allowlist_epoch / allowlist_version，版本不符时后端补发增量（历史足够时）或完整名单。
+名单超出网关容量时网关转发全部广播并上报 allowlist_overflow（版本不再推进、增量不再应用），
+名单缩回容量（allowlist_capacity）以内后后端改发完整名单
+"""
+
+import re
+import threading
+import time
+from collections import deque
+from typing import Iterable, Optional
+
+MAC_RE = re.compile(r"^[0-9a-f]{12}$")
+
+
+class GatewayAllowlist:
+    def __init__(self, chunk: int = 96, history: int = 32, discovery_interval: float = 30.0):
+        self.chunk = chunk  # 每条消息最多携带的 MAC 数（网关 MQTT 缓冲区 2 KB）
+        self.discovery_interval = discovery_interval  # 网关转发名单外广播的最小间隔（秒），0 为不转发
+        self.epoch = int(time.time())
+        self.version = 0
+        self._macs: set[str] = set()
+        self._history: deque = deque(maxlen=history)  # (版本, 新增, 删除)
+        self._lock = threading.Lock()
+
+        self.full_sent = 0
+        self.deltas_sent = 0
+
+    def __len__(self) -> int:
+        return len(self._macs)
+
+    def reset(self, macs: Iterable[str]):
+        """整表重建（启动加载）；之后的增量从这里开始"""
+        with self._lock:
+            self._macs = {m for m in macs if MAC_RE.match(m)}
+            self.version += 1
+            self._history.clear()
+
+    def change(self, added: Iterable[str], removed: Iterable[str]) -> list[dict]:
+        """
+        产品映射变化后更新名单；返回应广播的消息（名单未变为空列表）。
+        变化超过一条消息的容量时改为广播完整名单
+        """
+        with self._lock:
+            add = sorted({m for m in added if MAC_RE.match(m)} - self._macs)
+            remove = sorted({m for m in removed if m in self._macs})
+            if not add and not remove:
+                return []
+            base = self.version
+            self._macs.update(add)
+            self._macs.difference_update(remove)
+            self.version += 1
+            self._history.append((self.version, add, remove))
+            if len(add) + len(remove) > self.chunk:
+                return self._full()
+            self.deltas_sent += 1
+            return [self._delta(base, add, remove)]
+
+    def catch_up(self, epoch, version, overflow: bool = False, capacity=None) -> list[dict]:
+        """
+        网关上报的名单版本 → 需要单播给它的消息（已是最新时为空列表）。
+        超出容量的网关不接受增量：名单放得下（或不知道容量）时发完整名单，否则保持现状
+        """
+        with self._lock:
+            if overflow:
+                if isinstance(capacity, int) and len(self._macs) > capacity:
+                    return []
+                return self._full()
+            if epoch == self.epoch and version == self.version:
+                return []
+            if epoch == self.epoch and isinstance(version, int) and self._history:
+                oldest = self._history[0][0] - 1
+                if oldest <= version < self.version:
+                    add: set[str] = set()
+                    remove: set[str] = set()
+                    for v, added, removed in self._history:
+                        if v <= version:
+                            continue
+                        add.update(added)
+                        remove.difference_update(added)
+                        remove.update(removed)
+                        add.difference_update(removed)
+                    if len(add) + len(remove) <= self.chunk:
+                        self.deltas_sent += 1
+                        return [self._delta(version, sorted(add), sorted(remove))]
+            return self._full()
+
+    def announce(self) -> dict:
+        """广播当前版本，版本不符的网关自行请求补发"""
+        return {"cmd": "allowlist", "op": "announce", "epoch": self.epoch, "version": self.version}
+
+    def _delta(self, base: int, add: list[str], remove: list[str]) -> dict:
+        return {
+            "cmd": "allowlist",
+            "op": "delta",
+            "epoch": self.epoch,
+            "base": base,
+            "version": self.version,
+            "add": "".join(add),
+            "remove": "".join(remove),
+        }
+
+    def _full(self) -> list[dict]:
+        macs = sorted(self._macs)
+        parts = max(1, -(-len(macs) // self.chunk))
+        self.full_sent += 1
+        return [
+            {
+                "cmd": "allowlist",
+                "op": "full",
+                "epoch": self.epoch,
+                "version": self.version,
+                "part": i,
+                "parts": parts,
+                "count": len(macs),
+                "discovery": self.discovery_interval,
+                "macs": "".join(macs[i * self.chunk:(i + 1) * self.chunk]),
+            }
+            for i in range(parts)
+        ]
+
+    def contains(self, mac: str) -> bool:
+        return mac in self._macs
+
+    def stats(self, gateways: Optional[dict] = None) -> dict:
+        with self._lock:
+            return {
+                "epoch": self.epoch,
+                "version": self.version,
+                "count": len(self._macs),
+                "chunk": self.chunk,
+                "discovery_interval": self.discovery_interval,
+                "full_bytes": len(self._macs) * 12,
+                "history": len(self._history),
+                "full_sent": self.full_sent,
+                "deltas_sent": self.deltas_sent,
+                "gateways": gateways or {},
+            }
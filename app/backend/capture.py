@@ -0,0 +1,115 @@
+"""
+MQTT 流量录制
+二进制格式：文件头 MAGIC，之后每条记录以类型字节开头
+- 0x01 主题定义: <H 长度> + UTF-8 主题；主题按出现顺序编号，同一主题只写一次
+- 0x02 消息: <d 接收时间><I 主题编号><I 载荷长度> + 载荷
+文件名以 .gz 结尾时用 gzip 压缩
+"""
+
+import gzip
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+MAGIC = b"SUACAP1\n"
+KIND_TOPIC = 1
+KIND_MESSAGE = 2
+
+_TOPIC = struct.Struct("<BH")
+_MESSAGE = struct.Struct("<BdII")
+_READ_CHUNK = 1 << 20
+
+
+def _open(path: Path, mode: str) -> BinaryIO:
+    if path.suffix == ".gz":
+        return gzip.open(path, mode, compresslevel=5)
+    return open(path, mode)
+
+
+class CaptureWriter:
+    """线程安全；写入带缓冲，关闭时落盘"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = _open(path, "wb")
+        self._file.write(MAGIC)
+        self._topics: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.messages = 0
+        self.bytes = len(MAGIC)
+
+    def record(self, topic: str, payload: bytes, ts: float = None):
+        if ts is None:
+            ts = time.time()
+        with self._lock:
+            if self._file is None:
+                return
+            topic_id = self._topics.get(topic)
+            if topic_id is None:
+                topic_id = self._topics[topic] = len(self._topics)
+                raw = topic.encode("utf-8")
+                self._file.write(_TOPIC.pack(KIND_TOPIC, len(raw)) + raw)
+                self.bytes += _TOPIC.size + len(raw)
+            self._file.write(_MESSAGE.pack(KIND_MESSAGE, ts, topic_id, len(payload)) + payload)
+            self.bytes += _MESSAGE.size + len(payload)
+            self.messages += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "started_at": self.started_at,
+            "messages": self.messages,
+            "topics": len(self._topics),
+            "bytes": self.bytes,
+        }
+
+
+def iter_capture(path: Path) -> Iterator[tuple[float, str, bytes]]:
+    """
+    按录制顺序返回 (接收时间, 主题, 载荷)；文件末尾不完整的记录（录制中断）直接忽略。
+    按块读入后用 unpack_from 就地解析，避免每条记录多次小 read
+    """
+    with _open(Path(path), "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        topics: list[str] = []
+        buf = b""
+        pos = 0
+        while True:
+            chunk = f.read(_READ_CHUNK)
+            if not chunk:
+                return
+            buf = buf[pos:] + chunk
+            pos = 0
+            end = len(buf)
+            while pos < end:
+                kind = buf[pos]
+                if kind == KIND_MESSAGE:
+                    if pos + _MESSAGE.size > end:
+                        break
+                    _, ts, topic_id, length = _MESSAGE.unpack_from(buf, pos)
+                    stop = pos + _MESSAGE.size + length
+                    if stop > end:
+                        break
+                    yield ts, topics[topic_id], buf[pos + _MESSAGE.size:stop]
+                elif kind == KIND_TOPIC:
+                    if pos + _TOPIC.size > end:
+                        break
+                    _, length = _TOPIC.unpack_from(buf, pos)
+                    stop = pos + _TOPIC.size + length
+                    if stop > end:
+                        break
+                    topics.append(buf[pos + _TOPIC.size:stop].decode("utf-8"))
+                else:
+                    raise ValueError(f"{path}: unknown record kind {kind}")
+                pos = stop
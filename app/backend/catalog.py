@@ -0,0 +1,106 @@
+"""
+产品映射的紧凑存储与流式加载
+- ProductRecord: 不可变 NamedTuple，字段与 ProductMapping 同名，内存约为 pydantic 模型的几分之一
+- iter_product_records: 边读边按批校验（TypedDict + TypeAdapter，一次调用校验一整批，不创建模型实例）
+"""
+
+import sys
+from typing import Annotated, Iterable, Iterator, NamedTuple, Optional, TypedDict
+
+from pydantic import Field, TypeAdapter, ValidationError
+
+
+class ProductRecord(NamedTuple):
+    mac: str
+    sku: str
+    name: str
+    video: str
+    screen: str
+    timeout_s: Optional[float] = None
+
+
+class ProductRow(TypedDict):
+    mac: str
+    sku: str
+    name: str
+    video: str
+    screen: str
+    timeout_s: Optional[Annotated[float, Field(ge=0.5, le=300)]]
+
+
+_rows_adapter = TypeAdapter(list[ProductRow])
+
+
+class ProductRowError(ValueError):
+    def __init__(self, line: int, message: str):
+        super().__init__(f"line {line}: {message}")
+        self.line = line
+        self.message = message
+
+
+def normalize_row(row: dict, default_video: str, default_screen: str) -> dict:
+    """CSV / 数据库行 → 待校验的 dict：MAC 统一小写去冒号，空超时视为未设置，补齐默认视频和屏幕"""
+    timeout_s = row.get("timeout_s")
+    if isinstance(timeout_s, str):
+        timeout_s = timeout_s.strip() or None
+    return {
+        "mac": str(row.get("mac") or "").strip().lower().replace(":", ""),
+        "sku": row.get("sku"),
+        "name": row.get("name"),
+        "video": (row.get("video") or "").strip() or default_video,
+        "screen": (row.get("screen") or "").strip() or default_screen,
+        "timeout_s": timeout_s,
+    }
+
+
+def iter_product_records(
+    rows: Iterable[dict],
+    default_video: str,
+    default_screen: str,
+    batch_size: int = 5000,
+) -> Iterator[ProductRecord]:
+    """流式加载；遇到无效行抛出 ProductRowError（行号按 CSV 计，表头为第 1 行）"""
+    batch: list[dict] = []
+    first_line = 2
+    for row in rows:
+        batch.append(normalize_row(row, default_video, default_screen))
+        if len(batch) >= batch_size:
+            yield from _validate_batch(batch, first_line)
+            first_line += len(batch)
+            batch = []
+    if batch:
+        yield from _validate_batch(batch, first_line)
+
+
+def _validate_batch(batch: list[dict], first_line: int) -> Iterator[ProductRecord]:
+    try:
+        validated = _rows_adapter.validate_python(batch)
+    except ValidationError as e:
+        err = e.errors()[0]
+        loc = err["loc"]
+        field = f"{loc[1]}: " if len(loc) > 1 else ""
+        raise ProductRowError(first_line + int(loc[0]), f"{field}{err['msg']}") from None
+
+    intern = sys.intern  # 视频和屏幕取值很少，所有记录共享同一字符串对象
+    for d in validated:
+        yield ProductRecord(
+            d["mac"],
+            d["sku"],
+            d["name"],
+            intern(d["video"]),
+            intern(d["screen"]),
+            d["timeout_s"],
+        )
+
+
+def records_footprint(records: dict) -> int:
+    """映射表大致占用的字节数（dict + 记录 + 各自独有的字符串，共享字符串只计一次）"""
+    size = sys.getsizeof(records)
+    shared: dict[int, int] = {}
+    for r in records.values():
+        size += sys.getsizeof(r) + sys.getsizeof(r.mac) + sys.getsizeof(r.sku) + sys.getsizeof(r.name)
+        shared[id(r.video)] = sys.getsizeof(r.video)
+        shared[id(r.screen)] = sys.getsizeof(r.screen)
+        if r.timeout_s is not None:
+            size += sys.getsizeof(r.timeout_s)
+    return size + sum(shared.values())
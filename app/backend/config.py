@@ -9,8 +9,36 @@ class Settings(BaseSettings):
 
     mqtt_broker: str = "localhost"
     mqtt_port: int = 1883
+    mqtt_transport: str = "paho"  # paho | memory（进程内 broker，压测/离线运行）
+    mqtt_subscribe_mode: str = "wildcard"  # wildcard（bthome/+/state）| per_mac（只订阅 product_map 中的 MAC）
+    mqtt_discovery_interval: float = 300.0  # per_mac：每隔多少秒临时订阅通配主题发现未映射传感器，0 为不发现
+    mqtt_discovery_window: float = 10.0  # per_mac：每次通配订阅保持的时间（秒）
     dedup_window: float = 2.0
     sensor_timeout: float = 5.0
+    fusion_window: float = 0.3  # 多网关重复上报合并窗口（秒），0 表示不合并
+    fusion_rssi_alpha: float = 0.3  # 每个网关 RSSI 指数平滑系数
+    fusion_hysteresis: float = 3.0  # 切换最佳网关所需的平滑 RSSI 优势（dB）
+    play_min_display: float = 1.0  # 同一屏幕两条播放指令的最小间隔（秒），期间只保留最新一条
+    play_qos: int = 0  # 播放指令 QoS，1 时跟踪 broker 确认
+    play_ack_timeout: float = 10.0  # QoS 1 指令超过该时间未确认计为超时（秒）
+    screen_ack_timeout: float = 5.0  # 播放指令发出后超过该时间屏幕未在 screen/{id}/status 确认，计为未确认（秒）
+    preload_enabled: bool = False  # 已映射传感器有动静时发布 screen/{id}/preload 预加载提示
+    preload_cache_size: int = 8  # 每个屏幕记住的已提示视频数（对应屏幕端缓存）
+    preload_ttl: float = 600.0  # 提示过的视频多久后允许再次提示（秒）
+    preload_min_interval: float = 2.0  # 同一屏幕两次提示的最小间隔（秒）
+    gateway_allowlist_enabled: bool = False  # 向网关下发 product_map 白名单，网关只转发已映射的传感器
+    gateway_allowlist_discovery: float = 30.0  # 网关转发名单外广播的最小间隔（秒），保持未映射传感器发现；0 为不转发
+    ingest_sensor_queue_size: int = 10000
+    ingest_gateway_queue_size: int = 1000
+    ingest_batch_size: int = 256
+    event_log_size: int = 100
+    journal_enabled: bool = True
+    journal_segment_bytes: int = 8 * 1024 * 1024
+    journal_max_segments: int = 0
+    gateways_flush_interval: float = 10.0
+    storage_backend: str = "file"  # file | sqlite
+    product_map_watch_interval: float = 2.0  # 0 表示不监视 product_map.csv
+    capture_file: str = ""  # 非空时启动即录制 MQTT 流量（相对路径位于 data/captures/）
     server_host: str = "0.0.0.0"
     server_port: int = 8080
     data_dir: Path = Path(__file__).parent / "data"
@@ -23,5 +51,17 @@ class Settings(BaseSettings):
     def gateways_file(self) -> Path:
         return self.data_dir / "gateways.json"
 
+    @property
+    def sqlite_file(self) -> Path:
+        return self.data_dir / "backend.db"
+
+    @property
+    def journal_dir(self) -> Path:
+        return self.data_dir / "journal"
+
+    @property
+    def capture_dir(self) -> Path:
+        return self.data_dir / "captures"
+
 
 settings = Settings()
@@ -0,0 +1,233 @@
+"""
+按屏幕调度播放指令
+- 最新优先合并：屏幕还在最短展示时间内时，新指令只替换该屏幕的待发指令，到期后只发最后一条
+- 发布在调度线程中进行，接入线程只做一次加锁赋值和一次截止时间登记，永不阻塞
+- 可选 QoS 1：跟踪 broker 尚未确认（in-flight）的指令，统计确认延迟与超时未确认数
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from latency import summarize_ms
+from scheduler import DeadlineScheduler, ReplayClock
+from transport import MQTTTransport
+
+
+class ScreenSlot:
+    __slots__ = (
+        "pending",
+        "pending_id",
+        "pending_since",
+        "last_sent_at",
+        "submitted",
+        "sent",
+        "coalesced",
+        "failed",
+        "acked",
+        "ack_timeouts",
+        "inflight",
+    )
+
+    def __init__(self):
+        self.pending = None  # 待发载荷，新指令直接覆盖
+        self.pending_id = ""
+        self.pending_since = 0.0
+        self.last_sent_at = float("-inf")
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0  # 被后来的指令覆盖、没有发出的指令数
+        self.failed = 0  # 发送时未连接或传输层拒绝
+        self.acked = 0
+        self.ack_timeouts = 0
+        self.inflight = 0
+
+
+class PlayDispatcher:
+    def __init__(
+        self,
+        min_display: float = 1.0,
+        qos: int = 0,
+        ack_timeout: float = 10.0,
+        window: int = 1000,
+    ):
+        self.min_display = min_display  # 同一屏幕两条播放指令的最小间隔（秒）
+        self.qos = qos
+        self.ack_timeout = ack_timeout
+        self.transport: Optional[MQTTTransport] = None
+        self.on_sent: Optional[Callable[[str, str, object], None]] = None  # (屏幕, cmd_id, 载荷)
+
+        self._slots: dict[str, ScreenSlot] = {}
+        self._lock = threading.Lock()
+        self._scheduler = DeadlineScheduler(self._flush, name="play-dispatch")
+        # QoS 1：消息 ID → (屏幕, 发送时间)
+        self._inflight: dict[int, tuple[str, float]] = {}
+        # 确认先于 publish_tracked 返回时暂存（消息 ID → 确认时间），只在 publish_tracked 调用期间记录
+        self._publishing = False
+        self._early_acks: dict[int, float] = {}
+        self._ack_latencies: deque = deque(maxlen=window)
+        self._hold_latencies: deque = deque(maxlen=window)
+
+    def attach(self, transport: MQTTTransport):
+        self.transport = transport
+        transport.on_published = self._on_published
+
+    def use_clock(self, clock: ReplayClock):
+        """回放时最短展示时间按录制时间计算（须在 start 之前调用）"""
+        self._scheduler.use_clock(clock)
+
+    def start(self):
+        self._scheduler.start()
+
+    def stop(self):
+        self._scheduler.stop()
+
+    def submit(self, screen: str, payload, cmd_id: str = "") -> bool:
+        """登记一条播放指令；返回 False 表示覆盖了该屏幕尚未发出的指令"""
+        now = self._scheduler.now()
+        with self._lock:
+            slot = self._slots.get(screen)
+            if slot is None:
+                slot = self._slots[screen] = ScreenSlot()
+            slot.submitted += 1
+            replaced = slot.pending is not None
+            if replaced:
+                slot.coalesced += 1
+            else:
+                slot.pending_since = now
+            slot.pending = payload
+            slot.pending_id = cmd_id
+            delay = max(0.0, slot.last_sent_at + self.min_display - now)
+        self._scheduler.schedule(screen, delay)
+        return not replaced
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for slot in self._slots.values() if slot.pending is not None)
+
+    def _flush(self, screen: str):
+        """调度线程：发出该屏幕最新的待发指令"""
+        now = self._scheduler.now()
+        with self._lock:
+            slot = self._slots.get(screen)
+            if slot is None or slot.pending is None:
+                return
+            payload, cmd_id, since = slot.pending, slot.pending_id, slot.pending_since
+            slot.pending = None
+            # 先占用展示时间，发送期间到达的新指令按本次发送时间排期
+            previous_sent_at, slot.last_sent_at = slot.last_sent_at, now
+
+        self._hold_latencies.append(now - since)
+        transport = self.transport
+        topic = f"screen/{screen}/play"
+        if transport is None or not transport.connected:
+            ok = False
+        elif self.qos:
+            with self._lock:
+                self._publishing = True
+            mid = None
+            try:
+                mid = transport.publish_tracked(topic, payload, qos=self.qos)
+            finally:
+                # broker 确认按真实时间计时，不受回放时钟影响
+                self._track(mid, screen, time.monotonic())
+            ok = mid is not None
+        else:
+            ok = transport.publish(topic, payload)
+
+        if ok and self.on_sent:
+            self.on_sent(screen, cmd_id, payload)
+        with self._lock:
+            if ok:
+                slot.sent += 1
+            else:
+                slot.failed += 1
+                if slot.last_sent_at == now:
+                    slot.last_sent_at = previous_sent_at
+        if self.qos:
+            self._expire_inflight(time.monotonic())
+
+    # ---------- QoS 1 in-flight 跟踪 ----------
+
+    def _track(self, mid: Optional[int], screen: str, sent_at: float):
+        """publish_tracked 返回后登记 in-flight；调用期间暂存的确认用完即弃（消息 ID 16 位会回绕，不能留到以后）"""
+        with self._lock:
+            self._publishing = False
+            early_acks, self._early_acks = self._early_acks, {}
+            if mid is None:
+                return
+            slot = self._slots[screen]
+            acked_at = early_acks.get(mid)
+            if acked_at is not None:
+                slot.acked += 1
+                self._ack_latencies.append(max(0.0, acked_at - sent_at))
+                return
+            self._inflight[mid] = (screen, sent_at)
+            slot.inflight += 1
+
+    def _on_published(self, mid: int):
+        """传输层线程：broker 确认"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._inflight.pop(mid, None)
+            if entry is None:
+                # 未登记的 ID：publish_tracked 调用期间可能是确认先于返回，其余时候是其它模块的发布，忽略
+                if self._publishing:
+                    self._early_acks[mid] = now
+                return
+            screen, sent_at = entry
+            slot = self._slots[screen]
+            slot.inflight -= 1
+            slot.acked += 1
+            self._ack_latencies.append(now - sent_at)
+
+    def _expire_inflight(self, now: float):
+        with self._lock:
+            expired = [
+                mid for mid, (_, sent_at) in self._inflight.items()
+                if now - sent_at > self.ack_timeout
+            ]
+            for mid in expired:
+                screen, _ = self._inflight.pop(mid)
+                slot = self._slots[screen]
+                slot.inflight -= 1
+                slot.ack_timeouts += 1
+
+    # ---------- 统计 ----------
+
+    def counts(self, field: str) -> dict[tuple[str], int]:
+        """按屏幕的计数，供监控指标使用"""
+        with self._lock:
+            return {(screen,): getattr(slot, field) for screen, slot in self._slots.items()}
+
+    def stats(self) -> dict:
+        if self.qos:
+            self._expire_inflight(time.monotonic())
+        with self._lock:
+            screens = {
+                screen: {
+                    "submitted": slot.submitted,
+                    "sent": slot.sent,
+                    "coalesced": slot.coalesced,
+                    "failed": slot.failed,
+                    "pending": slot.pending is not None,
+                    "inflight": slot.inflight,
+                    "acked": slot.acked,
+                    "ack_timeouts": slot.ack_timeouts,
+                }
+                for screen, slot in self._slots.items()
+            }
+        totals = {
+            key: sum(s[key] for s in screens.values())
+            for key in ("submitted", "sent", "coalesced", "failed", "inflight", "acked", "ack_timeouts")
+        }
+        return {
+            "min_display": self.min_display,
+            "qos": self.qos,
+            **totals,
+            "hold_ms": summarize_ms(list(self._hold_latencies)),
+            "ack_ms": summarize_ms(list(self._ack_latencies)),
+            "screens": screens,
+        }
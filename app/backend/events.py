@@ -0,0 +1,75 @@
+"""
+事件日志环形缓冲区
+固定容量、O(1) 追加，每条事件分配单调递增的序号，时间戳以原始浮点数保存，读取时再格式化
+"""
+
+import threading
+import time
+from datetime import datetime
+
+
+class EventRing:
+    def __init__(self, capacity: int = 100):
+        self.capacity = max(1, capacity)
+        self._slots: list[tuple | None] = [None] * self.capacity
+        self._last_seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def __len__(self) -> int:
+        return min(self._last_seq, self.capacity)
+
+    def resume_from(self, seq: int):
+        """从持久化记录恢复序号，保证重启后序号继续递增"""
+        with self._lock:
+            if seq > self._last_seq:
+                self._last_seq = seq
+
+    def append(
+        self, event_type: str, mac: str, details: dict, ts: float | None = None
+    ) -> tuple:
+        """追加事件，返回 (seq, ts, type, mac, details)"""
+        with self._lock:
+            if ts is None:
+                ts = time.time()
+            self._last_seq += 1
+            record = (self._last_seq, ts, event_type, mac, details)
+            self._slots[self._last_seq % self.capacity] = record
+        return record
+
+    def _records(self, after_seq: int, limit: int, newest_first: bool) -> list[tuple]:
+        with self._lock:
+            last = self._last_seq
+            first = max(after_seq + 1, last - self.capacity + 1, 1)
+            if newest_first:
+                seqs = range(last, max(first, last - limit + 1) - 1, -1)
+            else:
+                seqs = range(first, min(last, first + limit - 1) + 1)
+            records = [self._slots[seq % self.capacity] for seq in seqs]
+        return [r for r in records if r is not None]
+
+    def latest(self, limit: int = 50) -> list[dict]:
+        """最近 limit 条事件，新的在前"""
+        return [format_event(r) for r in self._records(0, limit, newest_first=True)]
+
+    def since(self, after_seq: int, limit: int = 50) -> list[dict]:
+        """
+        序号大于 after_seq 的最早 limit 条事件，按序号升序；
+        新事件多于 limit 条时，客户端以返回的最后一个序号作为下一次的 after_seq 继续取，不会跳过中间的事件
+        """
+        return [format_event(r) for r in self._records(after_seq, limit, newest_first=False)]
+
+
+def format_event(record: tuple) -> dict:
+    seq, ts, event_type, mac, details = record
+    return {
+        "seq": seq,
+        "ts": ts,
+        "time": datetime.fromtimestamp(ts).strftime("%H:%M:%S"),
+        "type": event_type,
+        "mac": mac,
+        **details,
+    }
@@ -0,0 +1,136 @@
+"""
+多网关上报融合
+同一传感器的一次广播会被覆盖范围重叠的每个 ESP32 网关各自转发成一条 bthome/{mac}/state。
+按 MAC 维护一个短融合窗口：窗口内来自其它网关的副本只用来更新该网关的 RSSI 平滑值，不再进入状态机。
+状态相反的迟到副本同样丢弃——窗口内只接受当前采用网关的状态变化，否则迟到的旧状态会造成一次假的放下/拿起并重播视频；
+每个 MAC 按 RSSI 指数平滑值选出信号最好的网关，带滞回，避免在信号相近的网关之间来回切换。
+只在传感器接入线程中调用，不加锁
+"""
+
+from typing import Optional
+
+
+class GatewayLink:
+    __slots__ = ("rssi_ema", "last_seen")
+
+    def __init__(self, rssi: float, now: float):
+        self.rssi_ema = float(rssi)
+        self.last_seen = now
+
+
+class FusionState:
+    __slots__ = ("motion", "accepted_at", "accepted_from", "links", "best")
+
+    def __init__(self):
+        self.motion: Optional[bool] = None
+        self.accepted_at = float("-inf")
+        self.accepted_from = ""
+        self.links: dict[str, GatewayLink] = {}
+        self.best = ""
+
+
+class SensorFusion:
+    def __init__(
+        self,
+        window: float = 0.3,
+        alpha: float = 0.3,
+        hysteresis: float = 3.0,
+        stale_after: float = 30.0,
+    ):
+        self.window = window  # 0 表示不合并副本，只跟踪最佳网关
+        self.alpha = alpha
+        self.hysteresis = hysteresis
+        self.stale_after = stale_after
+        self._states: dict[str, FusionState] = {}
+
+        self.reports = 0
+        self.suppressed = 0
+        self.conflicts = 0  # 被丢弃的副本中状态与已采用状态相反的数量
+        self.handovers = 0
+
+    def observe(
+        self, mac: str, gateway_id: str, rssi: Optional[float], motion: bool, now: float
+    ) -> Optional[FusionState]:
+        """
+        记录一条上报（rssi 为 None 时不更新信号）。返回 None 表示是窗口内其它网关的副本（无论状态是否相同），
+        调用方应丢弃；否则返回该 MAC 的融合状态（best 为当前最佳网关）
+        """
+        self.reports += 1
+        state = self._states.get(mac)
+        if state is None:
+            state = self._states[mac] = FusionState()
+
+        if rssi is not None:
+            link = state.links.get(gateway_id)
+            if link is None:
+                link = state.links[gateway_id] = GatewayLink(rssi, now)
+            else:
+                link.rssi_ema += self.alpha * (rssi - link.rssi_ema)
+                link.last_seen = now
+            self._select_best(state, gateway_id, link, now)
+        elif not state.best:
+            state.best = gateway_id
+
+        if gateway_id != state.accepted_from and now - state.accepted_at < self.window:
+            self.suppressed += 1
+            if motion != state.motion:
+                self.conflicts += 1
+            return None
+
+        state.motion = motion
+        state.accepted_at = now
+        state.accepted_from = gateway_id
+        return state
+
+    def _select_best(self, state: FusionState, gateway_id: str, link: GatewayLink, now: float):
+        if state.best == gateway_id:
+            return
+        best = state.links.get(state.best)
+        if best is not None and now - best.last_seen <= self.stale_after:
+            if link.rssi_ema < best.rssi_ema + self.hysteresis:
+                return
+        else:
+            # 当前最佳网关已失联：清理过期链路，在仍能听到的网关中重新选择
+            for gw, other in list(state.links.items()):
+                if now - other.last_seen > self.stale_after:
+                    del state.links[gw]
+            gateway_id = max(state.links, key=lambda gw: state.links[gw].rssi_ema)
+        if state.best:
+            self.handovers += 1
+        state.best = gateway_id
+
+    def best_rssi(self, state: FusionState) -> int:
+        link = state.links.get(state.best)
+        return round(link.rssi_ema) if link else 0
+
+    def links(self, mac: str) -> list[dict]:
+        state = self._states.get(mac)
+        if state is None:
+            return []
+        return sorted(
+            (
+                {
+                    "gateway_id": gw,
+                    "rssi_ema": round(link.rssi_ema, 1),
+                    "last_seen": link.last_seen,
+                    "best": gw == state.best,
+                }
+                for gw, link in list(state.links.items())
+            ),
+            key=lambda item: -item["rssi_ema"],
+        )
+
+    def stats(self) -> dict:
+        states = list(self._states.values())
+        return {
+            "window": self.window,
+            "alpha": self.alpha,
+            "hysteresis": self.hysteresis,
+            "reports": self.reports,
+            "suppressed": self.suppressed,
+            "conflicts": self.conflicts,
+            "saved_ratio": round(self.suppressed / self.reports, 4) if self.reports else 0.0,
+            "handovers": self.handovers,
+            "sensors": len(states),
+            "multi_gateway_sensors": sum(1 for s in states if len(s.links) > 1),
+        }
@@ -0,0 +1,164 @@
+"""
+MQTT 消息接入队列
+将 paho 网络线程与业务处理解耦：回调只负责入队，批处理线程负责解析与处理
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+Handler = Callable[[str, bytes, float, Optional[float]], None]
+
+
+class IngestLane:
+    """单条有界通道，满时丢弃最旧消息，不阻塞生产者"""
+
+    def __init__(
+        self,
+        name: str,
+        capacity: int,
+        handler: Handler,
+        batch_size: int = 256,
+    ):
+        self.name = name
+        self.capacity = capacity
+        self.handler = handler
+        self.batch_size = batch_size
+
+        self._queue: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+
+        # 统计计数
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.batches = 0
+        self.high_watermark = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def idle(self) -> bool:
+        """已入队的消息都处理完（或被丢弃），批处理线程没有正在处理的消息"""
+        return self.processed + self.dropped == self.enqueued
+
+    def put(self, topic: str, payload: bytes, ts: Optional[float] = None) -> bool:
+        """入队一条消息，返回 False 表示队列已满且丢弃了最旧消息；ts 为回放时的录制时间戳"""
+        with self._cond:
+            accepted = True
+            if len(self._queue) >= self.capacity:
+                self._queue.popleft()
+                self.dropped += 1
+                accepted = False
+            self._queue.append((topic, payload, time.monotonic(), ts))
+            self.enqueued += 1
+            depth = len(self._queue)
+            if depth > self.high_watermark:
+                self.high_watermark = depth
+            self._cond.notify()
+        return accepted
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._worker, name=f"ingest-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _take_batch(self) -> list[tuple[str, bytes, float, Optional[float]]]:
+        with self._cond:
+            while self._running and not self._queue:
+                self._cond.wait()
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popleft())
+            return batch
+
+    def _worker(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                if not self._running:
+                    return
+                continue
+
+            self.batches += 1
+            for topic, payload, enqueued_at, ts in batch:
+                try:
+                    self.handler(topic, payload, enqueued_at, ts)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"[接入] {self.name} 处理失败: {e}")
+                latency = time.monotonic() - enqueued_at
+                self.latency_sum += latency
+                if latency > self.latency_max:
+                    self.latency_max = latency
+                self.processed += 1
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "capacity": self.capacity,
+            "high_watermark": self.high_watermark,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "batches": self.batches,
+            "latency_avg_ms": (
+                round(self.latency_sum / self.processed * 1000, 3)
+                if self.processed
+                else 0.0
+            ),
+            "latency_max_ms": round(self.latency_max * 1000, 3),
+        }
+
+
+class IngestQueue:
+    """按 topic 分流的多通道接入队列，每条通道独立的批处理线程"""
+
+    def __init__(self):
+        self.lanes: dict[str, IngestLane] = {}
+
+    def add_lane(
+        self,
+        name: str,
+        capacity: int,
+        handler: Handler,
+        batch_size: int = 256,
+    ) -> IngestLane:
+        lane = IngestLane(name, capacity, handler, batch_size)
+        self.lanes[name] = lane
+        return lane
+
+    def put(self, lane: str, topic: str, payload: bytes, ts: Optional[float] = None) -> bool:
+        return self.lanes[lane].put(topic, payload, ts)
+
+    def start(self):
+        for lane in self.lanes.values():
+            lane.start()
+
+    def stop(self):
+        for lane in self.lanes.values():
+            lane.stop()
+
+    def stats(self) -> dict:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
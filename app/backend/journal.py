@@ -0,0 +1,351 @@
+"""
+事件日志持久化：分段追加写入的 JSON Lines 日志
+- 后台线程批量写入，add_event 不等待磁盘
+- 按大小滚动分段，每段附带稀疏的 (时间, 序号, 偏移) 索引
+- 查询时按索引定位起点，用 mmap 逐行流式读取，不把整个文件读入内存
+"""
+
+import bisect
+import json
+import mmap
+import struct
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+INDEX_ENTRY = struct.Struct("<dqQ")  # ts, seq, offset
+INDEX_STRIDE = 64
+SEGMENT_PREFIX = "events-"
+
+
+@dataclass
+class Segment:
+    path: Path
+    first_seq: int
+    # 稀疏索引，三列分开存放便于 bisect
+    index_ts: list[float] = field(default_factory=list)
+    index_seq: list[int] = field(default_factory=list)
+    index_offset: list[int] = field(default_factory=list)
+    last_ts: float = 0.0
+    last_seq: int = 0
+    size: int = 0
+    records: int = 0
+
+    @property
+    def index_path(self) -> Path:
+        return self.path.with_suffix(".idx")
+
+    @property
+    def first_ts(self) -> float:
+        return self.index_ts[0] if self.index_ts else self.last_ts
+
+
+def encode_record(record: tuple) -> bytes:
+    seq, ts, event_type, mac, details = record
+    line = json.dumps(
+        {"seq": seq, "ts": ts, "type": event_type, "mac": mac, **details},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return line.encode("utf-8") + b"\n"
+
+
+def line_ts(line: bytes) -> float:
+    """不解析整行 JSON，直接取出 ts 字段"""
+    start = line.index(b'"ts":') + 5
+    end = line.index(b",", start)
+    return float(line[start:end])
+
+
+def iter_lines(path: Path, offset: int = 0) -> Iterator[tuple[int, bytes]]:
+    """用 mmap 逐行读取，返回 (行起始偏移, 行内容)；末尾未写完的半行会被跳过"""
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # 空文件
+        with mm:
+            pos = offset
+            end = len(mm)
+            while pos < end:
+                nl = mm.find(b"\n", pos)
+                if nl < 0:
+                    return
+                yield pos, mm[pos:nl]
+                pos = nl + 1
+
+
+class EventJournal:
+    def __init__(
+        self,
+        directory: Path,
+        segment_bytes: int = 8 * 1024 * 1024,
+        max_segments: int = 0,
+        queue_size: int = 100000,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.queue_size = queue_size
+
+        self._segments: list[Segment] = []
+        self._lock = threading.Lock()
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+        self._file = None
+        self._index_file = None
+
+        self.written = 0
+        self.dropped = 0
+
+    # ---------- 启动与恢复 ----------
+    def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segments = []
+        for path in sorted(self.directory.glob(f"{SEGMENT_PREFIX}*.jsonl")):
+            try:
+                first_seq = int(path.stem[len(SEGMENT_PREFIX):])
+            except ValueError:
+                continue
+            segments.append(self._recover_segment(Segment(path, first_seq)))
+        with self._lock:
+            self._segments = [s for s in segments if s.records]
+        for s in segments:
+            if not s.records:
+                s.path.unlink(missing_ok=True)
+                s.index_path.unlink(missing_ok=True)
+
+        total = sum(s.records for s in self._segments)
+        print(f"[日志] 已加载 {len(self._segments)} 个分段，共 {total} 条事件")
+
+    def _recover_segment(self, seg: Segment) -> Segment:
+        """读取索引，并从最后一个索引点扫描到文件末尾补齐元数据；索引缺失时整段重建"""
+        seg.size = seg.path.stat().st_size
+        index_dirty = True
+        if seg.index_path.exists():
+            data = seg.index_path.read_bytes()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            index_dirty = usable != len(data)
+            for ts, seq, offset in INDEX_ENTRY.iter_unpack(data[:usable]):
+                if offset >= seg.size:
+                    index_dirty = True
+                    break
+                seg.index_ts.append(ts)
+                seg.index_seq.append(seq)
+                seg.index_offset.append(offset)
+
+        rebuild = not seg.index_offset
+        start = seg.index_offset[-1] if seg.index_offset else 0
+        count_since_index = 0
+        valid_end = start
+        for offset, line in iter_lines(seg.path, start):
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                break
+            if rebuild and count_since_index % INDEX_STRIDE == 0:
+                seg.index_ts.append(obj["ts"])
+                seg.index_seq.append(obj["seq"])
+                seg.index_offset.append(offset)
+            count_since_index += 1
+            seg.last_ts = obj["ts"]
+            seg.last_seq = obj["seq"]
+            valid_end = offset + len(line) + 1
+
+        if valid_end < seg.size:
+            # 截掉崩溃时写了一半的尾部
+            with open(seg.path, "r+b") as f:
+                f.truncate(valid_end)
+            seg.size = valid_end
+            if not rebuild:
+                # 尾部损坏时索引可能指向已截掉的位置，整段重建
+                seg.index_path.unlink(missing_ok=True)
+                return self._recover_segment(Segment(seg.path, seg.first_seq))
+            index_dirty = True
+
+        if rebuild:
+            seg.records = count_since_index
+        elif seg.index_offset:
+            # 索引每 INDEX_STRIDE 条一个点，续写时据此决定下一个索引点
+            seg.records = (len(seg.index_offset) - 1) * INDEX_STRIDE + count_since_index
+
+        if index_dirty and seg.records:
+            with open(seg.index_path, "wb") as f:
+                for entry in zip(seg.index_ts, seg.index_seq, seg.index_offset):
+                    f.write(INDEX_ENTRY.pack(*entry))
+        return seg
+
+    @property
+    def last_seq(self) -> int:
+        with self._lock:
+            return self._segments[-1].last_seq if self._segments else 0
+
+    # ---------- 写入 ----------
+    def append(self, record: tuple):
+        """非阻塞入队，由后台线程写盘"""
+        with self._cond:
+            if len(self._pending) >= self.queue_size:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(record)
+            self._cond.notify()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._writer, name="event-journal", daemon=True
+        )
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+        self._close_files()
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                batch = list(self._pending)
+                self._pending.clear()
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except OSError as e:
+                    print(f"[日志] 写入失败: {e}")
+            elif not self._running:
+                return
+
+    def _write_batch(self, batch: list[tuple]):
+        for record in batch:
+            seg = self._active_segment(record[0])
+            line = encode_record(record)
+            offset = seg.size
+            self._file.write(line)
+            seq, ts = record[0], record[1]
+            with self._lock:
+                if seg.records % INDEX_STRIDE == 0:
+                    seg.index_ts.append(ts)
+                    seg.index_seq.append(seq)
+                    seg.index_offset.append(offset)
+                    self._index_file.write(INDEX_ENTRY.pack(ts, seq, offset))
+                seg.size += len(line)
+                seg.records += 1
+                seg.last_ts = ts
+                seg.last_seq = seq
+            self.written += 1
+        self._file.flush()
+        self._index_file.flush()
+
+    def _active_segment(self, next_seq: int) -> Segment:
+        seg = self._segments[-1] if self._segments else None
+        if seg is None or seg.size >= self.segment_bytes:
+            self._close_files()
+            seg = Segment(
+                self.directory / f"{SEGMENT_PREFIX}{next_seq:012d}.jsonl", next_seq
+            )
+            with self._lock:
+                self._segments.append(seg)
+            self._prune()
+        if self._file is None:
+            self._file = open(seg.path, "ab")
+            self._index_file = open(seg.index_path, "ab")
+        return seg
+
+    def _prune(self):
+        if self.max_segments <= 0:
+            return
+        with self._lock:
+            expired = self._segments[: -self.max_segments]
+            self._segments = self._segments[-self.max_segments :]
+        for seg in expired:
+            seg.path.unlink(missing_ok=True)
+            seg.index_path.unlink(missing_ok=True)
+
+    def _close_files(self):
+        for f in (self._file, self._index_file):
+            if f:
+                f.close()
+        self._file = None
+        self._index_file = None
+
+    # ---------- 查询 ----------
+    def query(
+        self,
+        mac: Optional[str] = None,
+        sku: Optional[str] = None,
+        event_type: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[dict]:
+        """按条件流式返回事件（按时间升序）"""
+        with self._lock:
+            segments = [
+                s
+                for s in self._segments
+                if (since is None or s.last_ts >= since)
+                and (until is None or s.first_ts <= until)
+            ]
+            starts = {}
+            for s in segments:
+                start = 0
+                if since is not None and s.index_ts:
+                    i = bisect.bisect_left(s.index_ts, since) - 1
+                    start = s.index_offset[max(i, 0)]
+                starts[s.path] = start
+
+        # 先用字节匹配粗筛，命中后再解析 JSON
+        needles = []
+        if mac:
+            needles.append(f'"mac":"{mac}"'.encode())
+        if event_type:
+            needles.append(f'"type":"{event_type}"'.encode())
+        if sku:
+            needles.append(json.dumps(sku, ensure_ascii=False).encode("utf-8"))
+
+        count = 0
+        for seg in segments:
+            for _, line in iter_lines(seg.path, starts[seg.path]):
+                if since is not None or until is not None:
+                    ts = line_ts(line)
+                    if since is not None and ts < since:
+                        continue
+                    if until is not None and ts > until:
+                        # seq / ts 在 EventLog 的锁内分配，追加到日志却在锁外，并发写入时行序与时间序可能略有出入，不能据此提前结束
+                        continue
+                if needles and not all(n in line for n in needles):
+                    continue
+                obj = json.loads(line)
+                if mac and obj.get("mac") != mac:
+                    continue
+                if event_type and obj.get("type") != event_type:
+                    continue
+                if sku and obj.get("sku") != sku:
+                    continue
+                yield obj
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "bytes": sum(s.size for s in self._segments),
+                "last_seq": self._segments[-1].last_seq if self._segments else 0,
+                "written": self.written,
+                "dropped": self.dropped,
+                "pending": len(self._pending),
+            }
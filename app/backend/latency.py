@@ -0,0 +1,34 @@
+"""
+延迟样本汇总
+各模块保留最近 N 个延迟样本（秒），查询统计时用这里的函数换算成毫秒分位数；分位数按最近秩取样本值
+"""
+
+from typing import Iterable
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """已排序样本的 q 分位数（最近秩）"""
+    n = len(sorted_values)
+    return sorted_values[min(n - 1, max(0, int(round(q * n)) - 1))]
+
+
+def summarize_ms(
+    values: Iterable[float],
+    quantiles: tuple[float, ...] = (0.50, 0.90, 0.99),
+    digits: int = 3,
+    suffix: str = "",
+) -> dict:
+    """
+    样本（秒）→ {"count", "mean", "p50", "p90", "p99", "max"}（毫秒），无样本时返回空 dict。
+    分位数键名由 quantiles 生成（0.999 → p999），suffix 附加在除 count 外的键名后（如 "_ms"）
+    """
+    values = sorted(values)
+    if not values:
+        return {}
+    n = len(values)
+    result = {"count": n, f"mean{suffix}": round(sum(values) / n * 1000, digits)}
+    for q in quantiles:
+        key = "p" + f"{q * 100:g}".replace(".", "")
+        result[key + suffix] = round(percentile(values, q) * 1000, digits)
+    result[f"max{suffix}"] = round(values[-1] * 1000, digits)
+    return result
@@ -3,6 +3,8 @@ SeeedUA 智慧零售后端服务
 FastAPI + MQTT + 简单 Web 界面
 """
 
+import asyncio
+import io
 import json
 import csv
 import time
@@ -13,13 +15,33 @@ from typing import Optional
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel, Field
-import paho.mqtt.client as mqtt
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field, ValidationError
 
 from config import settings
+from capture import CaptureWriter
+from acks import AckTracker
+from allowlist import GatewayAllowlist
+from dispatcher import PlayDispatcher
+from catalog import ProductRecord, ProductRowError, iter_product_records, records_footprint
 from i18n import load_translations, get_translations, get_language_list
+from events import EventRing, format_event
+from fusion import SensorFusion
+from ingest import IngestQueue
+from metrics import MetricsRegistry
+from persistence import WriteBehind
+from preload import PreloadHints
+from profiler import CPROFILE_SORT_KEYS, StageProfiler, StageTrace
+from push import PushHub, RESYNC, encode_sse
+from scheduler import DeadlineScheduler, ReplayClock
+from sensor_table import SensorTable, UnmappedIndex
+from storage import create_storage
+from subscriptions import SubscriptionManager
+from transport import MQTTTransport, create_transport
+from versioning import StateVersions, etag_matches
+from watcher import FileWatcher
 
 
 # ============================================
@@ -48,6 +70,17 @@ class GatewayInfo(BaseModel):
     last_seen: str = ""
 
 
+class CaptureUpdate(BaseModel):
+    enabled: bool
+    path: Optional[str] = None  # data/captures/ 下的文件名，默认 capture-<时间>.cap；以 .gz 结尾则压缩
+
+
+class ProfileUpdate(BaseModel):
+    enabled: bool
+    cprofile_every: int = Field(default=0, ge=0)  # 每 N 条传感器消息用 cProfile 剖析一条，0 表示不剖析
+    reset: bool = False
+
+
 class AppConfigUpdate(BaseModel):
     dedup_window: Optional[float] = Field(default=None, ge=0.1, le=60)
     sensor_timeout: Optional[float] = Field(default=None, ge=0.5, le=300)
@@ -58,15 +91,40 @@ class AppConfigUpdate(BaseModel):
 # ============================================
 # 全局状态
 # ============================================
-product_map: dict[str, ProductMapping] = {}
+storage = create_storage(settings)
+product_map: dict[str, ProductRecord] = {}
 gateways: dict[str, GatewayInfo] = {}
-recent_triggers: dict[str, float] = {}
-sensor_states: dict[str, bool] = {}
-sensor_last_seen: dict[str, float] = {}
-sensor_meta: dict[str, dict] = {}
-event_log: list[dict] = []
-mqtt_client: Optional[mqtt.Client] = None
+dirty_gateways: set[str] = set()
+sensor_table = SensorTable()
+unmapped_index = UnmappedIndex()
+event_log = EventRing(settings.event_log_size)
+event_journal = None
+push_hub = PushHub()
+state_versions = StateVersions()
+mqtt_client: Optional[MQTTTransport] = None
 mqtt_connected = False
+ingest_queue = IngestQueue()
+play_dispatcher = PlayDispatcher(
+    settings.play_min_display, settings.play_qos, settings.play_ack_timeout
+)
+ack_tracker = AckTracker(settings.screen_ack_timeout)
+preload_hints = PreloadHints(
+    settings.preload_cache_size, settings.preload_ttl, settings.preload_min_interval
+)
+gateway_allowlist = GatewayAllowlist(discovery_interval=settings.gateway_allowlist_discovery)
+gateway_allowlist_reports: dict[str, tuple] = {}  # 网关 → 最近上报的 (epoch, version, overflow)
+mqtt_subscriptions = SubscriptionManager(
+    settings.mqtt_subscribe_mode == "per_mac",
+    discovery_interval=settings.mqtt_discovery_interval,
+    discovery_window=settings.mqtt_discovery_window,
+)
+sensor_fusion = SensorFusion(
+    settings.fusion_window, settings.fusion_rssi_alpha, settings.fusion_hysteresis
+)
+stage_profiler = StageProfiler()
+replay_clock: Optional[ReplayClock] = None  # 回放工具设置后，去重、超时与屏幕合并都按录制时间计算
+capture_writer: Optional[CaptureWriter] = None
+product_lock = threading.RLock()  # 串行化产品映射的修改（API、批量导入、热加载）
 ui_runtime_config = {
     "sku_poll_ms": 500,
     "status_poll_ms": 5000,
@@ -75,82 +133,219 @@ DEFAULT_VIDEO_FILE = "demo_default.mp4"
 DEFAULT_SCREEN_ID = "screen-01"
 
 
+# ============================================
+# 监控指标
+# ============================================
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0,
+)
+DELIVERY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0)
+
+metrics = MetricsRegistry("seeedua")
+m_messages = metrics.counter("mqtt_messages_total", "收到的 MQTT 消息数（按 topic 类别）", ["family"])
+m_parse_errors = metrics.counter("mqtt_parse_errors_total", "无法解析的 MQTT 消息数", ["family", "reason"])
+m_handle_seconds = metrics.histogram("sensor_handle_seconds", "单条传感器消息处理耗时（秒）", LATENCY_BUCKETS)
+m_queue_wait_seconds = metrics.histogram("ingest_queue_wait_seconds", "消息从入队到开始处理的等待时间（秒）", LATENCY_BUCKETS)
+m_screen_ack_seconds = metrics.histogram("screen_ack_seconds", "播放指令从发出到屏幕确认的延迟（秒）", DELIVERY_BUCKETS)
+m_screen_acks = metrics.counter("screen_acks_total", "收到的屏幕播放确认数（按结果）", ["result"])
+m_allowlist_messages = metrics.counter("gateway_allowlist_messages_total", "发布的网关白名单消息数（按类型）", ["op"])
+m_dedup_suppressed = metrics.counter("dedup_suppressed_total", "去重窗口内被抑制的触发次数")
+m_unknown_mac = metrics.counter("unknown_mac_total", "未映射 MAC 的提起次数")
+m_timeouts = metrics.counter("sensor_timeouts_total", "超时判定为放下的次数")
+m_connects = metrics.counter("mqtt_connects_total", "MQTT 连接成功次数")
+m_disconnects = metrics.counter("mqtt_disconnects_total", "MQTT 断开次数")
+metrics.gauge("mqtt_connected", "MQTT 是否已连接", lambda: int(mqtt_connected))
+metrics.gauge("sensors_tracked", "当前跟踪的传感器数", lambda: len(sensor_table))
+metrics.gauge("sensors_unmapped", "未映射的传感器数", lambda: len(unmapped_index))
+metrics.gauge("gateways_tracked", "已知网关数", lambda: len(gateways))
+metrics.gauge("products", "产品映射数", lambda: len(product_map))
+metrics.gauge(
+    "ingest_queue_depth", "接入队列当前积压",
+    lambda: {(name,): lane.depth for name, lane in ingest_queue.lanes.items()}, ["lane"],
+)
+metrics.gauge(
+    "ingest_dropped_total", "接入队列满时丢弃的消息数",
+    lambda: {(name,): lane.dropped for name, lane in ingest_queue.lanes.items()}, ["lane"],
+    kind="counter",
+)
+metrics.gauge(
+    "play_published_total", "发布到屏幕的播放指令数",
+    lambda: play_dispatcher.counts("sent"), ["screen"], kind="counter",
+)
+metrics.gauge(
+    "play_coalesced_total", "最短展示时间内被同屏幕新指令覆盖的播放指令数",
+    lambda: play_dispatcher.counts("coalesced"), ["screen"], kind="counter",
+)
+metrics.gauge(
+    "play_failed_total", "发送时 MQTT 未连接或发布失败的播放指令数",
+    lambda: play_dispatcher.counts("failed"), ["screen"], kind="counter",
+)
+metrics.gauge(
+    "play_inflight", "QoS 1 已发出、broker 尚未确认的播放指令数",
+    lambda: play_dispatcher.counts("inflight"), ["screen"],
+)
+metrics.gauge(
+    "play_acked_total", "屏幕已确认开始播放的播放指令数",
+    lambda: ack_tracker.counts("acked"), ["screen"], kind="counter",
+)
+metrics.gauge(
+    "play_unacked_total", "超时仍未得到屏幕确认的播放指令数",
+    lambda: ack_tracker.counts("expired"), ["screen"], kind="counter",
+)
+metrics.gauge("play_awaiting_ack", "已发出、等待屏幕确认的播放指令数", lambda: ack_tracker.pending)
+metrics.gauge(
+    "preload_hints_total", "发布的预加载提示数",
+    lambda: preload_hints.counts("hinted"), ["screen"], kind="counter",
+)
+metrics.gauge(
+    "preload_hits_total", "预加载提示后该视频被播放的次数",
+    lambda: preload_hints.counts("hits"), ["screen"], kind="counter",
+)
+metrics.gauge(
+    "preload_throttled_total", "因同屏幕提示间隔过短而跳过的预加载提示数",
+    lambda: preload_hints.counts("throttled"), ["screen"], kind="counter",
+)
+metrics.gauge("mqtt_sensor_subscriptions", "per_mac 模式下已订阅的传感器主题数", lambda: mqtt_subscriptions.subscribed)
+metrics.gauge("mqtt_discovery_active", "通配发现订阅是否打开", lambda: int(mqtt_subscriptions.discovery_active))
+metrics.gauge(
+    "mqtt_subscription_packets_total", "按批发送的 SUBSCRIBE / UNSUBSCRIBE 报文数",
+    lambda: {
+        ("subscribe",): mqtt_subscriptions.subscribe_packets,
+        ("unsubscribe",): mqtt_subscriptions.unsubscribe_packets,
+    },
+    ["type"], kind="counter",
+)
+metrics.gauge("gateway_allowlist_version", "网关白名单版本", lambda: gateway_allowlist.version)
+metrics.gauge("gateway_allowlist_size", "网关白名单中的 MAC 数", lambda: len(gateway_allowlist))
+metrics.gauge(
+    "gateway_allowlist_in_sync", "白名单版本与后端一致的网关数",
+    lambda: sum(
+        1 for report in list(gateway_allowlist_reports.values())
+        if report == (gateway_allowlist.epoch, gateway_allowlist.version, False)
+    ),
+)
+metrics.gauge(
+    "fusion_suppressed_total", "融合窗口内被合并的其它网关重复上报数",
+    lambda: sensor_fusion.suppressed, kind="counter",
+)
+metrics.gauge(
+    "fusion_handovers_total", "传感器最佳网关切换次数",
+    lambda: sensor_fusion.handovers, kind="counter",
+)
+
+
 # ============================================
 # 数据持久化
 # ============================================
+def open_storage():
+    """打开存储后端（STORAGE_BACKEND=file | sqlite）"""
+    storage.open()
+    print(f"[存储] 使用 {storage.name} 后端")
+
+
+def to_record(product: ProductMapping) -> ProductRecord:
+    """API 提交的模型 → 映射表中的紧凑记录"""
+    apply_demo_defaults(product)
+    return ProductRecord(
+        product.mac, product.sku, product.name, product.video, product.screen, product.timeout_s
+    )
+
+
 def load_product_map():
-    """从 CSV 加载产品映射表"""
+    """从存储后端流式加载产品映射表（按批校验，记录为紧凑的 ProductRecord）"""
     global product_map
-    product_map = {}
+    started = time.perf_counter()
+    product_map = {
+        r.mac: r
+        for r in iter_product_records(
+            storage.load_products(), DEFAULT_VIDEO_FILE, DEFAULT_SCREEN_ID
+        )
+    }
+    gateway_allowlist.reset(product_map)
+    mqtt_subscriptions.reset(product_map)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(
+        f"[映射表] 已加载 {len(product_map)} 个产品，耗时 {elapsed_ms:.0f} ms，"
+        f"约 {records_footprint(product_map) / 1024:.0f} KB"
+    )
 
-    if not settings.product_map_file.exists():
-        return
 
-    with open(settings.product_map_file, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            mac = row["mac"].lower().replace(":", "")
-            timeout_raw = (row.get("timeout_s") or "").strip()
-            timeout_s = float(timeout_raw) if timeout_raw else None
-            video = (row.get("video") or "").strip() or DEFAULT_VIDEO_FILE
-            screen = (row.get("screen") or "").strip() or DEFAULT_SCREEN_ID
-            product_map[mac] = ProductMapping(
-                mac=mac,
-                sku=row["sku"],
-                name=row["name"],
-                video=video,
-                screen=screen,
-                timeout_s=timeout_s,
+def reload_product_map():
+    """product_map.csv 被外部修改后重新解析，只应用新增、删除和变化的行"""
+    try:
+        new_map = {
+            r.mac: r
+            for r in iter_product_records(
+                storage.load_products(), DEFAULT_VIDEO_FILE, DEFAULT_SCREEN_ID
             )
-    print(f"[映射表] 已加载 {len(product_map)} 个产品")
+        }
+    except ProductRowError as e:
+        # 任意一行无效就放弃整次重载，避免把半截文件当成"删除了大量产品"
+        print(f"[热加载] product_map.csv 第 {e.line} 行无效，忽略本次修改: {e.message}")
+        return
 
+    with product_lock:
+        added = [p for mac, p in new_map.items() if mac not in product_map]
+        changed = [
+            p for mac, p in new_map.items()
+            if mac in product_map and product_map[mac] != p
+        ]
+        removed = [mac for mac in product_map if mac not in new_map]
+        if added or changed or removed:
+            apply_product_changes(added + changed, removed, save=False)
+
+    print(
+        f"[热加载] product_map.csv: 新增 {len(added)}，修改 {len(changed)}，"
+        f"删除 {len(removed)}，共 {len(product_map)} 个产品"
+    )
 
-def save_product_map():
-    """保存产品映射表到 CSV"""
-    settings.data_dir.mkdir(exist_ok=True)
 
-    with open(settings.product_map_file, "w", encoding="utf-8", newline="") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=["mac", "sku", "name", "video", "screen", "timeout_s"],
-        )
-        writer.writeheader()
-        for p in product_map.values():
-            writer.writerow(
-                {
-                    "mac": p.mac,
-                    "sku": p.sku,
-                    "name": p.name,
-                    "video": p.video,
-                    "screen": p.screen,
-                    "timeout_s": "" if p.timeout_s is None else p.timeout_s,
-                }
-            )
+def save_product_map(
+    upserts: Optional[list[ProductRecord]] = None,
+    removals: Optional[list[str]] = None,
+):
+    """保存产品映射表；文件后端整表原子重写，SQLite 后端只 upsert/删除变化的行"""
+    storage.save_products(product_map, upserts, removals)
+    product_watcher.remember()
     print(f"[映射表] 已保存 {len(product_map)} 个产品")
 
 
+product_watcher = FileWatcher(
+    "product_map",
+    storage.products_signature,
+    reload_product_map,
+    settings.product_map_watch_interval,
+)
+
+
+def start_product_watcher():
+    """文件后端下监视 product_map.csv，外部工具修改后无需重启即可生效"""
+    if settings.product_map_watch_interval <= 0 or storage.products_signature() is None:
+        return
+    product_watcher.start()
+    print(f"[热加载] 监视 product_map.csv（间隔 {settings.product_map_watch_interval}s）")
+
+
 def load_gateways():
     """加载网关信息"""
     global gateways
     gateways = {}
 
-    if not settings.gateways_file.exists():
-        return
-
-    with open(settings.gateways_file, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        for gw_id, info in data.items():
-            gateways[gw_id] = GatewayInfo(**info)
+    for gw_id, info in storage.load_gateways().items():
+        gateways[gw_id] = GatewayInfo(**info)
     print(f"[网关] 已加载 {len(gateways)} 个网关")
 
 
 def save_gateways():
-    """保存网关信息"""
-    settings.data_dir.mkdir(exist_ok=True)
+    """保存网关信息；SQLite 后端只写有变化的网关"""
+    changed = list(dirty_gateways)
+    dirty_gateways.difference_update(changed)
+    storage.save_gateways(gateways, changed)
+
 
-    with open(settings.gateways_file, "w", encoding="utf-8") as f:
-        data = {gw_id: gw.model_dump() for gw_id, gw in gateways.items()}
-        json.dump(data, f, indent=2, ensure_ascii=False)
+# 心跳只标记脏，由后台线程按间隔合并写盘；新网关和标签修改立即写盘
+gateways_writer = WriteBehind("gateways", save_gateways, settings.gateways_flush_interval)
 
 
 def get_app_config() -> dict:
@@ -164,13 +359,10 @@ def get_app_config() -> dict:
 
 def load_app_config():
     """加载运行时配置（覆盖默认设置）"""
-    config_file = settings.data_dir / "app_config.json"
-    if not config_file.exists():
-        return
-
     try:
-        with open(config_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        data = storage.load_config()
+        if not data:
+            return
 
         dedup_window = data.get("dedup_window")
         sensor_timeout = data.get("sensor_timeout")
@@ -193,25 +385,58 @@ def load_app_config():
 
 def save_app_config():
     """保存运行时配置"""
-    settings.data_dir.mkdir(exist_ok=True)
-    config_file = settings.data_dir / "app_config.json"
-
-    with open(config_file, "w", encoding="utf-8") as f:
-        json.dump(get_app_config(), f, indent=2, ensure_ascii=False)
+    storage.save_config(get_app_config())
 
 
 def add_event(event_type: str, mac: str, details: dict):
-    """添加事件日志"""
-    event = {
-        "time": datetime.now().strftime("%H:%M:%S"),
-        "type": event_type,
-        "mac": mac,
-        **details,
+    """添加事件日志（环形缓冲区，容量由 EVENT_LOG_SIZE 配置），并异步写入持久化日志"""
+    record = event_log.append(event_type, mac, details)
+    if event_journal:
+        event_journal.append(record)
+    if push_hub.active:
+        push_hub.publish("event", format_event(record))
+
+
+def start_event_journal():
+    """打开持久化事件日志，并让内存事件序号接续上次运行"""
+    global event_journal
+    if not settings.journal_enabled:
+        return
+    event_journal = storage.open_event_store(settings)
+    event_journal.open()
+    event_log.resume_from(event_journal.last_seq)
+    event_journal.start()
+
+
+def sensor_timeout_for(product: Optional[ProductRecord]) -> float:
+    """产品级超时优先，否则使用全局超时"""
+    if product and product.timeout_s is not None:
+        return product.timeout_s
+    return settings.sensor_timeout
+
+
+def sku_state(record) -> dict:
+    """单个传感器在看板上的状态"""
+    product = product_map.get(record.mac)
+    return {
+        "mac": record.mac,
+        "sku": product.sku if product else "",
+        "name": product.name if product else "",
+        "active": record.motion,
+        "last_seen": record.last_seen,
+        "timeout_s": sensor_timeout_for(product),
+        "gateway_id": record.gateway_id,
+        "rssi": record.rssi,
     }
-    event_log.insert(0, event)
-    # 只保留最近 100 条
-    if len(event_log) > 100:
-        event_log.pop()
+
+
+def push_sku_state(mac: str):
+    """向看板推送单个传感器的状态增量"""
+    if not push_hub.active:
+        return
+    record = sensor_table.get(mac)
+    if record:
+        push_hub.publish("sku", sku_state(record))
 
 
 def apply_demo_defaults(product: ProductMapping):
@@ -219,64 +444,209 @@ def apply_demo_defaults(product: ProductMapping):
     product.screen = (product.screen or "").strip() or DEFAULT_SCREEN_ID
 
 
+def apply_product_changes(
+    upserts: list[ProductRecord], removals: list[str], save: bool = True
+):
+    """修改产品映射表并同步所有派生状态（超时、未映射索引、版本号、推送）"""
+    with product_lock:
+        for product in upserts:
+            product_map[product.mac] = product
+            unmapped_index.discard(product.mac)
+
+        restored = []
+        for mac in removals:
+            if product_map.pop(mac, None) is None:
+                continue
+            record = sensor_table.get(mac)
+            if record:
+                restored.append(record)
+        unmapped_index.restore(restored)
+
+        removed = [m for m in removals if m not in product_map]
+        if save:
+            save_product_map(upserts, removed)
+        state_versions.bump("products", "sku-states")
+        allowlist_msgs = gateway_allowlist.change([p.mac for p in upserts], removed)
+        mqtt_subscriptions.change([p.mac for p in upserts], removed)
+
+    if settings.gateway_allowlist_enabled:
+        publish_allowlist("all", allowlist_msgs)
+
+    for mac in [p.mac for p in upserts] + removals:
+        rearm_sensor_timeout(mac)
+        push_sku_state(mac)
+
+
 # ============================================
 # MQTT 处理
 # ============================================
-def on_mqtt_connect(client, userdata, flags, reason_code, properties):
+def on_mqtt_connect():
     global mqtt_connected
-    if reason_code == 0:
-        mqtt_connected = True
-        print(f"[MQTT] 已连接到 {settings.mqtt_broker}:{settings.mqtt_port}")
-        client.subscribe("bthome/+/state")
-        client.subscribe("gateway/+/info")
+    mqtt_connected = True
+    m_connects.inc()
+    print(f"[MQTT] 已连接到 {mqtt_client.endpoint}")
+    if mqtt_subscriptions.enabled:
+        mqtt_subscriptions.on_connect()
+    else:
+        mqtt_client.subscribe("bthome/+/state")
+    mqtt_client.subscribe("gateway/+/info")
+    mqtt_client.subscribe("screen/+/status")
+    # 让网关核对白名单版本；未启用时通知网关停止过滤
+    if settings.gateway_allowlist_enabled:
+        publish_allowlist("all", [gateway_allowlist.announce()])
     else:
-        mqtt_connected = False
-        print(f"[MQTT] 连接失败, rc={reason_code}")
+        publish_allowlist("all", [{"cmd": "allowlist", "op": "off"}])
 
 
-def on_mqtt_disconnect(client, userdata, disconnect_flags, reason_code, properties):
+def on_mqtt_disconnect():
     global mqtt_connected
     mqtt_connected = False
+    m_disconnects.inc()
     print(f"[MQTT] 已断开")
 
 
-def on_mqtt_message(client, userdata, msg):
+def on_mqtt_message(msg, ts: Optional[float] = None):
+    """传输层线程回调：只做分流入队，解析与处理交给接入队列的批处理线程；ts 为回放时的录制时间戳"""
     topic = msg.topic
+    writer = capture_writer
+
+    if topic.startswith("bthome/"):
+        m_messages.inc("bthome")
+        if writer:
+            writer.record(topic, msg.payload)
+        ingest_queue.put("sensor", topic, msg.payload, ts)
+    elif topic.startswith("gateway/"):
+        m_messages.inc("gateway")
+        if writer:
+            writer.record(topic, msg.payload)
+        ingest_queue.put("gateway", topic, msg.payload, ts)
+    elif topic.startswith("screen/"):
+        # 屏幕确认量小，与网关消息共用通道
+        m_messages.inc("screen")
+        ingest_queue.put("gateway", topic, msg.payload, ts)
+    else:
+        m_messages.inc("other")
+
+
+def process_message(
+    topic: str, raw_payload: bytes, enqueued_at: float = 0.0, ts: Optional[float] = None
+):
+    """解析并分发一条 MQTT 消息（在接入队列线程中执行）"""
+    started = time.monotonic()
+    if enqueued_at:
+        m_queue_wait_seconds.observe(started - enqueued_at)
+    family = topic.split("/", 1)[0]
+    trace = stage_profiler.start() if stage_profiler.enabled else None
 
     try:
-        payload = json.loads(msg.payload)
-    except:
+        payload = json.loads(raw_payload)
+    except ValueError:
+        m_parse_errors.inc(family, "json")
         return
 
-    if topic.startswith("bthome/"):
-        handle_sensor_event(topic, payload)
-    elif topic.startswith("gateway/"):
+    if not isinstance(payload, dict):
+        m_parse_errors.inc(family, "not_object")
+        return
+
+    if family == "bthome":
+        clock = replay_clock
+        if clock is not None and ts is not None:
+            # 只由传感器通道推进回放时钟：到期的超时和待发播放指令按录制时间先于本条消息执行
+            clock.advance(ts)
+        if trace:
+            if enqueued_at:
+                stage_profiler.record("queue_wait", started - enqueued_at)
+            trace.lap("decode")
+            stage_profiler.sampled(handle_sensor_event, topic, payload, trace, ts)
+            trace.finish()
+        else:
+            handle_sensor_event(topic, payload, None, ts)
+        m_handle_seconds.observe(time.monotonic() - started)
+    elif family == "screen":
+        handle_screen_status(topic, payload, enqueued_at or started)
+    else:
         handle_gateway_event(topic, payload)
 
 
-def handle_sensor_event(topic: str, payload: dict):
-    """处理传感器事件"""
+def start_ingest():
+    """启动 MQTT 接入队列（传感器与网关分通道，互不阻塞）"""
+    if not ingest_queue.lanes:
+        ingest_queue.add_lane(
+            "sensor",
+            settings.ingest_sensor_queue_size,
+            process_message,
+            settings.ingest_batch_size,
+        )
+        ingest_queue.add_lane(
+            "gateway",
+            settings.ingest_gateway_queue_size,
+            process_message,
+            settings.ingest_batch_size,
+        )
+    ingest_queue.start()
+
+
+def handle_sensor_event(
+    topic: str, payload: dict, trace: Optional[StageTrace] = None, now: Optional[float] = None
+):
+    """处理传感器事件；trace 不为 None 时记录各阶段耗时，now 为回放时的录制时间戳（默认当前时间）"""
     parts = topic.split("/")
     if len(parts) != 3:
         return
 
     mac = parts[1].lower()
     motion = payload.get("motion", False)
-    rssi = payload.get("rssi", 0)
+    rssi = payload.get("rssi")
     gateway_id = payload.get("gateway_id", "unknown")
 
-    sensor_meta[mac] = {
-        "gateway_id": gateway_id,
-        "rssi": rssi,
-        "motion": motion,
-        "updated_at": time.time(),
-    }
+    if not isinstance(rssi, (int, float)):
+        rssi = None  # 缺失或格式错误的 RSSI 不参与最佳网关选择
+
+    if now is None:
+        now = time.time()
+    fused = sensor_fusion.observe(mac, gateway_id, rssi, motion, now)
+    if fused is None:
+        return
+    # 状态与事件中记录信号最好的网关及其平滑 RSSI
+    gateway_id = fused.best
+    rssi = sensor_fusion.best_rssi(fused)
+    if trace:
+        trace.lap("fusion")
+
+    record = sensor_table.get(mac)
+    if record is None:
+        record = sensor_table.add(mac)
+        prev_state = None
+    else:
+        prev_state = record.motion
+
+    record.gateway_id = sensor_table.intern_gateway(gateway_id)
+    record.rssi = rssi
+    record.motion = motion
+    record.updated_at = now
 
     if motion:
-        sensor_last_seen[mac] = time.time()
+        record.last_seen = now
+        timeout_scheduler.schedule(
+            record.mac, sensor_timeout_for(product_map.get(mac))
+        )
+    else:
+        timeout_scheduler.cancel(mac)
 
-    prev_state = sensor_states.get(mac)
-    sensor_states[mac] = motion
+    if mac not in product_map:
+        unmapped_index.touch(record)
+
+    state_versions.bump("sku-states")
+    if motion or prev_state != motion:
+        push_sku_state(record.mac)
+    if trace:
+        trace.lap("state")
+
+    # 传感器固件只广播 motion=true，放下由超时判定：首次上报时提示一次，超时放下时再提示（on_sensor_timeout）
+    if settings.preload_enabled and (prev_state is None or not motion):
+        send_preload_hint(mac)
+        if trace:
+            trace.lap("preload")
 
     if prev_state == motion:
         return
@@ -291,24 +661,37 @@ def handle_sensor_event(topic: str, payload: dict):
             mac,
             {"sku": sku, "name": name, "rssi": rssi, "gateway_id": gateway_id},
         )
+        if trace:
+            trace.lap("event")
         print(f"[提起] {sku or mac}")
+        if trace:
+            trace.lap("log")
     else:
         add_event(
             "put_down",
             mac,
             {"sku": sku, "name": name, "rssi": rssi, "gateway_id": gateway_id},
         )
+        if trace:
+            trace.lap("event")
         print(f"[放下] {sku or mac}")
+        if trace:
+            trace.lap("log")
         return
 
-    now = time.time()
-    if now - recent_triggers.get(mac, 0) < settings.dedup_window:
+    if now - record.last_trigger < settings.dedup_window:
+        m_dedup_suppressed.inc()
         return
-    recent_triggers[mac] = now
+    record.last_trigger = now
 
     if not product:
+        m_unknown_mac.inc()
         add_event("unknown", mac, {"gateway_id": gateway_id})
+        if trace:
+            trace.lap("event")
         print(f"[传感器] 未知 MAC: {mac}")
+        if trace:
+            trace.lap("log")
         return
 
     add_event(
@@ -321,13 +704,73 @@ def handle_sensor_event(topic: str, payload: dict):
             "screen": product.screen,
         },
     )
+    if trace:
+        trace.lap("event")
     print(f"[播放] {product.sku} → {product.screen}")
+    if trace:
+        trace.lap("log")
 
-    if mqtt_client and mqtt_connected:
-        play_msg = json.dumps(
-            {"video": product.video, "sku": product.sku, "name": product.name}
+    cmd_id = ack_tracker.next_id()
+    play_msg = json.dumps(
+        {"video": product.video, "sku": product.sku, "name": product.name, "cmd_id": cmd_id}
+    )
+    play_dispatcher.submit(product.screen, play_msg, cmd_id)
+    if trace:
+        trace.lap("publish")
+
+
+def on_play_sent(screen: str, cmd_id: str, payload):
+    """播放指令实际发出（调度线程）：开始等待屏幕确认；预加载命中只统计发出的指令，被合并掉的不算"""
+    ack_tracker.sent(screen, cmd_id, payload)
+    if settings.preload_enabled:
+        try:
+            video = json.loads(payload).get("video")
+        except (ValueError, AttributeError):
+            return
+        if video:
+            preload_hints.played(screen, video)
+
+
+play_dispatcher.on_sent = on_play_sent
+
+
+def send_preload_hint(mac: str):
+    """已映射传感器有动静时提示其屏幕预加载视频；屏幕 LRU 中已提示过的不重复发送"""
+    product = product_map.get(mac)
+    if not product or not (mqtt_client and mqtt_connected):
+        return
+    if preload_hints.should_hint(product.screen, product.video):
+        mqtt_client.publish(
+            f"screen/{product.screen}/preload",
+            json.dumps({"video": product.video, "sku": product.sku}),
         )
-        mqtt_client.publish(f"screen/{product.screen}/play", play_msg)
+
+
+def handle_screen_status(topic: str, payload: dict, received_at: float):
+    """处理屏幕确认 screen/{id}/status：按 cmd_id 关联播放指令，记录送达延迟"""
+    parts = topic.split("/")
+    cmd_id = payload.get("cmd_id")
+    if len(parts) != 3 or parts[2] != "status" or not isinstance(cmd_id, str):
+        return
+    status = str(payload.get("status", "playing"))
+    latency = ack_tracker.ack(parts[1], cmd_id, status, received_at)
+    if latency is None:
+        m_screen_acks.inc("unmatched")
+        return
+    m_screen_acks.inc("error" if status == "error" else "ok")
+    m_screen_ack_seconds.observe(latency)
+    if status == "error":
+        print(f"[屏幕] {parts[1]} 播放失败: {payload.get('video', '')}")
+
+
+def publish_allowlist(gateway_id: str, messages: list[dict]):
+    """发布白名单消息到 gateway/{id}/cmd（gateway_id 为 all 时广播给所有网关）"""
+    if not messages or not (mqtt_client and mqtt_connected):
+        return
+    topic = f"gateway/{gateway_id}/cmd"
+    for message in messages:
+        mqtt_client.publish(topic, json.dumps(message, separators=(",", ":")))
+    m_allowlist_messages.inc(messages[0]["op"], amount=len(messages))
 
 
 def handle_gateway_event(topic: str, payload: dict):
@@ -345,6 +788,8 @@ def handle_gateway_event(topic: str, payload: dict):
         gw.mac = payload.get("mac", gw.mac)
         gw.board = payload.get("board", gw.board)
         gw.last_seen = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        dirty_gateways.add(gateway_id)
+        gateways_writer.mark_dirty()
     else:
         gateways[gateway_id] = GatewayInfo(
             gateway_id=gateway_id,
@@ -353,57 +798,113 @@ def handle_gateway_event(topic: str, payload: dict):
             board=payload.get("board", ""),
             last_seen=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         )
-
-    save_gateways()
+        dirty_gateways.add(gateway_id)
+        gateways_writer.flush_now()
+    state_versions.bump("gateways")
+
+    # 支持白名单的固件会上报名单版本；不一致时补发增量或完整名单
+    if "allowlist_version" in payload:
+        report = (
+            payload.get("allowlist_epoch"),
+            payload.get("allowlist_version"),
+            bool(payload.get("allowlist_overflow")),
+        )
+        gateway_allowlist_reports[gateway_id] = report
+        if settings.gateway_allowlist_enabled:
+            publish_allowlist(
+                gateway_id,
+                gateway_allowlist.catch_up(*report, capacity=payload.get("allowlist_capacity")),
+            )
+        elif report[1]:
+            publish_allowlist(gateway_id, [{"cmd": "allowlist", "op": "off"}])
+        if action == "allowlist":
+            # 网关应用名单后的回执，只更新版本，不记事件
+            return
 
     add_event("gateway", gateway_id, {"action": action, "ip": payload.get("ip", "")})
     print(f"[网关] {gateway_id} - {action}")
 
 
+def start_capture(path: Optional[str] = None) -> CaptureWriter:
+    """开始录制传感器与网关消息（供 tools/replay.py 回放）"""
+    global capture_writer
+    stop_capture()
+    name = path or f"capture-{datetime.now():%Y%m%d-%H%M%S}.cap"
+    target = Path(name) if Path(name).is_absolute() else settings.capture_dir / name
+    capture_writer = CaptureWriter(target)
+    print(f"[录制] 开始录制到 {target}")
+    return capture_writer
+
+
+def stop_capture() -> Optional[dict]:
+    global capture_writer
+    writer, capture_writer = capture_writer, None
+    if writer is None:
+        return None
+    writer.close()
+    print(f"[录制] 已停止，共 {writer.messages} 条消息")
+    return writer.stats()
+
+
 def start_mqtt():
-    """启动 MQTT 客户端线程"""
+    """创建 MQTT 传输层并开始连接（MQTT_TRANSPORT=paho | memory）"""
     global mqtt_client
 
-    mqtt_client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    mqtt_client = create_transport(settings)
     mqtt_client.on_connect = on_mqtt_connect
     mqtt_client.on_disconnect = on_mqtt_disconnect
     mqtt_client.on_message = on_mqtt_message
+    play_dispatcher.attach(mqtt_client)
+    mqtt_subscriptions.attach(mqtt_client)
+    mqtt_subscriptions.start()
+    mqtt_client.start()
+
+
+def start_play_dispatcher():
+    play_dispatcher.start()
+
+
+def on_sensor_timeout(mac: str):
+    """传感器超时未刷新，视为放下（在调度线程中执行）"""
+    record = sensor_table.get(mac)
+    if not record or not record.motion:
+        return
+    record.motion = False
+    m_timeouts.inc()
+    state_versions.bump("sku-states")
+    push_sku_state(mac)
+    product = product_map.get(mac)
+    sku = product.sku if product else ""
+    name = product.name if product else ""
+    add_event("timeout", mac, {"sku": sku, "name": name})
+    print(f"[超时] {sku or mac}")
+    if settings.preload_enabled:
+        send_preload_hint(mac)  # 为下一次拿起预加载
 
-    def mqtt_loop():
-        while True:
-            try:
-                mqtt_client.connect(settings.mqtt_broker, settings.mqtt_port, 60)
-                mqtt_client.loop_forever()
-            except Exception as e:
-                print(f"[MQTT] 连接错误: {e}, 5秒后重试...")
-                time.sleep(5)
 
-    thread = threading.Thread(target=mqtt_loop, daemon=True)
-    thread.start()
+timeout_scheduler = DeadlineScheduler(on_sensor_timeout, name="sensor-timeout")
+
+
+def rearm_sensor_timeout(mac: str):
+    """超时配置变化后，按最后一次运动时间重新计算活跃传感器的截止时间"""
+    record = sensor_table.get(mac)
+    if not record or not record.motion or record.last_seen is None:
+        return
+    now = replay_clock.now() if replay_clock else time.time()
+    remaining = record.last_seen + sensor_timeout_for(product_map.get(mac)) - now
+    timeout_scheduler.schedule(mac, max(0.0, remaining))
 
 
 def start_sensor_timeout_checker():
-    def check_timeout():
-        while True:
-            time.sleep(1)
-            now = time.time()
-            for mac, last_seen in list(sensor_last_seen.items()):
-                product = product_map.get(mac)
-                timeout_s = (
-                    product.timeout_s
-                    if product and product.timeout_s is not None
-                    else settings.sensor_timeout
-                )
-                if now - last_seen > timeout_s:
-                    if sensor_states.get(mac):
-                        sensor_states[mac] = False
-                        sku = product.sku if product else ""
-                        name = product.name if product else ""
-                        add_event("timeout", mac, {"sku": sku, "name": name})
-                        print(f"[超时] {sku or mac}")
+    timeout_scheduler.start()
+
 
-    thread = threading.Thread(target=check_timeout, daemon=True)
-    thread.start()
+def use_replay_clock(clock: ReplayClock):
+    """回放工具调用（须在启动接入与调度之前）：超时与屏幕最短展示时间改由录制时间戳推进"""
+    global replay_clock
+    replay_clock = clock
+    timeout_scheduler.use_clock(clock)
+    play_dispatcher.use_clock(clock)
 
 
 # ============================================
@@ -411,22 +912,54 @@ def start_sensor_timeout_checker():
 # ============================================
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    push_hub.attach(asyncio.get_running_loop())
+    open_storage()
     load_product_map()
     load_gateways()
     load_translations()
     load_app_config()
+    start_event_journal()
+    gateways_writer.start()
+    start_play_dispatcher()
+    start_ingest()
     start_mqtt()
     start_sensor_timeout_checker()
+    start_product_watcher()
+    if settings.capture_file:
+        start_capture(settings.capture_file)
     yield
     # 关闭时
+    product_watcher.stop()
     if mqtt_client:
-        mqtt_client.disconnect()
+        mqtt_client.stop()
+    mqtt_subscriptions.stop()
+    stop_capture()
+    ingest_queue.stop()
+    play_dispatcher.stop()
+    gateways_writer.stop()
+    timeout_scheduler.stop()
+    if event_journal:
+        event_journal.close()
+    storage.close()
 
 
 app = FastAPI(title="SeeedUA 智慧零售后端", lifespan=lifespan)
 templates = Jinja2Templates(directory=Path(__file__).parent / "templates")
 
 
+def versioned_json(request: Request, resource: str, build) -> Response:
+    """按资源版本返回缓存的 JSON；客户端 ETag 未过期时返回 304"""
+    etag = state_versions.etag(resource)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    etag, body = state_versions.render(resource, build)
+    return Response(
+        body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
 # ============================================
 # Web 界面
 # ============================================
@@ -438,7 +971,7 @@ async def index(request: Request):
             "request": request,
             "products": list(product_map.values()),
             "gateways": list(gateways.values()),
-            "events": event_log[:20],
+            "events": event_log.latest(20),
             "mqtt_connected": mqtt_connected,
             "mqtt_broker": settings.mqtt_broker,
             "mqtt_port": settings.mqtt_port,
@@ -450,17 +983,30 @@ async def index(request: Request):
 # 产品映射 API
 # ============================================
 @app.get("/api/products")
-async def get_products():
-    return list(product_map.values())
+async def get_products(
+    request: Request, sku: Optional[str] = None, screen: Optional[str] = None
+):
+    if sku is None and screen is None:
+        return versioned_json(
+            request, "products", lambda: [p._asdict() for p in product_map.values()]
+        )
+
+    # SQLite 后端走 sku / screen 索引，文件后端在内存中过滤
+    rows = storage.find_products(sku=sku, screen=screen)
+    if rows is not None:
+        return [product_map[r["mac"]]._asdict() for r in rows if r["mac"] in product_map]
+    return [
+        p._asdict()
+        for p in product_map.values()
+        if (sku is None or p.sku == sku) and (screen is None or p.screen == screen)
+    ]
 
 
 @app.post("/api/products")
 async def add_product(product: ProductMapping):
     mac = product.mac.lower().replace(":", "")
     product.mac = mac
-    apply_demo_defaults(product)
-    product_map[mac] = product
-    save_product_map()
+    apply_product_changes([to_record(product)], [])
     return {"status": "ok", "product": product}
 
 
@@ -470,9 +1016,7 @@ async def update_product(mac: str, product: ProductMapping):
     if mac not in product_map:
         raise HTTPException(status_code=404, detail="Product not found")
     product.mac = mac
-    apply_demo_defaults(product)
-    product_map[mac] = product
-    save_product_map()
+    apply_product_changes([to_record(product)], [])
     return {"status": "ok", "product": product}
 
 
@@ -481,17 +1025,116 @@ async def delete_product(mac: str):
     mac = mac.lower().replace(":", "")
     if mac not in product_map:
         raise HTTPException(status_code=404, detail="Product not found")
-    del product_map[mac]
-    save_product_map()
+    apply_product_changes([], [mac])
     return {"status": "ok"}
 
 
+def bulk_apply_products(rows: list[dict]) -> dict:
+    """批量 upsert/delete：逐行校验，全部处理完后一次性写盘"""
+    staged: dict[str, Optional[ProductRecord]] = {}
+    results = []
+    summary = {"created": 0, "updated": 0, "deleted": 0, "not_found": 0, "error": 0}
+
+    with product_lock:
+        for i, row in enumerate(rows, start=1):
+            if not isinstance(row, dict):
+                results.append({"row": i, "status": "error", "error": "row must be an object"})
+                summary["error"] += 1
+                continue
+
+            op = row.get("op") or "upsert"
+            if not isinstance(op, str):
+                results.append({"row": i, "status": "error", "error": "op must be a string"})
+                summary["error"] += 1
+                continue
+            op = op.strip().lower()
+            mac = str(row.get("mac") or "").strip().lower().replace(":", "")
+            if not mac:
+                results.append({"row": i, "status": "error", "error": "mac is required"})
+                summary["error"] += 1
+                continue
+
+            exists = staged[mac] is not None if mac in staged else mac in product_map
+
+            if op == "delete":
+                status = "deleted" if exists else "not_found"
+                if exists:
+                    staged[mac] = None
+            elif op == "upsert":
+                data = {k: v for k, v in row.items() if k and k != "op"}
+                data["mac"] = mac
+                data.setdefault("video", "")
+                data.setdefault("screen", "")
+                if data.get("timeout_s") == "":
+                    data["timeout_s"] = None
+                try:
+                    product = ProductMapping.model_validate(data)
+                except ValidationError as e:
+                    error = "; ".join(
+                        f"{'.'.join(str(x) for x in err['loc'])}: {err['msg']}"
+                        for err in e.errors()
+                    )
+                    results.append({"row": i, "mac": mac, "status": "error", "error": error})
+                    summary["error"] += 1
+                    continue
+                staged[mac] = to_record(product)
+                status = "updated" if exists else "created"
+            else:
+                results.append(
+                    {"row": i, "mac": mac, "status": "error", "error": f"unknown op: {op}"}
+                )
+                summary["error"] += 1
+                continue
+
+            summary[status] += 1
+            results.append({"row": i, "mac": mac, "status": status})
+
+        upserts = [p for p in staged.values() if p is not None]
+        removals = [mac for mac, p in staged.items() if p is None]
+        if upserts or removals:
+            apply_product_changes(upserts, removals)
+    print(f"[映射表] 批量导入: {summary}")
+    return {"status": "ok", "summary": summary, "results": results}
+
+
+@app.post("/api/products/bulk")
+async def bulk_products(request: Request, errors_only: bool = False):
+    """
+    批量导入/更新/删除产品映射
+    - application/json: 行数组，或 {"items": [...]}；每行可带 "op": "upsert" | "delete"
+    - text/csv 或 multipart 文件上传（字段名 file）: 表头同 product_map.csv，可选 op 列
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Missing file field")
+        rows = list(csv.DictReader(io.StringIO((await upload.read()).decode("utf-8-sig"))))
+    elif content_type.startswith("text/csv"):
+        body = (await request.body()).decode("utf-8-sig")
+        rows = list(csv.DictReader(io.StringIO(body)))
+    else:
+        try:
+            data = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        rows = data.get("items") if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Expected a list of rows")
+
+    result = await run_in_threadpool(bulk_apply_products, rows)
+    if errors_only:
+        result["results"] = [r for r in result["results"] if r["status"] == "error"]
+    return result
+
+
 # ============================================
 # 网关管理 API
 # ============================================
 @app.get("/api/gateways")
-async def get_gateways():
-    return list(gateways.values())
+async def get_gateways(request: Request):
+    return versioned_json(request, "gateways", lambda: list(gateways.values()))
 
 
 @app.put("/api/gateways/{gateway_id}/label")
@@ -499,10 +1142,28 @@ async def update_gateway_label(gateway_id: str, data: dict):
     if gateway_id not in gateways:
         raise HTTPException(status_code=404, detail="Gateway not found")
     gateways[gateway_id].label = data.get("label", "")
-    save_gateways()
+    dirty_gateways.add(gateway_id)
+    gateways_writer.flush_now()
+    state_versions.bump("gateways")
     return {"status": "ok"}
 
 
+@app.get("/api/gateways/allowlist")
+async def get_gateway_allowlist():
+    """网关白名单：当前版本、MAC 数与各网关上报的名单版本"""
+    current = (gateway_allowlist.epoch, gateway_allowlist.version)
+    reports = {
+        gateway_id: {
+            "epoch": epoch,
+            "version": version,
+            "overflow": overflow,
+            "in_sync": (epoch, version) == current and not overflow,
+        }
+        for gateway_id, (epoch, version, overflow) in list(gateway_allowlist_reports.items())
+    }
+    return {"enabled": settings.gateway_allowlist_enabled, **gateway_allowlist.stats(reports)}
+
+
 @app.post("/api/gateways/{gateway_id}/identify")
 async def identify_gateway(gateway_id: str):
     """让指定网关 LED 闪烁"""
@@ -518,58 +1179,117 @@ async def identify_gateway(gateway_id: str):
 # 事件日志 API
 # ============================================
 @app.get("/api/events")
-async def get_events(limit: int = 50):
-    return event_log[:limit]
+async def get_events(limit: int = 50, after_seq: Optional[int] = None):
+    """获取事件日志（新的在前）；传入 after_seq 时按序号升序返回其后最早的 limit 条，可据此分页"""
+    if after_seq is None:
+        events = event_log.latest(limit)
+    else:
+        events = event_log.since(after_seq, limit)
+    return JSONResponse(events, headers={"X-Event-Seq": str(event_log.last_seq)})
+
+
+def parse_time_param(value: Optional[str]) -> Optional[float]:
+    """时间参数支持 Unix 时间戳或 ISO 格式（如 2026-02-08T10:00:00）"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid time: {value}")
+
+
+@app.get("/api/events/history")
+async def get_event_history(
+    mac: Optional[str] = None,
+    sku: Optional[str] = None,
+    type: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: Optional[int] = None,
+    count: bool = False,
+):
+    """从持久化日志查询历史事件，以 NDJSON 流式返回；count=true 时只返回条数"""
+    if not event_journal:
+        raise HTTPException(status_code=404, detail="Event journal disabled")
+
+    results = event_journal.query(
+        mac=mac.lower().replace(":", "") if mac else None,
+        sku=sku,
+        event_type=type,
+        since=parse_time_param(since),
+        until=parse_time_param(until),
+        limit=limit,
+    )
+    if count:
+        return {"count": await run_in_threadpool(lambda: sum(1 for _ in results))}
+
+    def stream():
+        for event in results:
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 @app.get("/api/sku-states")
-async def get_sku_states():
-    states = []
-    for mac, motion in sensor_states.items():
-        product = product_map.get(mac)
-        last_seen = sensor_last_seen.get(mac)
-        states.append(
-            {
-                "mac": mac,
-                "sku": product.sku if product else "",
-                "name": product.name if product else "",
-                "active": motion,
-                "last_seen": last_seen,
-                "timeout_s": (
-                    product.timeout_s
-                    if product and product.timeout_s is not None
-                    else settings.sensor_timeout
-                ),
-                "gateway_id": sensor_meta.get(mac, {}).get("gateway_id", "unknown"),
-                "rssi": sensor_meta.get(mac, {}).get("rssi", 0),
-            }
-        )
-    return states
+async def get_sku_states(request: Request):
+    return versioned_json(
+        request, "sku-states", lambda: [sku_state(r) for r in sensor_table]
+    )
+
+
+def stream_snapshot() -> dict:
+    return {
+        "sku_states": [sku_state(record) for record in sensor_table],
+        "events": event_log.latest(50),
+        "event_seq": event_log.last_seq,
+    }
+
+
+@app.get("/api/stream")
+async def stream_updates():
+    """SSE 推送：连接时发送完整快照，之后推送传感器状态与事件增量"""
+    sub = push_hub.subscribe()
+
+    async def generate():
+        try:
+            yield encode_sse("snapshot", stream_snapshot())
+            while True:
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if message == RESYNC:
+                    message = encode_sse("snapshot", stream_snapshot())
+                yield message
+        finally:
+            push_hub.unsubscribe(sub)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/api/sensors/unmapped")
 async def get_unmapped_sensors(limit: int = 50):
-    sensors = []
-    all_macs = set(sensor_meta.keys()) | set(sensor_states.keys())
-
-    for mac in all_macs:
-        if mac in product_map:
-            continue
-
-        meta = sensor_meta.get(mac, {})
-        last_seen = sensor_last_seen.get(mac, meta.get("updated_at"))
-        sensors.append(
-            {
-                "mac": mac,
-                "active": sensor_states.get(mac, False),
-                "last_seen": last_seen,
-                "gateway_id": meta.get("gateway_id", "unknown"),
-                "rssi": meta.get("rssi", 0),
-            }
-        )
-
-    sensors.sort(key=lambda x: x.get("last_seen") or 0, reverse=True)
-    return sensors[:limit]
+    """最近上报的未映射传感器，由索引按上报时间维护，查询代价 O(limit)"""
+    return [
+        {
+            "mac": record.mac,
+            "active": record.motion,
+            "last_seen": record.updated_at,
+            "gateway_id": record.gateway_id,
+            "rssi": record.rssi,
+        }
+        for record in unmapped_index.top(limit)
+        if record.mac not in product_map
+    ]
 
 
 # ============================================
@@ -579,14 +1299,123 @@ async def get_unmapped_sensors(limit: int = 50):
 async def get_mqtt_status():
     return {
         "connected": mqtt_connected,
+        "transport": settings.mqtt_transport,
+        "subscribe_mode": "per_mac" if mqtt_subscriptions.enabled else "wildcard",
         "broker": settings.mqtt_broker,
         "port": settings.mqtt_port,
     }
 
 
+@app.get("/api/mqtt/subscriptions")
+async def get_mqtt_subscriptions():
+    """per_mac 订阅：期望 / 已订阅的传感器主题数、待同步数、报文数与发现窗口状态"""
+    return mqtt_subscriptions.stats()
+
+
+@app.get("/api/ingest/stats")
+async def get_ingest_stats():
+    return ingest_queue.stats()
+
+
+@app.get("/api/play/stats")
+async def get_play_stats():
+    """播放指令调度：各屏幕提交、发送、合并、失败与 QoS 1 确认情况"""
+    return play_dispatcher.stats()
+
+
+@app.get("/api/screens/acks")
+async def get_screen_acks():
+    """屏幕播放确认：各屏幕发送、确认、超时数与送达延迟分位数（毫秒）"""
+    return ack_tracker.stats()
+
+
+@app.get("/api/screens/unacked")
+async def get_unacked_commands(limit: int = 50):
+    """等待确认与超时未确认的播放指令（新的在前）"""
+    return ack_tracker.unacked(max(1, min(limit, 500)))
+
+
+@app.get("/api/preload/stats")
+async def get_preload_stats():
+    """预加载提示：各屏幕提示数、命中率（提示后被播放）与播放覆盖率（播放前已提示）"""
+    return {"enabled": settings.preload_enabled, **preload_hints.stats()}
+
+
+@app.get("/api/fusion/stats")
+async def get_fusion_stats():
+    """多网关融合：合并的重复上报数、最佳网关切换次数"""
+    return sensor_fusion.stats()
+
+
+@app.get("/api/fusion/{mac}")
+async def get_fusion_links(mac: str):
+    """听到该传感器的各网关及其平滑 RSSI"""
+    return sensor_fusion.links(mac.lower().replace(":", ""))
+
+
+@app.get("/api/debug/profile")
+async def get_profile(top: int = 30, sort: str = "cumulative"):
+    """热路径各阶段耗时分位数；开启 cProfile 采样时附带剖析结果"""
+    if sort not in CPROFILE_SORT_KEYS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort key, expected one of: {', '.join(sorted(CPROFILE_SORT_KEYS))}",
+        )
+    return {
+        "enabled": stage_profiler.enabled,
+        "enabled_at": stage_profiler.enabled_at,
+        "cprofile_every": stage_profiler.cprofile_every,
+        "cprofile_samples": stage_profiler.cprofile_samples,
+        "stages": stage_profiler.stats(),
+        "cprofile": stage_profiler.cprofile_report(top, sort),
+    }
+
+
+@app.post("/api/debug/profile")
+async def set_profile(update: ProfileUpdate):
+    """开关分阶段计时（关闭时热路径只多一次判断）"""
+    if update.enabled:
+        stage_profiler.enable(update.cprofile_every)
+    else:
+        stage_profiler.disable()
+    if update.reset:
+        stage_profiler.reset()
+    print(f"[剖析] {'开启' if update.enabled else '关闭'}分阶段计时 (cprofile_every={update.cprofile_every})")
+    return {"status": "ok", "enabled": stage_profiler.enabled}
+
+
+@app.get("/api/debug/capture")
+async def get_capture():
+    writer = capture_writer
+    return {"enabled": writer is not None, **(writer.stats() if writer else {})}
+
+
+@app.post("/api/debug/capture")
+async def set_capture(update: CaptureUpdate):
+    """开始 / 停止录制 MQTT 流量"""
+    if update.enabled:
+        try:
+            # API 只允许写到 data/captures/ 下
+            name = Path(update.path).name if update.path else None
+            writer = await run_in_threadpool(start_capture, name)
+        except OSError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"status": "ok", "enabled": True, **writer.stats()}
+    stats = await run_in_threadpool(stop_capture)
+    return {"status": "ok", "enabled": False, **(stats or {})}
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文本格式指标"""
+    return Response(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.get("/api/config")
-async def get_config():
-    return get_app_config()
+async def get_config(request: Request):
+    return versioned_json(request, "config", get_app_config)
 
 
 @app.patch("/api/config")
@@ -598,6 +1427,9 @@ async def patch_config(update: AppConfigUpdate):
         changed = True
     if update.sensor_timeout is not None:
         settings.sensor_timeout = update.sensor_timeout
+        for record in sensor_table:
+            if record.motion:
+                rearm_sensor_timeout(record.mac)
         changed = True
     if update.sku_poll_ms is not None:
         ui_runtime_config["sku_poll_ms"] = update.sku_poll_ms
@@ -608,6 +1440,7 @@ async def patch_config(update: AppConfigUpdate):
 
     if changed:
         save_app_config()
+        state_versions.bump("config", "sku-states")
 
     return {"status": "ok", "config": get_app_config()}
 
@@ -0,0 +1,204 @@
+"""
+Prometheus 文本格式指标
+计数器和直方图按线程分片：每个线程只写自己的分片（普通 dict / list，不加锁），
+抓取时再汇总所有分片，热路径上的开销只有一次 threading.local 查找和一次加法
+"""
+
+import abc
+import bisect
+import threading
+from typing import Callable, Iterable, Union
+
+LabelValues = tuple
+CallbackValue = Union[float, dict[LabelValues, float]]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable) -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Sharded(abc.ABC):
+    """每线程一个分片；分片列表只在线程首次写入时加锁追加"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: list = []
+        self._shards_lock = threading.Lock()
+
+    @abc.abstractmethod
+    def _new_shard(self):
+        """新线程首次写入时创建的分片"""
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._new_shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def _snapshot(self) -> list:
+        with self._shards_lock:
+            return list(self._shards)
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__()
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+    def _new_shard(self) -> dict:
+        return {}
+
+    def inc(self, *label_values, amount: float = 1):
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return sum(shard.get(label_values, 0) for shard in self._snapshot())
+
+    def collect(self) -> dict[LabelValues, float]:
+        totals: dict[LabelValues, float] = {}
+        for shard in self._snapshot():
+            for key, value in dict(shard).items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self) -> list[str]:
+        totals = self.collect()
+        if not totals and not self.labels:
+            totals = {(): 0}
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in sorted(totals.items())
+        ]
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float]):
+        super().__init__()
+        self.name = name
+        self.help = help
+        self.buckets = sorted(buckets)
+
+    def _new_shard(self) -> list:
+        # [各桶计数..., +Inf 桶计数, 总和]
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float):
+        shard = self._shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def collect(self) -> tuple[list[int], int, float]:
+        """(累计桶计数, 总数, 总和)"""
+        n = len(self.buckets) + 1
+        counts = [0] * n
+        total_sum = 0.0
+        for shard in self._snapshot():
+            shard = list(shard)
+            for i in range(n):
+                counts[i] += shard[i]
+            total_sum += shard[-1]
+        cumulative = []
+        running = 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, running, total_sum
+
+    def render(self) -> list[str]:
+        cumulative, count, total_sum = self.collect()
+        bounds = [*self.buckets, float("inf")]
+        lines = [
+            f'{self.name}_bucket{{le="{_format_value(le)}"}} {c}'
+            for le, c in zip(bounds, cumulative)
+        ]
+        lines.append(f"{self.name}_sum {_format_value(total_sum)}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class CallbackMetric:
+    """抓取时才读取的指标（当前传感器数、队列深度等已有状态，不重复计数）"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], CallbackValue],
+        labels: Iterable[str] = (),
+        kind: str = "gauge",
+    ):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def render(self) -> list[str]:
+        value = self.fn()
+        if not isinstance(value, dict):
+            return [f"{self.name} {_format_value(value)}"]
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(v)}"
+            for key, v in sorted(value.items())
+        ]
+
+
+class MetricsRegistry:
+    def __init__(self, prefix: str = ""):
+        self.prefix = f"{prefix}_" if prefix else ""
+        self._metrics: list = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, help, labels))
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float]) -> Histogram:
+        return self._register(Histogram(self.prefix + name, help, buckets))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        fn: Callable[[], CallbackValue],
+        labels: Iterable[str] = (),
+        kind: str = "gauge",
+    ) -> CallbackMetric:
+        return self._register(CallbackMetric(self.prefix + name, help, fn, labels, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                print(f"[指标] {metric.name} 采集失败: {e}")
+        return "\n".join(lines) + "\n"
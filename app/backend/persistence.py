@@ -0,0 +1,102 @@
+"""
+文件持久化工具
+- atomic_write_text: 先写临时文件再 rename，避免写到一半断电留下损坏文件
+- WriteBehind: 延迟合并写盘，频繁的小修改只标记脏，后台线程按间隔最多写一次
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+
+def atomic_write_text(path: Path, text: str, encoding: str = "utf-8"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w", encoding=encoding, newline="") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class WriteBehind:
+    def __init__(self, name: str, save: Callable[[], None], interval: float):
+        self.name = name
+        self.save = save
+        self.interval = interval
+
+        self._dirty = False
+        self._urgent = False
+        self._last_write = 0.0
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+
+        self.writes = 0
+        self.coalesced = 0
+
+    def mark_dirty(self):
+        """标记有修改，等待下一个写盘周期"""
+        with self._cond:
+            if self._dirty:
+                self.coalesced += 1
+            self._dirty = True
+            self._cond.notify()
+
+    def flush_now(self):
+        """结构性修改：通知后台线程立即写盘（不阻塞调用方）"""
+        with self._cond:
+            self._dirty = True
+            self._urgent = True
+            self._cond.notify()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name=f"write-behind-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+        if self._dirty:
+            self._write()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if self._dirty:
+                        due = self._last_write + self.interval - time.monotonic()
+                        if self._urgent or due <= 0:
+                            break
+                        self._cond.wait(due)
+                    else:
+                        self._cond.wait()
+                if not self._running:
+                    return
+            self._write()
+
+    def _write(self):
+        with self._cond:
+            self._dirty = False
+            self._urgent = False
+        try:
+            self.save()
+            self.writes += 1
+        except (OSError, sqlite3.Error) as e:
+            # 写入失败不能让后台线程退出：保持脏标记，下个周期重试
+            print(f"[持久化] {self.name} 写入失败: {e}")
+            with self._cond:
+                self._dirty = True
+        self._last_write = time.monotonic()
@@ -0,0 +1,138 @@
+"""
+屏幕视频预加载提示
+已映射传感器首次上报、放下（motion=false 上报或超时判定）时，向其屏幕发布 screen/{id}/preload，让屏幕提前加载视频，
+拿起后 play 到达时不必再从头加载。
+每个屏幕用 LRU 记住最近提示过的视频（容量对应屏幕端缓存），提示过且未过期的不再重复发送；
+刚播放过的视频同样记入 LRU；同一屏幕两次提示之间有最小间隔，映射到同一屏幕的商品很多时也不会刷屏。
+之后对同一屏幕同一视频的 play 计为命中，用于衡量预加载是否有效
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class PreloadEntry:
+    __slots__ = ("hinted_at", "played")
+
+    def __init__(self, hinted_at: float):
+        self.hinted_at = hinted_at
+        self.played = False
+
+
+class ScreenHints:
+    __slots__ = (
+        "videos", "last_hint_at", "hinted", "throttled", "hits", "plays", "warm_plays", "evicted_unplayed",
+    )
+
+    def __init__(self):
+        self.videos: OrderedDict[str, PreloadEntry] = OrderedDict()
+        self.last_hint_at = float("-inf")
+        self.hinted = 0
+        self.throttled = 0
+        self.hits = 0  # 提示过的视频随后被播放（每次提示最多计一次）
+        self.plays = 0
+        self.warm_plays = 0  # 播放时视频已提示过（屏幕应已加载）
+        self.evicted_unplayed = 0  # 被挤出 LRU 或过期前没有被播放的提示
+
+
+class PreloadHints:
+    def __init__(self, capacity: int = 8, ttl: float = 600.0, min_interval: float = 2.0, window: int = 1000):
+        self.capacity = capacity
+        self.ttl = ttl  # 超过该时间视为屏幕可能已丢弃缓存，允许再次提示
+        self.min_interval = min_interval
+        self._screens: dict[str, ScreenHints] = {}
+        self._lock = threading.Lock()
+        self._leads: deque = deque(maxlen=window)  # 命中时提示领先 play 的时间
+
+    def _screen(self, screen: str) -> ScreenHints:
+        hints = self._screens.get(screen)
+        if hints is None:
+            hints = self._screens[screen] = ScreenHints()
+        return hints
+
+    def should_hint(self, screen: str, video: str) -> bool:
+        """返回 True 表示应向该屏幕发布预加载提示（已登记为已提示）"""
+        now = time.monotonic()
+        with self._lock:
+            hints = self._screen(screen)
+            entry = hints.videos.get(video)
+            if entry is not None and now - entry.hinted_at < self.ttl:
+                hints.videos.move_to_end(video)
+                return False
+            if now - hints.last_hint_at < self.min_interval:
+                hints.throttled += 1
+                return False
+            if entry is not None:
+                self._drop(hints, video)
+            hints.videos[video] = PreloadEntry(now)
+            while len(hints.videos) > self.capacity:
+                self._drop(hints, next(iter(hints.videos)))
+            hints.last_hint_at = now
+            hints.hinted += 1
+            return True
+
+    def _drop(self, hints: ScreenHints, video: str):
+        entry = hints.videos.pop(video)
+        if not entry.played:
+            hints.evicted_unplayed += 1
+
+    def played(self, screen: str, video: str):
+        """记录一次实际发出的播放；视频在该屏幕的提示 LRU 中且未过期时计为命中"""
+        now = time.monotonic()
+        with self._lock:
+            hints = self._screen(screen)
+            hints.plays += 1
+            entry = hints.videos.get(video)
+            if entry is None or now - entry.hinted_at >= self.ttl:
+                # 屏幕刚播放过，视为已缓存，之后不必再提示
+                if entry is not None:
+                    self._drop(hints, video)
+                entry = hints.videos[video] = PreloadEntry(now)
+                entry.played = True
+                while len(hints.videos) > self.capacity:
+                    self._drop(hints, next(iter(hints.videos)))
+                return
+            hints.videos.move_to_end(video)
+            hints.warm_plays += 1
+            if not entry.played:
+                entry.played = True
+                hints.hits += 1
+                self._leads.append(now - entry.hinted_at)
+
+    def counts(self, field: str) -> dict[tuple[str], int]:
+        with self._lock:
+            return {(screen,): getattr(hints, field) for screen, hints in self._screens.items()}
+
+    def stats(self) -> dict:
+        with self._lock:
+            screens = {
+                screen: {
+                    "hinted": h.hinted,
+                    "throttled": h.throttled,
+                    "hits": h.hits,
+                    "plays": h.plays,
+                    "warm_plays": h.warm_plays,
+                    "evicted_unplayed": h.evicted_unplayed,
+                    "cached": list(h.videos),
+                }
+                for screen, h in self._screens.items()
+            }
+            leads = sorted(self._leads)
+        hinted = sum(s["hinted"] for s in screens.values())
+        hits = sum(s["hits"] for s in screens.values())
+        plays = sum(s["plays"] for s in screens.values())
+        warm = sum(s["warm_plays"] for s in screens.values())
+        return {
+            "capacity": self.capacity,
+            "ttl": self.ttl,
+            "min_interval": self.min_interval,
+            "hinted": hinted,
+            "throttled": sum(s["throttled"] for s in screens.values()),
+            "hits": hits,
+            # 提示后被播放的比例，以及播放前已提示过的比例
+            "hit_rate": round(hits / hinted, 4) if hinted else 0.0,
+            "play_coverage": round(warm / plays, 4) if plays else 0.0,
+            "lead_s_p50": round(leads[len(leads) // 2], 3) if leads else None,
+            "screens": screens,
+        }
@@ -0,0 +1,113 @@
+"""
+传感器热路径分阶段计时
+关闭时调用方只做一次 enabled 判断，不产生 StageTrace，各探针点只是一次 None 判断；
+打开后每条消息记录各阶段耗时（每阶段保留最近 N 个样本），可选按 1/N 采样用 cProfile 剖析整条处理过程
+"""
+
+import cProfile
+import io
+import pstats
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from latency import summarize_ms
+
+# pstats.Stats.sort_stats 接受的排序键（未知键会抛 KeyError）
+CPROFILE_SORT_KEYS = frozenset(pstats.Stats.sort_arg_dict_default)
+
+
+class StageTrace:
+    __slots__ = ("profiler", "started", "last")
+
+    def __init__(self, profiler: "StageProfiler", start: float):
+        self.profiler = profiler
+        self.started = start
+        self.last = start
+
+    def lap(self, stage: str):
+        """记录从上一个探针点到此处的耗时，计入 stage"""
+        now = time.perf_counter()
+        self.profiler.record(stage, now - self.last)
+        self.last = now
+
+    def finish(self):
+        self.profiler.record("total", time.perf_counter() - self.started)
+
+
+class StageProfiler:
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self.enabled = False
+        self.enabled_at: Optional[float] = None
+        self._samples: dict[str, deque] = {}
+
+        self.cprofile_every = 0  # 0 表示不做 cProfile 采样
+        self._cprofile: Optional[cProfile.Profile] = None
+        self._cprofile_lock = threading.Lock()
+        self._counter = 0
+        self.cprofile_samples = 0
+
+    def enable(self, cprofile_every: int = 0):
+        self.cprofile_every = max(0, cprofile_every)
+        if self.cprofile_every and self._cprofile is None:
+            self._cprofile = cProfile.Profile()
+        self.enabled_at = time.time()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self._samples = {}
+        with self._cprofile_lock:
+            self._cprofile = cProfile.Profile() if self.cprofile_every else None
+            self.cprofile_samples = 0
+        self.enabled_at = time.time() if self.enabled else None
+
+    def start(self) -> StageTrace:
+        return StageTrace(self, time.perf_counter())
+
+    def record(self, stage: str, seconds: float):
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples.setdefault(stage, deque(maxlen=self.window))
+        samples.append(seconds)
+
+    def sampled(self, fn, *args):
+        """按 cprofile_every 采样，在 cProfile 下执行 fn；同一时刻只剖析一条消息"""
+        self._counter += 1
+        profile = self._cprofile
+        if (
+            not self.cprofile_every
+            or profile is None
+            or self._counter % self.cprofile_every
+            or not self._cprofile_lock.acquire(blocking=False)
+        ):
+            return fn(*args)
+        try:
+            profile.enable()
+            try:
+                return fn(*args)
+            finally:
+                profile.disable()
+                self.cprofile_samples += 1
+        finally:
+            self._cprofile_lock.release()
+
+    def stats(self) -> dict:
+        result = {}
+        for stage, samples in list(self._samples.items()):
+            summary = summarize_ms(list(samples), digits=4, suffix="_ms")
+            if summary:
+                result[stage] = summary
+        return result
+
+    def cprofile_report(self, top: int = 30, sort: str = "cumulative") -> Optional[str]:
+        with self._cprofile_lock:
+            if self._cprofile is None or not self.cprofile_samples:
+                return None
+            buf = io.StringIO()
+            pstats.Stats(self._cprofile, stream=buf).sort_stats(sort).print_stats(top)
+            return buf.getvalue()
@@ -0,0 +1,67 @@
+"""
+Server-Sent Events 推送
+后台线程调用 publish() 发布增量，消息只序列化一次，再分发到每个连接的 asyncio 队列
+"""
+
+import asyncio
+import json
+from typing import Optional
+
+# 队列中的重发快照标记：消费太慢导致溢出时，丢弃积压改为推送一次完整快照
+RESYNC = ""
+
+
+class Subscriber:
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+
+
+class PushHub:
+    def __init__(self, queue_size: int = 1000):
+        self.queue_size = queue_size
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: set[Subscriber] = set()
+
+        self.published = 0
+        self.overflows = 0
+
+    @property
+    def active(self) -> bool:
+        return bool(self._subscribers)
+
+    def attach(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def subscribe(self) -> Subscriber:
+        sub = Subscriber(self.queue_size)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self._subscribers.discard(sub)
+
+    def publish(self, kind: str, data):
+        """线程安全；没有连接时直接返回，不做序列化"""
+        if not self._subscribers or self._loop is None:
+            return
+        message = encode_sse(kind, data)
+        self.published += 1
+        try:
+            self._loop.call_soon_threadsafe(self._fanout, message)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def _fanout(self, message: str):
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.overflows += 1
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.queue.put_nowait(RESYNC)
+
+
+def encode_sse(kind: str, data) -> str:
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return f"event: {kind}\ndata: {payload}\n\n"
@@ -0,0 +1,175 @@
+"""
+截止时间调度器
+最小堆 + 惰性失效：刷新已有截止时间只改字典（O(1)），堆顶到期时再按最新截止时间重新入堆。
+回放时可挂到 ReplayClock 上：时间由录制时间戳推进，不起调度线程，到期回调在推进时钟的线程中同步执行
+"""
+
+import heapq
+import threading
+import time
+from typing import Callable, Hashable, Optional
+
+
+class DeadlineScheduler:
+    """按 key 维护截止时间，到期后在调度线程中回调 on_expire(key)"""
+
+    def __init__(self, on_expire: Callable[[Hashable], None], name: str = "deadline"):
+        self.on_expire = on_expire
+        self.name = name
+
+        # key -> 最新截止时间（monotonic，挂到 ReplayClock 后为录制时间）
+        self._deadlines: dict[Hashable, float] = {}
+        # key -> 当前堆中有效条目的截止时间
+        self._armed: dict[Hashable, float] = {}
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._counter = 0
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+        self._clock: Optional["ReplayClock"] = None
+        self.now: Callable[[], float] = time.monotonic
+
+        self.fired = 0
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def use_clock(self, clock: "ReplayClock"):
+        """改用回放时钟（须在 start 与首次 schedule 之前调用）"""
+        self._clock = clock
+        self.now = clock.now
+        clock.attach(self)
+
+    def schedule(self, key: Hashable, delay: float):
+        """设置 key 在 delay 秒后到期；仅推迟时不触碰堆"""
+        deadline = self.now() + delay
+        with self._cond:
+            self._deadlines[key] = deadline
+            armed = self._armed.get(key)
+            if armed is not None and armed <= deadline:
+                return
+            self._push(key, deadline)
+
+    def cancel(self, key: Hashable):
+        """取消 key 的截止时间，堆中残留条目到期时自动丢弃"""
+        with self._cond:
+            self._deadlines.pop(key, None)
+
+    def _push(self, key: Hashable, deadline: float):
+        self._counter += 1
+        self._armed[key] = deadline
+        heapq.heappush(self._heap, (deadline, self._counter, key))
+        if self._heap[0][2] == key and self._heap[0][0] == deadline:
+            self._cond.notify()
+
+    def start(self):
+        if self._clock is not None:
+            return  # 由回放时钟推进
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _pop_expired(self, now: float) -> list[Hashable]:
+        """弹出截止时间不晚于 now 的 key（调用方持有 _cond）"""
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, key = heapq.heappop(self._heap)
+            if self._armed.get(key) != deadline:
+                continue  # 已被更早的条目取代
+            target = self._deadlines.get(key)
+            if target is None:
+                del self._armed[key]  # 已取消
+            elif target > now:
+                self._push(key, target)  # 期间被刷新，按新截止时间重新入堆
+            else:
+                del self._armed[key]
+                del self._deadlines[key]
+                expired.append(key)
+        return expired
+
+    def _collect_expired(self) -> list[Hashable]:
+        with self._cond:
+            while self._running:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                now = self.now()
+                wait = self._heap[0][0] - now
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                expired = self._pop_expired(now)
+                if expired:
+                    return expired
+            return []
+
+    def _fire(self, keys: list[Hashable]):
+        for key in keys:
+            self.fired += 1
+            try:
+                self.on_expire(key)
+            except Exception as e:
+                print(f"[调度] {self.name} 回调失败: {e}")
+
+    def _run(self):
+        while self._running:
+            self._fire(self._collect_expired())
+
+    # ---------- 回放时钟 ----------
+
+    def next_deadline(self) -> Optional[float]:
+        """堆顶截止时间（可能是已失效的条目，弹出时会被丢弃或重新入堆）"""
+        with self._cond:
+            return self._heap[0][0] if self._heap else None
+
+    def run_due(self, now: float):
+        """在调用方线程中执行截止时间不晚于 now 的回调"""
+        with self._cond:
+            expired = self._pop_expired(now)
+        self._fire(expired)
+
+
+class ReplayClock:
+    """
+    回放用的虚拟时钟：时间只随录制时间戳前进，与回放速度无关。
+    挂在上面的调度器按截止时间先后依次回调，同一时刻按挂载顺序，多次回放的结果完全一致
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._schedulers: list[DeadlineScheduler] = []
+        self._lock = threading.RLock()
+
+    def now(self) -> float:
+        return self._now
+
+    def attach(self, scheduler: DeadlineScheduler):
+        self._schedulers.append(scheduler)
+
+    def advance(self, ts: float):
+        """把时钟推进到 ts，途中依次执行到期的回调；ts 早于当前时间时不回退"""
+        with self._lock:
+            while True:
+                due = [
+                    (deadline, i)
+                    for i, scheduler in enumerate(self._schedulers)
+                    if (deadline := scheduler.next_deadline()) is not None and deadline <= ts
+                ]
+                if not due:
+                    break
+                deadline, i = min(due)
+                self._now = max(self._now, deadline)
+                self._schedulers[i].run_due(self._now)
+            self._now = max(self._now, ts)
@@ -0,0 +1,103 @@
+"""
+传感器状态表
+每个 MAC 一条 __slots__ 记录，原地更新；MAC 与网关 ID 字符串驻留，避免每条广播都分配新对象
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from itertools import islice
+from typing import Iterator, Optional
+
+
+class SensorRecord:
+    __slots__ = (
+        "mac",
+        "motion",
+        "last_seen",
+        "updated_at",
+        "rssi",
+        "gateway_id",
+        "last_trigger",
+    )
+
+    def __init__(self, mac: str):
+        self.mac = mac
+        self.motion = False
+        self.last_seen: Optional[float] = None  # 最近一次 motion=True 的时间
+        self.updated_at = 0.0  # 最近一次收到任意上报的时间
+        self.rssi = 0
+        self.gateway_id = "unknown"
+        self.last_trigger = 0.0  # 最近一次触发播放（去重用）
+
+
+class SensorTable:
+    def __init__(self):
+        self._records: dict[str, SensorRecord] = {}
+        self._gateway_ids: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, mac: str) -> bool:
+        return mac in self._records
+
+    def __iter__(self) -> Iterator[SensorRecord]:
+        return iter(list(self._records.values()))
+
+    def get(self, mac: str) -> Optional[SensorRecord]:
+        return self._records.get(mac)
+
+    def add(self, mac: str) -> SensorRecord:
+        mac = sys.intern(mac)
+        record = SensorRecord(mac)
+        self._records[mac] = record
+        return record
+
+    def intern_gateway(self, gateway_id: str) -> str:
+        """网关数量很少，同一网关 ID 在所有记录间共享一个字符串对象"""
+        return self._gateway_ids.setdefault(gateway_id, gateway_id)
+
+    def clear(self):
+        self._records.clear()
+        self._gateway_ids.clear()
+
+
+class UnmappedIndex:
+    """未映射传感器按最近上报时间排序的索引；上报时移到末尾，Top-N 查询从末尾倒序取"""
+
+    def __init__(self):
+        self._order: OrderedDict[str, SensorRecord] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def touch(self, record: SensorRecord):
+        with self._lock:
+            self._order[record.mac] = record
+            self._order.move_to_end(record.mac)
+
+    def discard(self, mac: str):
+        with self._lock:
+            self._order.pop(mac, None)
+
+    def restore(self, records: list[SensorRecord]):
+        """产品被删除后重新纳入索引；比末尾更早的记录需要按时间重排（仅删除产品时发生）"""
+        if not records:
+            return
+        with self._lock:
+            tail = next(reversed(self._order.values()), None)
+            records = sorted(records, key=lambda r: r.updated_at)
+            if tail is None or records[0].updated_at >= tail.updated_at:
+                for record in records:
+                    self._order[record.mac] = record
+                return
+            merged = list(self._order.values()) + records
+            merged.sort(key=lambda r: r.updated_at)
+            self._order = OrderedDict((r.mac, r) for r in merged)
+
+    def top(self, limit: int) -> list[SensorRecord]:
+        """最近上报的 limit 个未映射传感器，O(limit)"""
+        with self._lock:
+            return list(islice(reversed(self._order.values()), max(0, limit)))
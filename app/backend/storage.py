@@ -0,0 +1,512 @@
+"""
+存储后端
+- FileStorage: 原有格式，product_map.csv / gateways.json / app_config.json，事件写入分段日志
+- SQLiteStorage: 单个 SQLite 数据库（WAL 模式），单行 upsert 代替整表重写，
+  产品按 sku / screen 建索引；首次启用时自动从 CSV / JSON 文件迁移
+"""
+
+import abc
+import csv
+import io
+import json
+import sqlite3
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from persistence import atomic_write_text
+
+PRODUCT_FIELDS = ["mac", "sku", "name", "video", "screen", "timeout_s"]
+GATEWAY_FIELDS = ["gateway_id", "mac", "ip", "board", "label", "last_seen"]
+
+
+class Storage(abc.ABC):
+    """存储后端接口；产品和网关以带同名属性的对象传入，读取时返回 dict"""
+
+    name = "base"
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    @abc.abstractmethod
+    def load_products(self) -> Iterator[dict]:
+        ...
+
+    @abc.abstractmethod
+    def save_products(self, products: dict, upserts: Optional[list] = None, removals: Optional[list] = None):
+        """upserts / removals 为 None 表示整表保存"""
+
+    def find_products(self, sku: Optional[str] = None, screen: Optional[str] = None) -> Optional[list[dict]]:
+        """按 sku / screen 查询；返回 None 表示后端不支持索引查询，由调用方在内存中过滤"""
+        return None
+
+    def products_signature(self) -> Optional[tuple]:
+        """产品数据源的文件签名，供热加载检测外部修改；返回 None 表示不支持"""
+        return None
+
+    @abc.abstractmethod
+    def load_gateways(self) -> dict[str, dict]:
+        ...
+
+    @abc.abstractmethod
+    def save_gateways(self, gateways: dict, changed: Optional[Iterable[str]] = None):
+        ...
+
+    @abc.abstractmethod
+    def load_config(self) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    def save_config(self, config: dict):
+        ...
+
+    @abc.abstractmethod
+    def open_event_store(self, settings):
+        """返回事件持久化对象（接口同 journal.EventJournal）"""
+
+
+def product_row(p) -> tuple:
+    return (p.mac, p.sku, p.name, p.video, p.screen, p.timeout_s)
+
+
+def gateway_row(gw) -> tuple:
+    return tuple(getattr(gw, f) for f in GATEWAY_FIELDS)
+
+
+# ============================================
+# 文件后端
+# ============================================
+class FileStorage(Storage):
+    name = "file"
+
+    def __init__(self, data_dir: Path):
+        self.data_dir = data_dir
+        self.product_map_file = data_dir / "product_map.csv"
+        self.gateways_file = data_dir / "gateways.json"
+        self.config_file = data_dir / "app_config.json"
+
+    def load_products(self) -> Iterator[dict]:
+        if not self.product_map_file.exists():
+            return
+        with open(self.product_map_file, "r", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+
+    def save_products(self, products: dict, upserts=None, removals=None):
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(PRODUCT_FIELDS)
+        for p in list(products.values()):
+            row = product_row(p)
+            writer.writerow(row[:5] + ("" if row[5] is None else row[5],))
+        atomic_write_text(self.product_map_file, buf.getvalue())
+
+    def products_signature(self) -> Optional[tuple]:
+        try:
+            st = self.product_map_file.stat()
+        except FileNotFoundError:
+            return ()
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load_gateways(self) -> dict[str, dict]:
+        if not self.gateways_file.exists():
+            return {}
+        with open(self.gateways_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_gateways(self, gateways: dict, changed=None):
+        data = {gw_id: gw.model_dump() for gw_id, gw in list(gateways.items())}
+        atomic_write_text(
+            self.gateways_file, json.dumps(data, indent=2, ensure_ascii=False)
+        )
+
+    def load_config(self) -> Optional[dict]:
+        if not self.config_file.exists():
+            return None
+        with open(self.config_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_config(self, config: dict):
+        atomic_write_text(
+            self.config_file, json.dumps(config, indent=2, ensure_ascii=False)
+        )
+
+    def open_event_store(self, settings):
+        from journal import EventJournal
+
+        return EventJournal(
+            settings.journal_dir,
+            segment_bytes=settings.journal_segment_bytes,
+            max_segments=settings.journal_max_segments,
+        )
+
+
+# ============================================
+# SQLite 后端
+# ============================================
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS products (
+    mac TEXT PRIMARY KEY,
+    sku TEXT NOT NULL,
+    name TEXT NOT NULL,
+    video TEXT NOT NULL,
+    screen TEXT NOT NULL,
+    timeout_s REAL
+);
+CREATE INDEX IF NOT EXISTS idx_products_sku ON products(sku);
+CREATE INDEX IF NOT EXISTS idx_products_screen ON products(screen);
+CREATE TABLE IF NOT EXISTS gateways (
+    gateway_id TEXT PRIMARY KEY,
+    mac TEXT,
+    ip TEXT,
+    board TEXT,
+    label TEXT,
+    last_seen TEXT
+);
+CREATE TABLE IF NOT EXISTS config (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    type TEXT NOT NULL,
+    mac TEXT NOT NULL,
+    sku TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS idx_events_mac_ts ON events(mac, ts);
+CREATE INDEX IF NOT EXISTS idx_events_sku_ts ON events(sku, ts);
+CREATE INDEX IF NOT EXISTS idx_events_type_ts ON events(type, ts);
+"""
+
+
+def connect_sqlite(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class SQLiteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, db_file: Path, data_dir: Path):
+        self.db_file = db_file
+        self.data_dir = data_dir
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = connect_sqlite(self.db_file)
+        self._conn.executescript(SCHEMA)
+        self._migrate_from_files()
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _write(self, sql: str, rows: list):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(sql, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _migrate_from_files(self):
+        """首次启用时从 CSV / JSON 文件导入；之后以数据库为准"""
+        done = self._conn.execute(
+            "SELECT value FROM meta WHERE key = 'migrated_from_files'"
+        ).fetchone()
+        if done:
+            return
+
+        files = FileStorage(self.data_dir)
+        products = []
+        for row in files.load_products():
+            timeout_raw = (row.get("timeout_s") or "").strip()
+            products.append(
+                (
+                    row["mac"].lower().replace(":", ""),
+                    row["sku"],
+                    row["name"],
+                    (row.get("video") or "").strip(),
+                    (row.get("screen") or "").strip(),
+                    float(timeout_raw) if timeout_raw else None,
+                )
+            )
+        gateways = [
+            tuple(info.get(f, "") for f in GATEWAY_FIELDS)
+            for info in files.load_gateways().values()
+        ]
+        config = files.load_config() or {}
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(UPSERT_PRODUCT, products)
+            self._conn.executemany(UPSERT_GATEWAY, gateways)
+            self._conn.executemany(
+                UPSERT_CONFIG, [(k, json.dumps(v)) for k, v in config.items()]
+            )
+            self._conn.execute(
+                "INSERT INTO meta(key, value) VALUES ('migrated_from_files', '1')"
+            )
+            self._conn.execute("COMMIT")
+        print(
+            f"[存储] 已从文件迁移 {len(products)} 个产品、{len(gateways)} 个网关、"
+            f"{len(config)} 项配置到 {self.db_file.name}"
+        )
+
+    def load_products(self) -> Iterator[dict]:
+        # 连接与写入线程共用：每批只在锁内取，yield 时不持锁（调用方可能在迭代中写入）
+        with self._lock:
+            cursor = self._conn.execute(f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products")
+        while True:
+            with self._lock:
+                rows = cursor.fetchmany(1000)
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+
+    def save_products(self, products: dict, upserts=None, removals=None):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if upserts is None and removals is None:
+                    self._conn.execute("DELETE FROM products")
+                    upserts = list(products.values())
+                if upserts:
+                    self._conn.executemany(UPSERT_PRODUCT, [product_row(p) for p in upserts])
+                if removals:
+                    self._conn.executemany(
+                        "DELETE FROM products WHERE mac = ?", [(m,) for m in removals]
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def find_products(self, sku=None, screen=None) -> Optional[list[dict]]:
+        clauses, params = [], []
+        if sku is not None:
+            clauses.append("sku = ?")
+            params.append(sku)
+        if screen is not None:
+            clauses.append("screen = ?")
+            params.append(screen)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(PRODUCT_FIELDS)} FROM products{where}", params
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def load_gateways(self) -> dict[str, dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(GATEWAY_FIELDS)} FROM gateways"
+            ).fetchall()
+        return {r["gateway_id"]: {k: r[k] or "" for k in GATEWAY_FIELDS} for r in rows}
+
+    def save_gateways(self, gateways: dict, changed=None):
+        ids = list(gateways.keys()) if changed is None else list(changed)
+        rows = [gateway_row(gateways[i]) for i in ids if i in gateways]
+        if rows:
+            self._write(UPSERT_GATEWAY, rows)
+
+    def load_config(self) -> Optional[dict]:
+        with self._lock:
+            rows = self._conn.execute("SELECT key, value FROM config").fetchall()
+        if not rows:
+            return None
+        return {r["key"]: json.loads(r["value"]) for r in rows}
+
+    def save_config(self, config: dict):
+        self._write(UPSERT_CONFIG, [(k, json.dumps(v)) for k, v in config.items()])
+
+    def open_event_store(self, settings):
+        return SQLiteEventStore(self.db_file)
+
+
+UPSERT_PRODUCT = (
+    "INSERT INTO products(mac, sku, name, video, screen, timeout_s) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(mac) DO UPDATE SET sku=excluded.sku, name=excluded.name, "
+    "video=excluded.video, screen=excluded.screen, timeout_s=excluded.timeout_s"
+)
+UPSERT_GATEWAY = (
+    "INSERT INTO gateways(gateway_id, mac, ip, board, label, last_seen) VALUES (?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(gateway_id) DO UPDATE SET mac=excluded.mac, ip=excluded.ip, "
+    "board=excluded.board, label=excluded.label, last_seen=excluded.last_seen"
+)
+UPSERT_CONFIG = (
+    "INSERT INTO config(key, value) VALUES (?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET value=excluded.value"
+)
+
+
+class SQLiteEventStore:
+    """事件表，接口与 journal.EventJournal 一致：后台线程批量写入，查询走索引流式返回"""
+
+    def __init__(self, db_file: Path, queue_size: int = 100000):
+        self.db_file = db_file
+        self.queue_size = queue_size
+        self._pending: deque = deque()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_seq = 0
+
+        self.written = 0
+        self.dropped = 0
+
+    def open(self):
+        self._conn = connect_sqlite(self.db_file)
+        self._conn.executescript(SCHEMA)
+        row = self._conn.execute("SELECT MAX(seq), COUNT(*) FROM events").fetchone()
+        self._last_seq = row[0] or 0
+        print(f"[日志] 已加载 {row[1]} 条事件（SQLite）")
+
+    @property
+    def last_seq(self) -> int:
+        return self._last_seq
+
+    def append(self, record: tuple):
+        with self._cond:
+            if len(self._pending) >= self.queue_size:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(record)
+            self._cond.notify()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._writer, name="event-sqlite", daemon=True
+        )
+        self._thread.start()
+
+    def close(self, timeout: float = 5.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _writer(self):
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                batch = list(self._pending)
+                self._pending.clear()
+            if batch:
+                rows = [
+                    (
+                        seq,
+                        ts,
+                        event_type,
+                        mac,
+                        details.get("sku"),
+                        json.dumps(details, ensure_ascii=False, separators=(",", ":")),
+                    )
+                    for seq, ts, event_type, mac, details in batch
+                ]
+                try:
+                    self._conn.execute("BEGIN")
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO events(seq, ts, type, mac, sku, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    self._conn.execute("COMMIT")
+                    self.written += len(rows)
+                    self._last_seq = max(self._last_seq, batch[-1][0])
+                except sqlite3.Error as e:
+                    # BEGIN 本身失败（如数据库被锁）时没有可回滚的事务
+                    if self._conn.in_transaction:
+                        self._conn.execute("ROLLBACK")
+                    print(f"[日志] 写入失败: {e}")
+            elif not self._running:
+                return
+
+    def query(
+        self,
+        mac: Optional[str] = None,
+        sku: Optional[str] = None,
+        event_type: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[dict]:
+        clauses, params = [], []
+        for column, value in (("mac", mac), ("sku", sku), ("type", event_type)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts <= ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT seq, ts, type, mac, data FROM events{where} ORDER BY ts, seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        # 每次查询单独的只读连接，WAL 模式下不阻塞写入
+        conn = connect_sqlite(self.db_file)
+        try:
+            cursor = conn.execute(sql, params)
+            while rows := cursor.fetchmany(500):
+                for r in rows:
+                    yield {
+                        "seq": r["seq"],
+                        "ts": r["ts"],
+                        "type": r["type"],
+                        "mac": r["mac"],
+                        **json.loads(r["data"]),
+                    }
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "last_seq": self._last_seq,
+            "written": self.written,
+            "dropped": self.dropped,
+            "pending": len(self._pending),
+        }
+
+
+def create_storage(settings) -> Storage:
+    if settings.storage_backend == "sqlite":
+        return SQLiteStorage(settings.sqlite_file, settings.data_dir)
+    if settings.storage_backend != "file":
+        print(f"[存储] 未知后端 {settings.storage_backend}，使用 file")
+    return FileStorage(settings.data_dir)
@@ -0,0 +1,204 @@
+"""
+按 MAC 订阅传感器主题
+MQTT_SUBSCRIBE_MODE=per_mac 时不订阅 bthome/+/state，只订阅 product_map 中各 MAC 的 bthome/{mac}/state，
+范围内其它传感器的消息由 broker 直接丢弃。
+- 产品映射变化只改期望集合，短暂合并后在调度线程中按批发送 SUBSCRIBE / UNSUBSCRIBE
+- 发现窗口：每 discovery_interval 秒临时订阅通配主题 discovery_window 秒，未映射传感器仍能被发现；
+  窗口内退订各 MAC 主题（先订阅通配再退订，关窗时先重新订阅再退订通配），同一条上报不会因两个订阅重复投递
+- 报文未能交给传输层时保留未同步的部分，retry_delay 秒后重试
+"""
+
+import re
+import threading
+import time
+from typing import Iterable, Optional
+
+from scheduler import DeadlineScheduler
+from transport import MQTTTransport
+
+MAC_RE = re.compile(r"^[0-9a-f]{12}$")
+WILDCARD_TOPIC = "bthome/+/state"
+
+SYNC = "sync"
+DISCOVERY_ON = "discovery-on"
+DISCOVERY_OFF = "discovery-off"
+
+
+def sensor_topic(mac: str) -> str:
+    return f"bthome/{mac}/state"
+
+
+class SubscriptionManager:
+    def __init__(
+        self,
+        enabled: bool = False,
+        batch: int = 200,
+        debounce: float = 0.2,
+        discovery_interval: float = 300.0,
+        discovery_window: float = 10.0,
+        retry_delay: float = 1.0,
+    ):
+        self.enabled = enabled
+        self.batch = batch  # 每个 SUBSCRIBE / UNSUBSCRIBE 报文携带的主题数
+        self.debounce = debounce  # 连续修改合并成一次同步（秒）
+        self.discovery_interval = discovery_interval  # 0 表示不开发现窗口
+        self.discovery_window = discovery_window
+        self.retry_delay = retry_delay
+        self.transport: Optional[MQTTTransport] = None
+
+        self._desired: set[str] = set()
+        self._subscribed: set[str] = set()  # 本次连接中已发给 broker 的订阅
+        self._wildcard = False  # 通配订阅是否已发给 broker（关窗重订失败时保持打开）
+        self._lock = threading.Lock()
+        self._scheduler = DeadlineScheduler(self._on_deadline, name="mqtt-subscriptions")
+
+        self.discovery_active = False
+        self.discovery_windows = 0
+        self.subscribe_packets = 0
+        self.unsubscribe_packets = 0
+        self.last_sync_ms = 0.0
+
+    def attach(self, transport: MQTTTransport):
+        self.transport = transport
+
+    def start(self):
+        if self.enabled:
+            self._scheduler.start()
+
+    def stop(self):
+        self._scheduler.stop()
+
+    # ---------- 期望集合 ----------
+
+    def reset(self, macs: Iterable[str]):
+        with self._lock:
+            self._desired = {m for m in macs if MAC_RE.match(m)}
+        self._request_sync(0.0)
+
+    def change(self, added: Iterable[str], removed: Iterable[str]):
+        with self._lock:
+            self._desired.update(m for m in added if MAC_RE.match(m))
+            self._desired.difference_update(removed)
+        self._request_sync(self.debounce)
+
+    def _request_sync(self, delay: float):
+        if self.enabled:
+            self._scheduler.schedule(SYNC, delay)
+
+    # ---------- 连接 ----------
+
+    def on_connect(self):
+        """传输层线程：新连接上没有任何订阅，全部重发；发现窗口从头开始"""
+        with self._lock:
+            self._subscribed = set()
+            self._wildcard = False
+            self.discovery_active = False
+        self._scheduler.cancel(DISCOVERY_OFF)
+        if self.discovery_interval > 0:
+            # 先开发现窗口，各 MAC 主题在关窗时再订阅
+            self._scheduler.schedule(DISCOVERY_ON, 0.0)
+        else:
+            self._scheduler.schedule(SYNC, 0.0)
+
+    def _on_deadline(self, key: str):
+        """调度线程：所有 SUBSCRIBE / UNSUBSCRIBE 都在这里发出"""
+        transport = self.transport
+        if transport is None or not transport.connected:
+            return  # 重连后 on_connect 会重新同步
+        if key == SYNC:
+            self._sync(transport)
+        elif key == DISCOVERY_ON:
+            if not self._wildcard:
+                if not transport.subscribe_many([WILDCARD_TOPIC]):
+                    self._scheduler.schedule(DISCOVERY_ON, self.retry_delay)
+                    return
+                self._wildcard = True
+                self.subscribe_packets += 1
+            with self._lock:
+                self.discovery_active = True
+            self.discovery_windows += 1
+            # 通配订阅已覆盖所有传感器，退订各 MAC 主题
+            self._sync(transport)
+            if self.discovery_window < self.discovery_interval:
+                self._scheduler.schedule(DISCOVERY_OFF, self.discovery_window)
+        elif key == DISCOVERY_OFF:
+            with self._lock:
+                self.discovery_active = False
+            # 各 MAC 主题全部订阅上之后才退订通配，否则保持通配订阅稍后重试
+            if not self._sync(transport):
+                self._scheduler.schedule(DISCOVERY_OFF, self.retry_delay)
+                return
+            if transport.unsubscribe_many([WILDCARD_TOPIC]):
+                self.unsubscribe_packets += 1
+            self._wildcard = False
+            self._scheduler.schedule(
+                DISCOVERY_ON, max(0.0, self.discovery_interval - self.discovery_window)
+            )
+
+    def _target(self) -> set[str]:
+        """应订阅的 MAC（调用方持锁）；发现窗口内由通配订阅覆盖，不保留各 MAC 主题"""
+        return set() if self.discovery_active else self._desired
+
+    def _sync(self, transport: MQTTTransport) -> bool:
+        """按期望集合发送 SUBSCRIBE / UNSUBSCRIBE；有报文未交给传输层时返回 False 并安排重试"""
+        started = time.perf_counter()
+        with self._lock:
+            target = self._target()
+            to_add = sorted(target - self._subscribed)
+            to_remove = sorted(self._subscribed - target)
+        done = True
+        for i in range(0, len(to_add), self.batch):
+            chunk = to_add[i:i + self.batch]
+            if not transport.subscribe_many([sensor_topic(m) for m in chunk]):
+                done = False
+                break
+            self.subscribe_packets += 1
+            with self._lock:
+                self._subscribed.update(chunk)
+        for i in range(0, len(to_remove) if done else 0, self.batch):
+            chunk = to_remove[i:i + self.batch]
+            if not transport.unsubscribe_many([sensor_topic(m) for m in chunk]):
+                done = False
+                break
+            self.unsubscribe_packets += 1
+            with self._lock:
+                self._subscribed.difference_update(chunk)
+        if not done:
+            # 已发出的批次记入 _subscribed，剩余部分留待下次同步
+            print(f"[MQTT] 订阅同步未完成，{self.retry_delay:g} 秒后重试")
+            self._scheduler.schedule(SYNC, self.retry_delay)
+        elif to_add or to_remove:
+            self.last_sync_ms = round((time.perf_counter() - started) * 1000, 3)
+            print(f"[MQTT] 订阅同步: +{len(to_add)} -{len(to_remove)}，共 {len(self._subscribed)} 个传感器主题")
+        return done
+
+    # ---------- 统计 ----------
+
+    @property
+    def subscribed(self) -> int:
+        return len(self._subscribed)
+
+    def stats(self) -> dict:
+        with self._lock:
+            desired = len(self._desired)
+            subscribed = len(self._subscribed)
+            target = self._target()
+            pending_add = len(target - self._subscribed) if self.enabled else 0
+            pending_remove = len(self._subscribed - target) if self.enabled else 0
+        return {
+            "mode": "per_mac" if self.enabled else "wildcard",
+            "desired": desired,
+            "subscribed": subscribed,
+            "pending_add": pending_add,
+            "pending_remove": pending_remove,
+            "batch": self.batch,
+            "subscribe_packets": self.subscribe_packets,
+            "unsubscribe_packets": self.unsubscribe_packets,
+            "last_sync_ms": self.last_sync_ms,
+            "discovery": {
+                "interval": self.discovery_interval,
+                "window": self.discovery_window,
+                "active": self.discovery_active,
+                "windows": self.discovery_windows,
+            },
+        }
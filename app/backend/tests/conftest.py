@@ -0,0 +1,61 @@
+"""后端测试共用：合成录制文件与产品映射"""
+
+import json
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from capture import CaptureWriter  # noqa: E402
+
+T0 = 1_700_000_000.0
+
+
+def write_products(path: Path, macs: list[str], screens: int = 4, timeout_s: float = 1.0):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("mac,sku,name,video,screen,timeout_s\n")
+        for i, mac in enumerate(macs):
+            f.write(f"{mac},SKU-{i},商品{i},v{i % 5}.mp4,screen-{i % screens:02d},{timeout_s}\n")
+
+
+def write_motion_capture(path: Path, macs: list[str], span: float = 8.0, seed: int = 7):
+    """
+    每个传感器随机时刻被拿起，拿起期间每 0.2 秒由两个网关各上报一次 motion=true，
+    之后静默（按产品 timeout_s 超时放下），偶尔上报一次 motion=false
+    """
+    rng = random.Random(seed)
+    messages = [(T0, "gateway/gw-1/info", {"gateway_id": "gw-1", "action": "online"})]
+    for mac in macs:
+        t = rng.uniform(0, 1.0)
+        while t < span:
+            for k in range(rng.randint(2, 6)):
+                ts = t + k * 0.2
+                for g, rssi in (("gw-1", -55), ("gw-2", -70)):
+                    delay = 0.0 if g == "gw-1" else rng.uniform(0.01, 0.05)
+                    messages.append((T0 + ts + delay, f"bthome/{mac}/state",
+                                     {"motion": True, "rssi": rssi, "gateway_id": g}))
+            t += k * 0.2 + rng.uniform(0.3, 2.5)
+            if rng.random() < 0.3:
+                messages.append((T0 + t, f"bthome/{mac}/state",
+                                 {"motion": False, "rssi": -55, "gateway_id": "gw-1"}))
+                t += 0.2
+    messages.sort(key=lambda m: m[0])
+    writer = CaptureWriter(path)
+    for ts, topic, body in messages:
+        writer.record(topic, json.dumps(body).encode(), ts)
+    writer.close()
+    return len(messages)
+
+
+@pytest.fixture
+def motion_capture(tmp_path):
+    macs = [f"ab00000000{i:02x}" for i in range(20)]
+    products = tmp_path / "product_map.csv"
+    capture = tmp_path / "motion.cap"
+    write_products(products, macs)
+    count = write_motion_capture(capture, macs)
+    return capture, products, count
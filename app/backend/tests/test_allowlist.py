@@ -0,0 +1,48 @@
+"""网关白名单：超出网关容量后版本不推进，名单缩回容量以内时后端补发完整名单"""
+
+import sys
+
+from tests.conftest import BACKEND_DIR
+
+sys.path.insert(0, str(BACKEND_DIR / "tools"))
+
+from allowlist import GatewayAllowlist  # noqa: E402
+from gateway_sim import EdgeAllowlist  # noqa: E402
+
+
+def _deliver(edge: EdgeAllowlist, messages: list[dict]) -> bool:
+    report = False
+    for body in messages:
+        report = edge.apply(body) or report
+    return report
+
+
+def _catch_up(server: GatewayAllowlist, edge: EdgeAllowlist) -> list[dict]:
+    return server.catch_up(edge.epoch, edge.version, edge.overflow, capacity=edge.capacity)
+
+
+def test_delta_overflow_reports_without_bumping_version():
+    server = GatewayAllowlist(chunk=8)
+    server.reset([f"a{i:011x}" for i in range(3)])
+    edge = EdgeAllowlist(capacity=4)
+    assert _deliver(edge, _catch_up(server, edge))
+    assert edge.active and edge.version == server.version
+
+    synced = edge.version
+    assert _deliver(edge, server.change([f"b{i:011x}" for i in range(2)], []))
+    assert edge.overflow and not edge.active
+    assert edge.version == synced  # 没有应用增量，不能看起来已同步
+    assert _catch_up(server, edge) == []  # 仍然放不下：继续转发全部
+
+    # 溢出后的增量不再应用，只上报
+    assert _deliver(edge, server.change([], ["b00000000000"])) and edge.version == synced
+    assert _deliver(edge, [server.announce()])
+
+    # 缩回容量以内：后端改发完整名单
+    messages = _catch_up(server, edge)
+    assert messages and all(m["op"] == "full" for m in messages)
+    _deliver(edge, messages)
+    assert edge.active and not edge.overflow
+    assert edge.version == server.version
+    assert edge.macs == set(server._macs)
+    assert _catch_up(server, edge) == []
@@ -0,0 +1,49 @@
+"""预加载提示：传感器固件只广播 motion=true，提示必须来自首次上报和超时放下"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR / "tools"))
+
+from tests.conftest import T0, write_products  # noqa: E402
+
+
+def test_hints_sent_for_motion_true_only_traffic(tmp_path):
+    os.environ.update(PRELOAD_ENABLED="true", PRELOAD_MIN_INTERVAL="0", PRELOAD_CACHE_SIZE="1")
+    from harness import InProcessBackend
+    from scheduler import ReplayClock
+    from transport import Message
+
+    # 两个商品挂同一屏幕、不同视频；屏幕只缓存 1 个视频，第二个商品的提示会把第一个挤出 LRU
+    a, b = "ab0000000001", "ab0000000002"
+    products = tmp_path / "product_map.csv"
+    write_products(products, [a, b], screens=1, timeout_s=1.0)
+    backend = InProcessBackend(products_csv=products, clock=ReplayClock())
+    main = backend.main
+    assert main.settings.preload_enabled
+    backend.setup()
+
+    hints = []
+    client = backend.client()
+    client.on_message = lambda msg: hints.append(json.loads(msg.payload)["video"])
+    client.start()
+    client.subscribe("screen/+/preload")
+    try:
+        for offset, mac in ((0.0, a), (0.2, a), (0.4, a), (0.5, b), (3.0, b)):
+            body = {"motion": True, "rssi": -60, "gateway_id": "gw-1"}
+            main.on_mqtt_message(Message(f"bthome/{mac}/state", json.dumps(body).encode()), T0 + offset)
+        backend.wait_drained(5)
+        time.sleep(0.05)
+    finally:
+        client.stop()
+        backend.teardown()
+
+    # a、b 首次上报各一次；a 在 1.4 s、b 在 1.5 s 超时放下后各再提示一次（视频已被挤出 LRU）
+    assert hints == ["v0.mp4", "v1.mp4", "v0.mp4", "v1.mp4"]
+    events = [e["type"] for e in main.event_log.latest(50)]
+    assert events.count("timeout") >= 2
+    assert "put_down" not in events
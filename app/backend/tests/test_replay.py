@@ -0,0 +1,43 @@
+"""回放结果只由录制时间戳决定，与回放速度无关"""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def run_replay(capture, products, speed: float, report) -> dict:
+    subprocess.run(
+        [
+            sys.executable, "tools/replay.py", str(capture),
+            "--products", str(products), "--speed", str(speed), "--report", str(report),
+        ],
+        cwd=BACKEND_DIR, check=True, capture_output=True, timeout=120,
+    )
+    return json.loads(report.read_text(encoding="utf-8"))
+
+
+def test_accelerated_replay_matches_realtime(motion_capture, tmp_path):
+    capture, products, count = motion_capture
+    realtime = run_replay(capture, products, 1, tmp_path / "1x.json")
+    fastest = run_replay(capture, products, 0, tmp_path / "max.json")
+    tenfold = run_replay(capture, products, 10, tmp_path / "10x.json")
+
+    assert realtime["messages"] == count
+    assert realtime["dropped"] == 0
+    # 录制中包含超时放下、去重抑制与多网关副本，倍速回放时这些时间间隔不能被压缩
+    assert realtime["events"].get("timeout", 0) > 0
+    assert realtime["events"]["picked_up"] > realtime["events"]["play"]
+    for report in (fastest, tenfold):
+        for key in ("events", "plays", "plays_by_screen", "events_digest", "plays_digest"):
+            assert report[key] == realtime[key], key
+
+
+def test_replay_is_repeatable(motion_capture, tmp_path):
+    capture, products, _ = motion_capture
+    first = run_replay(capture, products, 0, tmp_path / "a.json")
+    second = run_replay(capture, products, 0, tmp_path / "b.json")
+    assert first["events_digest"] == second["events_digest"]
+    assert first["plays_digest"] == second["plays_digest"]
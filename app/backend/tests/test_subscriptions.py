@@ -0,0 +1,117 @@
+"""按 MAC 订阅：发送失败的批次下次同步重试；发现窗口内各 MAC 主题与通配订阅不重叠"""
+
+from tests.conftest import BACKEND_DIR  # noqa: F401  (把后端目录加入 sys.path)
+
+from scheduler import ReplayClock
+from subscriptions import WILDCARD_TOPIC, SubscriptionManager, sensor_topic
+from transport import MQTTTransport
+
+MACS = [f"a0{i:010x}" for i in range(10)]
+
+
+class FakeTransport(MQTTTransport):
+    """记录 broker 侧的订阅集合；fail 中的调用序号（从 1 开始）返回失败"""
+
+    def __init__(self, fail: tuple[int, ...] = ()):
+        super().__init__()
+        self.connected = True
+        self.topics: set[str] = set()
+        self.fail = set(fail)
+        self.calls = 0
+
+    def _accept(self) -> bool:
+        self.calls += 1
+        return self.calls not in self.fail
+
+    def subscribe_many(self, topics: list[str], qos: int = 0) -> bool:
+        if not self._accept():
+            return False
+        self.topics.update(topics)
+        return True
+
+    def unsubscribe_many(self, topics: list[str]) -> bool:
+        if not self._accept():
+            return False
+        self.topics.difference_update(topics)
+        return True
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def subscribe(self, topic: str, qos: int = 0):
+        self.subscribe_many([topic], qos)
+
+    def unsubscribe(self, topic: str):
+        self.unsubscribe_many([topic])
+
+    def publish(self, topic: str, payload, qos: int = 0, retain: bool = False) -> bool:
+        return True
+
+    def publish_tracked(self, topic: str, payload, qos: int = 1, retain: bool = False):
+        return None
+
+
+def _manager(transport: FakeTransport, clock: ReplayClock, **kwargs) -> SubscriptionManager:
+    manager = SubscriptionManager(enabled=True, batch=4, debounce=0.0, **kwargs)
+    manager._scheduler.use_clock(clock)
+    manager.attach(transport)
+    return manager
+
+
+def _connect(manager: SubscriptionManager, transport: FakeTransport, clock: ReplayClock):
+    """启动时先加载映射（尚未连接），连上后由 on_connect 开始同步"""
+    transport.connected = False
+    manager.reset(MACS)
+    clock.advance(0.0)
+    transport.connected = True
+    manager.on_connect()
+    clock.advance(0.0)
+
+
+def test_failed_batch_is_retried():
+    clock = ReplayClock()
+    transport = FakeTransport(fail=(2,))
+    manager = _manager(transport, clock, discovery_interval=0)
+    manager.reset(MACS)
+    clock.advance(0.0)
+    assert manager.stats()["pending_add"] > 0  # 第二批失败，剩余部分仍待同步
+
+    clock.advance(manager.retry_delay)
+    assert transport.topics == {sensor_topic(m) for m in MACS}
+    assert manager.stats()["pending_add"] == 0
+
+
+def test_discovery_window_does_not_overlap_per_mac_topics():
+    clock = ReplayClock()
+    transport = FakeTransport()
+    manager = _manager(transport, clock, discovery_interval=30.0, discovery_window=5.0)
+    _connect(manager, transport, clock)
+    assert transport.topics == {WILDCARD_TOPIC}
+
+    clock.advance(5.0)
+    assert transport.topics == {sensor_topic(m) for m in MACS}
+
+    # 窗口内的映射变化在关窗时生效
+    clock.advance(30.0)
+    manager.change(["b0" + "0" * 10], [MACS[0]])
+    clock.advance(31.0)
+    assert transport.topics == {WILDCARD_TOPIC}
+    clock.advance(35.0)
+    assert transport.topics == {sensor_topic(m) for m in MACS[1:] + ["b0" + "0" * 10]}
+    assert manager.discovery_windows == 2
+
+
+def test_wildcard_kept_until_per_mac_topics_resubscribed():
+    clock = ReplayClock()
+    transport = FakeTransport(fail=(3,))  # 1: 通配订阅，2-4: 关窗时的三批订阅
+    manager = _manager(transport, clock, discovery_interval=30.0, discovery_window=5.0)
+    _connect(manager, transport, clock)
+
+    # 关窗时第二批订阅失败：保持通配订阅，稍后重试后再退订
+    clock.advance(5.0)
+    assert WILDCARD_TOPIC in transport.topics
+    clock.advance(5.0 + manager.retry_delay)
+    assert transport.topics == {sensor_topic(m) for m in MACS}
@@ -0,0 +1,118 @@
+"""
+产品映射加载基准：旧版逐行创建 pydantic 模型 vs 流式批量校验 + ProductRecord
+
+用法（在 app/backend 目录下）:
+    uv run python tools/bench_product_loader.py
+    uv run python tools/bench_product_loader.py --sizes 10000 100000 --screens 20
+"""
+
+import argparse
+import csv
+import gc
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from catalog import iter_product_records  # noqa: E402
+from storage import PRODUCT_FIELDS  # noqa: E402
+
+
+class ProductMapping(BaseModel):
+    mac: str
+    sku: str
+    name: str
+    video: str
+    screen: str
+    timeout_s: Optional[float] = Field(default=None, ge=0.5, le=300)
+
+
+def write_csv(path: Path, n: int, screens: int):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(PRODUCT_FIELDS)
+        for i in range(n):
+            writer.writerow([
+                f"{i:012x}",
+                f"SKU-{i:06d}",
+                f"Product {i}",
+                f"video_{i % 50}.mp4",
+                f"screen-{i % screens:02d}",
+                "" if i % 4 else "8",
+            ])
+
+
+def read_rows(path: Path):
+    with open(path, "r", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def load_models(path: Path) -> dict:
+    """旧实现：每行一个 ProductMapping"""
+    products = {}
+    for row in read_rows(path):
+        mac = row["mac"].lower().replace(":", "")
+        timeout_raw = str(row.get("timeout_s") or "").strip()
+        products[mac] = ProductMapping(
+            mac=mac,
+            sku=row["sku"],
+            name=row["name"],
+            video=(row.get("video") or "").strip() or "demo_default.mp4",
+            screen=(row.get("screen") or "").strip() or "screen-01",
+            timeout_s=float(timeout_raw) if timeout_raw else None,
+        )
+    return products
+
+
+def load_records(path: Path) -> dict:
+    return {
+        r.mac: r
+        for r in iter_product_records(read_rows(path), "demo_default.mp4", "screen-01")
+    }
+
+
+def measure(loader, path: Path) -> tuple[float, int]:
+    """(耗时秒, 加载完成后仍占用的字节)；计时与内存分两次测量，避免 tracemalloc 拖慢计时"""
+    gc.collect()
+    start = time.perf_counter()
+    result = loader(path)
+    elapsed = time.perf_counter() - start
+    del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = loader(path)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return elapsed, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="产品映射加载基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--screens", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'models ms':>10} {'records ms':>11} {'models MB':>10} {'records MB':>11} {'saved':>7}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            path = Path(tmp) / f"product_map_{n}.csv"
+            write_csv(path, n, args.screens)
+            model_s, model_bytes = measure(load_models, path)
+            record_s, record_bytes = measure(load_records, path)
+            print(
+                f"{n:>8} {model_s * 1000:>10.0f} {record_s * 1000:>11.0f} "
+                f"{model_bytes / 1e6:>10.2f} {record_bytes / 1e6:>11.2f} "
+                f"{1 - record_bytes / model_bytes:>6.0%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
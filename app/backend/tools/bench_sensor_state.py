@@ -0,0 +1,95 @@
+"""
+传感器状态内存基准：旧版四个并行 dict vs SensorTable
+
+用法（在 app/backend 目录下）:
+    uv run python tools/bench_sensor_state.py
+    uv run python tools/bench_sensor_state.py --sizes 10000 100000 --gateways 20
+"""
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sensor_table import SensorTable  # noqa: E402
+
+
+def make_macs(n: int) -> list[str]:
+    return [f"{i:012x}" for i in range(n)]
+
+
+def build_dicts(macs: list[str], gateways: list[str]):
+    """旧实现：每条广播都新建一个 sensor_meta 字典"""
+    recent_triggers: dict[str, float] = {}
+    sensor_states: dict[str, bool] = {}
+    sensor_last_seen: dict[str, float] = {}
+    sensor_meta: dict[str, dict] = {}
+    now = time.time()
+    for i, mac in enumerate(macs):
+        mac = mac.lower()  # 每条消息从 topic 切出的新字符串
+        gateway_id = "".join(gateways[i % len(gateways)])  # 每条 JSON 解析出的新字符串
+        sensor_meta[mac] = {
+            "gateway_id": gateway_id,
+            "rssi": -60 - i % 30,
+            "motion": True,
+            "updated_at": now,
+        }
+        sensor_last_seen[mac] = now
+        sensor_states[mac] = True
+        recent_triggers[mac] = now
+    return recent_triggers, sensor_states, sensor_last_seen, sensor_meta
+
+
+def build_table(macs: list[str], gateways: list[str]):
+    table = SensorTable()
+    now = time.time()
+    for i, mac in enumerate(macs):
+        mac = mac.lower()
+        gateway_id = "".join(gateways[i % len(gateways)])
+        record = table.add(mac)
+        record.gateway_id = table.intern_gateway(gateway_id)
+        record.rssi = -60 - i % 30
+        record.motion = True
+        record.updated_at = now
+        record.last_seen = now
+        record.last_trigger = now
+    return table
+
+
+def measure(builder, macs, gateways) -> tuple[int, float]:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = builder(macs, gateways)
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="传感器状态内存基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--gateways", type=int, default=10)
+    args = parser.parse_args()
+
+    gateways = [f"gw-{i:04X}" for i in range(args.gateways)]
+    print(f"{'sensors':>10} {'dicts MB':>10} {'table MB':>10} {'saved':>8} {'B/sensor':>18}")
+    for n in args.sizes:
+        macs = make_macs(n)
+        dict_bytes, _ = measure(build_dicts, macs, gateways)
+        table_bytes, _ = measure(build_table, macs, gateways)
+        saved = 1 - table_bytes / dict_bytes
+        print(
+            f"{n:>10} {dict_bytes / 1e6:>10.2f} {table_bytes / 1e6:>10.2f} "
+            f"{saved:>7.0%} {dict_bytes // n:>8} → {table_bytes // n:<8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+存储后端写入延迟基准：文件（CSV 整表重写）vs SQLite（WAL，单行 upsert）
+
+用法（在 app/backend 目录下）:
+    uv run python tools/bench_storage.py
+    uv run python tools/bench_storage.py --sizes 1000 10000 50000 --updates 200
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from storage import FileStorage, SQLiteStorage  # noqa: E402
+
+
+def make_products(n: int) -> dict:
+    return {
+        f"{i:012x}": SimpleNamespace(
+            mac=f"{i:012x}",
+            sku=f"SKU-{i:06d}",
+            name=f"Product {i}",
+            video=f"video_{i % 50}.mp4",
+            screen=f"screen-{i % 20:02d}",
+            timeout_s=None if i % 3 else 5.0,
+        )
+        for i in range(n)
+    }
+
+
+def bench(storage, products: dict, updates: int) -> list[float]:
+    storage.open()
+    storage.save_products(products)  # 初始全量写入
+    macs = list(products.keys())
+    latencies = []
+    for i in range(updates):
+        p = products[macs[(i * 7919) % len(macs)]]
+        p.name = f"Renamed {i}"
+        start = time.perf_counter()
+        storage.save_products(products, upserts=[p], removals=[])
+        latencies.append(time.perf_counter() - start)
+    storage.close()
+    return latencies
+
+
+def summarize(latencies: list[float]) -> str:
+    ms = sorted(x * 1000 for x in latencies)
+    p50 = statistics.median(ms)
+    p99 = ms[min(len(ms) - 1, int(len(ms) * 0.99))]
+    return f"p50 {p50:8.3f} ms  p99 {p99:8.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="存储后端单行写入延迟基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--updates", type=int, default=100)
+    args = parser.parse_args()
+
+    for n in args.sizes:
+        products = make_products(n)
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = Path(tmp)
+            file_lat = bench(FileStorage(data_dir), products, args.updates)
+            sqlite_lat = bench(
+                SQLiteStorage(data_dir / "bench.db", data_dir / "empty"), products, args.updates
+            )
+        print(f"{n:>7} products | file   {summarize(file_lat)}")
+        print(f"{'':>7}          | sqlite {summarize(sqlite_lat)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+网关模拟器：按固件的白名单协议（见 allowlist.py）接收 gateway/{id}/cmd 与 gateway/all/cmd，
+在"网关侧"过滤 BTHome 广播，只转发白名单内的传感器（名单外的按 discovery 间隔抽样转发，供未映射传感器发现）
+
+- EdgeAllowlist: 单个网关的名单状态机（完整名单分片接收、增量应用、版本不符时请求补发、超出容量时转发全部）
+- GatewayFleet: 一个 MQTT 连接模拟多个网关，loadgen --edge-filter 也用它过滤发布
+
+用法（在 app/backend 目录下，后端需设置 GATEWAY_ALLOWLIST_ENABLED=true）:
+    # 4 个网关，各自听到 product_map.csv 中的传感器与 50 个未映射传感器，每 10 秒打印转发 / 过滤统计
+    uv run python tools/gateway_sim.py --host localhost --macs data/product_map.csv --unmapped 50
+"""
+
+import argparse
+import csv
+import json
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from transport import Message, MQTTTransport, PahoTransport  # noqa: E402
+
+
+def split_macs(packed: str) -> list[str]:
+    return [packed[i:i + 12] for i in range(0, len(packed) - 11, 12)]
+
+
+class EdgeAllowlist:
+    """与固件相同的名单状态机；apply 返回 True 表示应上报名单版本（回执或请求补发）"""
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity  # 固件 ALLOWLIST_MAX
+        self.active = False  # 未收到名单前转发全部广播
+        self.overflow = False  # 名单超出容量：转发全部广播，不再应用增量
+        self.epoch = 0
+        self.version = 0
+        self.macs: set[str] = set()
+        self.discovery = 0.0
+        self._staging: Optional[dict] = None
+        self._last_discovery = float("-inf")
+
+        self.forwarded = 0
+        self.filtered = 0
+        self.discovered = 0
+        self.resyncs = 0
+
+    def apply(self, body: dict) -> bool:
+        op = body.get("op")
+        if op == "off":
+            self.active, self.overflow, self.epoch, self.version = False, False, 0, 0
+            self.macs = set()
+            self._staging = None
+            return True
+        if op == "announce":
+            return self._resync_if(
+                self.overflow or body.get("epoch") != self.epoch or body.get("version") != self.version
+            )
+        if op == "full":
+            return self._apply_full(body)
+        if op == "delta":
+            if body.get("epoch") == self.epoch and body.get("version") == self.version:
+                return False  # 已应用过（补发与广播重叠）
+            if not self.active or body.get("epoch") != self.epoch or body.get("base") != self.version:
+                return self._resync_if(True)
+            macs = self.macs - set(split_macs(body.get("remove", "")))
+            macs.update(split_macs(body.get("add", "")))
+            if len(macs) > self.capacity:
+                # 放不下：转发全部，版本不推进，上报 overflow 等后端发完整名单
+                self.active, self.overflow, self.macs = False, True, set()
+                return True
+            self.macs = macs
+            self.version = body["version"]
+            return True
+        return False
+
+    def _apply_full(self, body: dict) -> bool:
+        key = (body.get("epoch"), body.get("version"))
+        part = body.get("part", 0)
+        if part == 0:
+            self._staging = {"key": key, "next": 0, "macs": []}
+        staging = self._staging
+        if staging is None or staging["key"] != key or staging["next"] != part:
+            # 丢了分片或名单在接收途中又变了：丢弃已收部分，请求重发
+            self._staging = None
+            return self._resync_if(True)
+        staging["macs"].extend(split_macs(body.get("macs", "")))
+        staging["next"] += 1
+        if staging["next"] < body.get("parts", 1):
+            return False
+        self._staging = None
+        if len(staging["macs"]) != body.get("count", 0):
+            return self._resync_if(True)
+        self.overflow = len(staging["macs"]) > self.capacity
+        self.macs = set() if self.overflow else set(staging["macs"])
+        self.epoch, self.version = key
+        self.discovery = float(body.get("discovery", 0) or 0)
+        self.active = not self.overflow
+        return True
+
+    def _resync_if(self, needed: bool) -> bool:
+        if needed:
+            self.resyncs += 1
+        return needed
+
+    def allows(self, mac: str, now: float) -> bool:
+        if not self.active or mac in self.macs:
+            self.forwarded += 1
+            return True
+        if self.discovery > 0 and now - self._last_discovery >= self.discovery:
+            self._last_discovery = now
+            self.discovered += 1
+            return True
+        self.filtered += 1
+        return False
+
+
+class GatewayFleet:
+    """一个 MQTT 连接上的一组模拟网关"""
+
+    def __init__(self, client: MQTTTransport, gateway_ids: list[str], capacity: int = 1024):
+        self.client = client
+        self.lists = {gateway_id: EdgeAllowlist(capacity) for gateway_id in gateway_ids}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """订阅命令并上报上线（带名单版本），后端据此下发名单"""
+        self.client.subscribe("gateway/+/cmd")
+        for gateway_id in self.lists:
+            self.report(gateway_id, "online")
+
+    def report(self, gateway_id: str, action: str):
+        edge = self.lists[gateway_id]
+        self.client.publish(
+            f"gateway/{gateway_id}/info",
+            json.dumps({
+                "gateway_id": gateway_id,
+                "action": action,
+                "board": "gateway_sim",
+                "ip": "127.0.0.1",
+                "allowlist_epoch": edge.epoch,
+                "allowlist_version": edge.version,
+                "allowlist_overflow": edge.overflow,
+                "allowlist_capacity": edge.capacity,
+            }, separators=(",", ":")),
+        )
+
+    def handle(self, msg: Message) -> bool:
+        """处理一条消息；返回 False 表示不是网关命令"""
+        parts = msg.topic.split("/")
+        if len(parts) != 3 or parts[0] != "gateway" or parts[2] != "cmd":
+            return False
+        targets = list(self.lists) if parts[1] == "all" else [parts[1]] if parts[1] in self.lists else []
+        try:
+            body = json.loads(msg.payload)
+        except ValueError:
+            return True
+        if not isinstance(body, dict) or body.get("cmd") != "allowlist":
+            return True
+        for gateway_id in targets:
+            with self._lock:
+                report = self.lists[gateway_id].apply(body)
+            if report:
+                self.report(gateway_id, "allowlist")
+        return True
+
+    def allows(self, gateway_id: str, mac: str, now: float) -> bool:
+        with self._lock:
+            return self.lists[gateway_id].allows(mac, now)
+
+    def wait_synced(self, timeout: float) -> bool:
+        """等所有网关收到名单（超出容量的也算收到）"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(edge.active or edge.overflow for edge in self.lists.values()):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            edges = list(self.lists.values())
+            forwarded = sum(e.forwarded for e in edges)
+            filtered = sum(e.filtered for e in edges)
+            discovered = sum(e.discovered for e in edges)
+            total = forwarded + filtered + discovered
+            return {
+                "gateways": len(edges),
+                "synced": sum(1 for e in edges if e.active),
+                "overflow": sum(1 for e in edges if e.overflow),
+                "versions": sorted({e.version for e in edges}),
+                "allowlist_size": max((len(e.macs) for e in edges), default=0),
+                "forwarded": forwarded,
+                "filtered": filtered,
+                "discovered": discovered,
+                "filtered_ratio": round(filtered / total, 4) if total else 0.0,
+                "resyncs": sum(e.resyncs for e in edges),
+            }
+
+
+def load_macs(path: Path) -> list[str]:
+    """product_map.csv（取 mac 列）或每行一个 MAC 的文本文件"""
+    with open(path, newline="", encoding="utf-8") as f:
+        text = f.read()
+    lines = text.splitlines()
+    if lines and "mac" in lines[0].lower().split(","):
+        rows = csv.DictReader(lines)
+        macs = [row.get("mac", "") for row in rows]
+    else:
+        macs = lines
+    return [m.strip().lower().replace(":", "") for m in macs if m.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网关模拟器：按白名单在网关侧过滤 BTHome 广播")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--gateways", type=int, default=4)
+    parser.add_argument("--macs", help="已映射传感器 MAC（product_map.csv 或每行一个）")
+    parser.add_argument("--unmapped", type=int, default=50, help="每个网关额外听到的未映射传感器数")
+    parser.add_argument("--rate", type=float, default=1.0, help="每个传感器每秒广播次数")
+    parser.add_argument("--capacity", type=int, default=1024, help="网关名单容量（固件 ALLOWLIST_MAX）")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    gateway_ids = [f"gw-{0xB000 + g:04X}" for g in range(args.gateways)]
+    mapped = load_macs(Path(args.macs)) if args.macs else []
+    heard = {
+        gateway_id: mapped[g::args.gateways] + [f"f2{g:04x}{s:06x}" for s in range(args.unmapped)]
+        for g, gateway_id in enumerate(gateway_ids)
+    }
+
+    client = PahoTransport(args.host, args.port)
+    fleet = GatewayFleet(client, gateway_ids, args.capacity)
+    client.on_message = fleet.handle
+    client.on_connect = fleet.start
+    client.start()
+    print(f"[网关模拟] 连接 {client.endpoint}，{args.gateways} 个网关，Ctrl+C 退出")
+
+    interval = 1.0 / args.rate
+    next_report = time.monotonic() + 10
+    try:
+        while True:
+            started = time.monotonic()
+            for gateway_id, macs in heard.items():
+                for mac in macs:
+                    if not fleet.allows(gateway_id, mac, started):
+                        continue
+                    client.publish(
+                        f"bthome/{mac}/state",
+                        json.dumps(
+                            {"motion": rng.random() < 0.05, "rssi": rng.randint(-85, -40), "gateway_id": gateway_id},
+                            separators=(",", ":"),
+                        ),
+                    )
+            if started >= next_report:
+                next_report = started + 10
+                print(f"[网关模拟] {json.dumps(fleet.stats(), ensure_ascii=False)}")
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.stop()
+        print(f"[网关模拟] {json.dumps(fleet.stats(), ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
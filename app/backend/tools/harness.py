@@ -0,0 +1,115 @@
+"""
+压测 / 回放工具共用：在本进程内启动完整后端
+临时数据目录 + MQTT_TRANSPORT=memory，后端连到 transport.memory_broker，工具在同一个 broker 上收发消息
+"""
+
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scheduler import ReplayClock  # noqa: E402
+from transport import InMemoryTransport, MQTTTransport, memory_broker  # noqa: E402
+
+
+class InProcessBackend:
+    def __init__(
+        self,
+        products_csv: Optional[Path] = None,
+        config_json: Optional[Path] = None,
+        journal: bool = False,
+        verbose: bool = False,
+        allowlist: bool = False,
+        subscribe_mode: str = "wildcard",
+        clock: Optional[ReplayClock] = None,
+    ):
+        self._tmp = tempfile.TemporaryDirectory(prefix="seeedua-")
+        data_dir = Path(self._tmp.name)
+        if products_csv:
+            shutil.copy(products_csv, data_dir / "product_map.csv")
+        if config_json:
+            shutil.copy(config_json, data_dir / "app_config.json")
+
+        os.environ["DATA_DIR"] = str(data_dir)
+        os.environ["MQTT_TRANSPORT"] = "memory"
+        os.environ["STORAGE_BACKEND"] = "file"
+        os.environ["JOURNAL_ENABLED"] = "true" if journal else "false"
+        os.environ["PRODUCT_MAP_WATCH_INTERVAL"] = "0"
+        os.environ["GATEWAY_ALLOWLIST_ENABLED"] = "true" if allowlist else "false"
+        os.environ["MQTT_SUBSCRIBE_MODE"] = subscribe_mode
+        import main  # noqa: E402  后端按环境变量初始化，必须在设置环境变量之后导入
+
+        self.main = main
+        self.clock = clock  # 回放：去重、超时、屏幕合并按录制时间戳计算，与回放速度无关
+        if clock is not None:
+            main.use_replay_clock(clock)
+        self._devnull = open(os.devnull, "w")
+        self._quiet = None if verbose else contextlib.redirect_stdout(self._devnull)
+
+    def setup(self, rows: Optional[list[dict]] = None):
+        main = self.main
+        if self._quiet:
+            self._quiet.__enter__()
+        main.open_storage()
+        main.load_product_map()
+        main.load_app_config()
+        main.start_event_journal()
+        if rows:
+            main.bulk_apply_products(rows)
+        main.start_play_dispatcher()
+        main.start_ingest()
+        main.start_sensor_timeout_checker()
+        main.start_mqtt()
+
+    def client(self) -> MQTTTransport:
+        return InMemoryTransport(memory_broker)
+
+    def stats(self) -> dict:
+        return self.main.ingest_queue.stats()
+
+    def fusion_stats(self) -> dict:
+        return self.main.sensor_fusion.stats()
+
+    def subscription_stats(self) -> dict:
+        return self.main.mqtt_subscriptions.stats()
+
+    def ack_stats(self) -> dict:
+        return self.main.ack_tracker.stats()
+
+    def wait_drained(self, timeout: float):
+        """等接入队列处理完、各屏幕待发的播放指令发出"""
+        dispatcher = self.main.play_dispatcher
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(lane.idle for lane in self.main.ingest_queue.lanes.values()):
+                if dispatcher.pending and self.clock is not None:
+                    # 录制结束时仍在最短展示时间内的指令：回放时钟推过展示间隔，让它们发出
+                    self.clock.advance(self.clock.now() + dispatcher.min_display)
+                if not dispatcher.pending:
+                    return
+            time.sleep(0.01)
+
+    def stop(self):
+        """停止接入与后台线程，事件日志落盘（之后仍可查询）"""
+        main = self.main
+        main.mqtt_client.stop()
+        main.ingest_queue.stop()
+        main.play_dispatcher.stop()
+        main.mqtt_subscriptions.stop()
+        main.timeout_scheduler.stop()
+        if main.event_journal:
+            main.event_journal.close()
+
+    def teardown(self):
+        self.stop()
+        self.main.storage.close()
+        if self._quiet:
+            self._quiet.__exit__(None, None, None)
+        self._devnull.close()
+        self._tmp.cleanup()
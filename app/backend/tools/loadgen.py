@@ -0,0 +1,426 @@
+"""
+合成 MQTT 负载与拿起→播放端到端延迟基准
+模拟 N 个网关 × M 个传感器，按 ESP32 网关 publishToMQTT 的格式发布 bthome/{mac}/state，
+统计发布吞吐、后端处理吞吐以及拿起 → screen/{id}/play 的延迟分位数，结果写成 JSON 报告
+
+用法（在 app/backend 目录下）:
+    # 进程内：完整后端跑在进程内 broker（MQTT_TRANSPORT=memory）上，不需要网络
+    uv run python tools/loadgen.py --mode inprocess --gateways 10 --sensors 100 --duration 30
+
+    # 对接本地 broker 与正在运行的后端（经 /api/products/bulk 写入测试映射，结束后删除）
+    uv run python tools/loadgen.py --mode broker --host localhost --api http://localhost:8080 \\
+        --gateways 5 --sensors 200 --rate 2 --report report.json
+
+--unmapped N 每个网关额外模拟 N 个未映射的传感器；--edge-filter 让模拟网关按后端下发的白名单（tools/gateway_sim.py）
+在网关侧过滤，对比开关前后的发布量与后端处理量（broker 模式需后端设置 GATEWAY_ALLOWLIST_ENABLED=true）；
+--subscribe-mode per_mac 让进程内后端只订阅已映射 MAC 的主题，由 broker 丢弃未映射传感器的消息
+
+--stub-screens 同时启动模拟屏幕（tools/stub_screen.py）回报播放确认，报告附带后端统计的送达延迟
+
+--overlap K 让每个传感器同时被 K 个网关听到（各自以不同 RSSI 转发同一条广播），考察多网关融合节省的处理量
+
+运动模式（--pattern）:
+    cycle   每个传感器每 --period 秒被拿起 --hold 秒，起始相位错开（默认）
+    burst   同上，但所有传感器同时拿起，考察瞬时峰值
+    random  每次广播以 --duty 的概率报告运动
+    idle    只发 motion=false，测纯接入吞吐
+"""
+
+import argparse
+import heapq
+import json
+import random
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from gateway_sim import GatewayFleet  # noqa: E402
+from harness import InProcessBackend  # noqa: E402
+from latency import summarize_ms  # noqa: E402
+from stub_screen import StubScreen  # noqa: E402
+from transport import MQTTTransport, PahoTransport  # noqa: E402
+
+SKU_PREFIX = "LG-"
+
+
+# ============================================
+# 模拟设备
+# ============================================
+class SimSensor:
+    __slots__ = ("mac", "links", "phase", "interval", "motion", "mapped")
+
+    def __init__(
+        self, mac: str, links: list[tuple[str, int]], phase: float, interval: float, mapped: bool = True
+    ):
+        self.mac = mac
+        self.links = links  # 听到该传感器的 (网关 ID, RSSI)，第一个是所属网关
+        self.phase = phase
+        self.interval = interval
+        self.motion = False
+        self.mapped = mapped  # False 时不写入测试映射
+
+
+def make_sensors(args) -> list[SimSensor]:
+    rng = random.Random(args.seed)
+    sensors = []
+    overlap = max(1, min(args.overlap, args.gateways))
+    for g in range(args.gateways):
+        for s in range(args.sensors + args.unmapped):
+            index = g * args.sensors + s
+            mapped = s < args.sensors
+            mac = f"f0{g:04x}{s:06x}" if mapped else f"f1{g:04x}{s - args.sensors:06x}"
+            phase = 0.0 if args.pattern == "burst" else (index * 0.618034 % 1.0) * args.period
+            rssi = rng.randint(-80, -40)
+            links = [
+                (f"gw-{0xA000 + (g + k) % args.gateways:04X}", rssi - 8 * k - rng.randint(0, 5))
+                for k in range(overlap)
+            ]
+            sensors.append(SimSensor(mac, links, phase, 1.0 / args.rate, mapped))
+    return sensors
+
+
+def motion_at(sensor: SimSensor, t: float, args, rng: random.Random) -> bool:
+    if args.pattern == "idle":
+        return False
+    if args.pattern == "random":
+        return rng.random() < args.duty
+    return (t + sensor.phase) % args.period < args.hold
+
+
+def state_payload(motion: bool, gateway_id: str, rssi: int) -> bytes:
+    """与固件 publishToMQTT 相同：{"motion":..,"rssi":..,"gateway_id":".."}（ArduinoJson 紧凑格式）"""
+    return json.dumps(
+        {"motion": motion, "rssi": rssi, "gateway_id": gateway_id},
+        separators=(",", ":"),
+    ).encode()
+
+
+def product_rows(sensors: list[SimSensor], screens: int) -> list[dict]:
+    return [
+        {
+            "mac": s.mac,
+            "sku": f"{SKU_PREFIX}{s.mac}",
+            "name": f"Loadgen {s.mac}",
+            "video": "loadgen.mp4",
+            "screen": f"loadgen-{i % screens:02d}",
+        }
+        for i, s in enumerate(s for s in sensors if s.mapped)
+    ]
+
+
+# ============================================
+# 延迟统计
+# ============================================
+class LatencyTracker:
+    """拿起时记下发布时间，收到对应 SKU 的 play 指令时计算延迟"""
+
+    def __init__(self):
+        self._pending: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.latencies: list[float] = []
+        self.pickups = 0
+        self.plays = 0
+        self.unmatched_plays = 0
+        self.superseded = 0  # 上一次拿起没等到播放就又被拿起（通常是去重窗口内被抑制）
+
+    def pickup(self, mac: str, t: float):
+        with self._lock:
+            self.pickups += 1
+            if mac in self._pending:
+                self.superseded += 1
+            self._pending[mac] = t
+
+    def play(self, payload: bytes, t: float):
+        try:
+            sku = json.loads(payload).get("sku", "")
+        except ValueError:
+            return
+        if not sku.startswith(SKU_PREFIX):
+            return
+        with self._lock:
+            self.plays += 1
+            started = self._pending.pop(sku[len(SKU_PREFIX):], None)
+            if started is None:
+                self.unmatched_plays += 1
+            else:
+                self.latencies.append(t - started)
+
+    @property
+    def outstanding(self) -> int:
+        return len(self._pending)
+
+
+# ============================================
+# 连接方式
+# ============================================
+class RemoteBackend:
+    """经真实 broker 压测正在运行的后端；指定 --api 时经 HTTP 写入测试映射并读取接入统计"""
+
+    def __init__(self, args):
+        self.args = args
+        self.rows: list[dict] = []
+
+    def setup(self, rows: list[dict]):
+        self.rows = rows
+        if self.args.api:
+            result = api_request(self.args.api, "POST", "/api/products/bulk?errors_only=true", rows)
+            print(f"[loadgen] 已写入测试映射: {result.get('summary')}")
+        else:
+            print("[loadgen] 未指定 --api，假设后端已有测试映射（SKU 前缀 LG-）")
+
+    def client(self) -> MQTTTransport:
+        return PahoTransport(self.args.host, self.args.port)
+
+    def stats(self) -> dict:
+        if not self.args.api:
+            return {}
+        return api_request(self.args.api, "GET", "/api/ingest/stats")
+
+    def fusion_stats(self) -> dict:
+        if not self.args.api:
+            return {}
+        return api_request(self.args.api, "GET", "/api/fusion/stats")
+
+    def ack_stats(self) -> dict:
+        if not self.args.api:
+            return {}
+        return api_request(self.args.api, "GET", "/api/screens/acks")
+
+    def subscription_stats(self) -> dict:
+        if not self.args.api:
+            return {}
+        return api_request(self.args.api, "GET", "/api/mqtt/subscriptions")
+
+    def wait_drained(self, timeout: float):
+        if not self.args.api:
+            time.sleep(min(timeout, 1.0))
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(lane.get("depth", 0) == 0 for lane in self.stats().values()):
+                return
+            time.sleep(0.1)
+
+    def teardown(self):
+        if self.args.api and not self.args.keep_products:
+            api_request(
+                self.args.api, "POST", "/api/products/bulk?errors_only=true",
+                [{"op": "delete", "mac": r["mac"]} for r in self.rows],
+            )
+
+
+def api_request(base: str, method: str, path: str, body=None) -> dict:
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(
+        base.rstrip("/") + path, data=data, method=method,
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return json.loads(resp.read())
+
+
+# ============================================
+# 负载生成
+# ============================================
+def run(args) -> dict:
+    sensors = make_sensors(args)
+    rows = product_rows(sensors, args.screens)
+    tracker = LatencyTracker()
+    if args.mode == "inprocess":
+        backend = InProcessBackend(
+            journal=args.journal, verbose=args.verbose, allowlist=args.edge_filter,
+            subscribe_mode=args.subscribe_mode,
+        )
+    else:
+        backend = RemoteBackend(args)
+    backend.setup(rows)
+
+    client = backend.client()
+    subscribed = threading.Event()
+    fleet = None
+    if args.edge_filter:
+        fleet = GatewayFleet(client, sorted({gw for s in sensors for gw, _ in s.links}))
+
+    def on_connect():
+        client.subscribe("screen/+/play")
+        if fleet:
+            fleet.start()
+        subscribed.set()
+
+    def on_message(msg):
+        if fleet and fleet.handle(msg):
+            return
+        tracker.play(msg.payload, time.perf_counter())
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.start()
+    if not subscribed.wait(10):
+        raise SystemExit(f"无法连接 MQTT broker {client.endpoint}")
+    if fleet and not fleet.wait_synced(10):
+        print("[loadgen] 部分模拟网关未收到白名单（后端是否设置了 GATEWAY_ALLOWLIST_ENABLED=true？）")
+    stub = None
+    if args.stub_screens:
+        stub_client = backend.client()
+        stub = StubScreen(stub_client, load_ms=args.screen_load_ms, seed=args.seed)
+        stub_client.on_connect = stub.start
+        stub_client.start()
+    if args.mode == "broker":
+        time.sleep(0.5)  # 等订阅在 broker 上生效
+
+    rng = random.Random(args.seed + 1)
+    stats_before = backend.stats()
+    fusion_before = backend.fusion_stats()
+    heap = [(s.phase % s.interval, i) for i, s in enumerate(sensors)]
+    heapq.heapify(heap)
+
+    published = 0
+    max_lag = 0.0
+    start = time.perf_counter()
+    end = start + args.duration
+    while heap:
+        due, i = heap[0]
+        now = time.perf_counter()
+        if now >= end:
+            break
+        wait = start + due - now
+        if wait > 0:
+            time.sleep(min(wait, 0.005))
+            continue
+        max_lag = max(max_lag, -wait)
+        sensor = sensors[i]
+        motion = motion_at(sensor, due, args, rng)
+        if motion and not sensor.motion and sensor.mapped:
+            tracker.pickup(sensor.mac, time.perf_counter())
+        sensor.motion = motion
+        topic = f"bthome/{sensor.mac}/state"
+        for gateway_id, rssi in sensor.links:
+            if fleet and not fleet.allows(gateway_id, sensor.mac, now):
+                continue
+            client.publish(topic, state_payload(motion, gateway_id, rssi + rng.randint(-3, 3)))
+            published += 1
+        jitter = 1.0 + rng.uniform(-args.jitter, args.jitter)
+        heapq.heapreplace(heap, (due + sensor.interval * jitter, i))
+    publish_elapsed = time.perf_counter() - start
+
+    backend.wait_drained(args.drain)
+    processed_elapsed = time.perf_counter() - start
+    time.sleep(min(args.drain, 0.5))  # 等最后几条 play 回来
+    screen_acks = {}
+    if stub:
+        time.sleep(min(args.drain, args.screen_load_ms / 1000 * 1.5))  # 等最后几条确认
+        acks = backend.ack_stats()
+        acks.pop("screens", None)
+        screen_acks = {"stub": stub.stats(), "backend": acks}
+        stub.client.stop()
+        stub.stop()
+    stats_after = backend.stats()
+    fusion_after = backend.fusion_stats()
+    subscriptions = backend.subscription_stats()
+    client.stop()
+    backend.teardown()
+
+    backend = {}
+    for lane, after in stats_after.items():
+        before = stats_before.get(lane, {})
+        backend[lane] = {
+            key: after.get(key, 0) - before.get(key, 0)
+            for key in ("enqueued", "processed", "dropped", "errors")
+        }
+        backend[lane]["high_watermark"] = after.get("high_watermark", 0)
+    sensor_processed = backend.get("sensor", {}).get("processed", 0)
+    fusion = {
+        key: fusion_after.get(key, 0) - fusion_before.get(key, 0)
+        for key in ("reports", "suppressed", "handovers")
+    }
+
+    return {
+        "tool": "loadgen",
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "mode": args.mode,
+        "config": {
+            "gateways": args.gateways,
+            "sensors_per_gateway": args.sensors,
+            "sensors_total": len(sensors),
+            "unmapped_per_gateway": args.unmapped,
+            "edge_filter": args.edge_filter,
+            "overlap": len(sensors[0].links) if sensors else 0,
+            "rate_hz": args.rate,
+            "pattern": args.pattern,
+            "period_s": args.period,
+            "hold_s": args.hold,
+            "duty": args.duty,
+            "screens": args.screens,
+            "duration_s": args.duration,
+            "seed": args.seed,
+        },
+        "publish": {
+            "messages": published,
+            "target_rate": round(sum(len(s.links) for s in sensors) * args.rate, 1),
+            "achieved_rate": round(published / publish_elapsed, 1) if publish_elapsed else 0,
+            "max_schedule_lag_ms": round(max_lag * 1000, 3),
+        },
+        "backend": backend,
+        "backend_rate": round(sensor_processed / processed_elapsed, 1) if processed_elapsed else 0,
+        "fusion": fusion,
+        "edge": fleet.stats() if fleet else {},
+        "subscriptions": subscriptions,
+        "pickups": tracker.pickups,
+        "plays": tracker.plays,
+        "pickups_superseded": tracker.superseded,
+        "pickups_outstanding": tracker.outstanding,
+        "unmatched_plays": tracker.unmatched_plays,
+        "pickup_to_play": summarize_ms(tracker.latencies, (0.50, 0.90, 0.99, 0.999), suffix="_ms"),
+        "screen_acks": screen_acks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成 MQTT 负载与拿起→播放延迟基准")
+    parser.add_argument("--mode", choices=["inprocess", "broker"], default="inprocess")
+    parser.add_argument("--host", default="localhost", help="broker 地址（broker 模式）")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--api", help="后端地址，如 http://localhost:8080（broker 模式写入测试映射、读取接入统计）")
+    parser.add_argument("--keep-products", action="store_true", help="结束后保留测试映射")
+    parser.add_argument("--gateways", type=int, default=4)
+    parser.add_argument("--sensors", type=int, default=50, help="每个网关的传感器数")
+    parser.add_argument("--overlap", type=int, default=1, help="每个传感器被几个网关同时听到")
+    parser.add_argument("--unmapped", type=int, default=0, help="每个网关额外的未映射传感器数")
+    parser.add_argument("--edge-filter", action="store_true", help="模拟网关按后端下发的白名单过滤")
+    parser.add_argument(
+        "--subscribe-mode", choices=["wildcard", "per_mac"], default="wildcard",
+        help="进程内后端的传感器订阅方式（broker 模式由后端 MQTT_SUBSCRIBE_MODE 决定）",
+    )
+    parser.add_argument("--rate", type=float, default=1.0, help="每个传感器每秒广播次数")
+    parser.add_argument("--jitter", type=float, default=0.1, help="广播间隔随机抖动比例")
+    parser.add_argument("--pattern", choices=["cycle", "burst", "random", "idle"], default="cycle")
+    parser.add_argument("--period", type=float, default=8.0, help="cycle/burst: 拿起周期（秒）")
+    parser.add_argument("--hold", type=float, default=3.0, help="cycle/burst: 每次拿起持续（秒）")
+    parser.add_argument("--duty", type=float, default=0.2, help="random: 报告运动的概率")
+    parser.add_argument("--screens", type=int, default=4)
+    parser.add_argument("--stub-screens", action="store_true", help="启动模拟屏幕回报播放确认")
+    parser.add_argument("--screen-load-ms", type=float, default=300.0, help="模拟屏幕加载未缓存视频的时间（毫秒）")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--drain", type=float, default=5.0, help="发布结束后等待后端处理完的最长时间（秒）")
+    parser.add_argument("--journal", action="store_true", help="进程内模式启用事件持久化")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="进程内模式保留后端日志输出")
+    parser.add_argument("--report", help="JSON 报告输出路径")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.report:
+        Path(args.report).write_text(text + "\n", encoding="utf-8")
+        print(f"[loadgen] 报告已写入 {args.report}")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
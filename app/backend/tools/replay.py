@@ -0,0 +1,199 @@
+"""
+MQTT 流量回放：把录制文件按原始节奏（1×）、N 倍速或最快速度经 on_mqtt_message 送入进程内后端，
+输出接入吞吐以及产生的事件和播放指令摘要，用于跨版本回归对比
+
+用法（在 app/backend 目录下）:
+    # 录制：设置 CAPTURE_FILE=saturday.cap.gz 启动后端，或调用 POST /api/debug/capture
+    uv run python tools/replay.py data/captures/saturday.cap.gz --speed 0 --report base.json
+    # 换一个后端版本后，同样参数回放并与基线对比（摘要或计数不同则退出码为 1）
+    uv run python tools/replay.py data/captures/saturday.cap.gz --speed 0 --compare base.json
+
+去重窗口、融合窗口、传感器超时和屏幕最短展示时间都按录制时间戳计算（ReplayClock），与 --speed 无关：
+同一录制文件以任何倍速回放，事件与播放摘要都与 1× 一致，不同倍速的报告也可以互相对比。
+送入速度超过处理速度时回放会等接入通道腾出空间（不丢消息）；仍有丢弃时报告不可作为基线，--compare 直接失败
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from capture import iter_capture  # noqa: E402
+from harness import InProcessBackend  # noqa: E402
+from scheduler import ReplayClock  # noqa: E402
+from transport import Message  # noqa: E402
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+VOLATILE_EVENT_FIELDS = ("seq", "ts", "time")
+HIGH_WATER = 0.75  # 通道深度超过容量的这个比例时暂停送入
+
+
+def digest(lines: list[str]) -> str:
+    """与顺序无关的摘要：多线程处理时不同通道的输出交错顺序不固定"""
+    h = hashlib.sha256()
+    for line in sorted(lines):
+        h.update(line.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def canonical_event(event: dict) -> str:
+    data = {k: v for k, v in event.items() if k not in VOLATILE_EVENT_FIELDS}
+    return json.dumps(data, sort_keys=True, ensure_ascii=False)
+
+
+def replay(args) -> dict:
+    products = Path(args.products) if args.products else BACKEND_DIR / "data" / "product_map.csv"
+    backend = InProcessBackend(
+        products_csv=products if products.exists() else None,
+        config_json=Path(args.config) if args.config else None,
+        journal=True,
+        verbose=args.verbose,
+        clock=ReplayClock(),
+    )
+    backend.setup()
+    main = backend.main
+
+    plays: list[str] = []
+    plays_lock = threading.Lock()
+
+    def on_play(msg):
+        text = msg.payload.decode("utf-8", "replace")
+        try:
+            body = json.loads(text)
+            body.pop("cmd_id", None)  # 每次运行都不同，不参与摘要
+            text = json.dumps(body)
+        except (ValueError, AttributeError):
+            pass
+        with plays_lock:
+            plays.append(f"{msg.topic} {text}")
+
+    client = backend.client()
+    client.on_message = on_play
+    client.start()
+    client.subscribe("screen/+/play")
+
+    lanes = main.ingest_queue.lanes
+    limits = {name: max(1, int(lane.capacity * HIGH_WATER)) for name, lane in lanes.items()}
+
+    fed = 0
+    first_ts = None
+    max_lag = 0.0
+    throttled = 0.0
+    start = time.perf_counter()
+    for ts, topic, payload in iter_capture(args.capture):
+        if first_ts is None:
+            first_ts = ts
+        if args.speed > 0:
+            due = start + (ts - first_ts) / args.speed
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            else:
+                max_lag = max(max_lag, -wait)
+        # 背压：与 on_mqtt_message 相同的分流规则，目标通道接近满时等批处理线程消化，避免丢最旧消息
+        name = "sensor" if topic.startswith("bthome/") else "gateway"
+        lane = lanes.get(name)
+        if lane is not None and lane.depth >= limits[name]:
+            paused = time.perf_counter()
+            while lane.depth >= limits[name]:
+                time.sleep(0.0005)
+            throttled += time.perf_counter() - paused
+        main.on_mqtt_message(Message(topic, payload), ts)
+        fed += 1
+        if args.limit and fed >= args.limit:
+            break
+    feed_elapsed = time.perf_counter() - start
+
+    backend.wait_drained(args.drain)
+    processed_elapsed = time.perf_counter() - start
+    time.sleep(0.2)  # 等最后几条 play 经 broker 回来
+    client.stop()
+    backend.stop()
+
+    events = list(main.event_journal.query()) if main.event_journal else []
+    stats = backend.stats()
+    backend.teardown()
+
+    processed = sum(lane["processed"] for lane in stats.values())
+    dropped = sum(lane["dropped"] for lane in stats.values())
+    event_lines = [canonical_event(e) for e in events]
+    by_screen = Counter(line.split(" ", 1)[0].split("/")[1] for line in plays)
+    return {
+        "tool": "replay",
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "capture": str(args.capture),
+        "speed": args.speed,
+        "messages": fed,
+        "capture_span_s": round(ts - first_ts, 3) if fed else 0,
+        "feed_elapsed_s": round(feed_elapsed, 3),
+        "feed_rate": round(fed / feed_elapsed, 1) if feed_elapsed else 0,
+        "processed": processed,
+        "processed_rate": round(processed / processed_elapsed, 1) if processed_elapsed else 0,
+        "max_schedule_lag_ms": round(max_lag * 1000, 3),
+        "throttled_s": round(throttled, 3),
+        "dropped": dropped,
+        "ingest": stats,
+        "events": dict(sorted(Counter(e["type"] for e in events).items())),
+        "plays": len(plays),
+        "plays_by_screen": dict(sorted(by_screen.items())),
+        "events_digest": digest(event_lines),
+        "plays_digest": digest(plays),
+    }
+
+
+def compare(report: dict, baseline: dict) -> list[str]:
+    diffs = []
+    for name, side in (("基线", baseline), ("本次", report)):
+        if side.get("dropped"):
+            diffs.append(f"{name}回放丢弃了 {side['dropped']} 条消息，输出不可比")
+    for key in ("messages", "events", "plays", "plays_by_screen", "events_digest", "plays_digest"):
+        if report.get(key) != baseline.get(key):
+            diffs.append(f"{key}: {baseline.get(key)} → {report.get(key)}")
+    if baseline.get("processed_rate"):
+        change = report["processed_rate"] / baseline["processed_rate"] - 1
+        print(f"[回放] 处理吞吐 {baseline['processed_rate']} → {report['processed_rate']} msg/s ({change:+.1%})")
+    return diffs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MQTT 流量回放与回归对比")
+    parser.add_argument("capture", help="录制文件（.cap 或 .cap.gz）")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放倍速，0 表示最快")
+    parser.add_argument("--products", help="产品映射 CSV（默认 data/product_map.csv）")
+    parser.add_argument("--config", help="运行时配置 app_config.json（去重窗口、超时）")
+    parser.add_argument("--limit", type=int, default=0, help="最多回放条数")
+    parser.add_argument("--drain", type=float, default=30.0, help="送完后等待处理完的最长时间（秒）")
+    parser.add_argument("--report", help="JSON 报告输出路径")
+    parser.add_argument("--compare", help="与之前的报告对比")
+    parser.add_argument("--verbose", action="store_true", help="保留后端日志输出")
+    args = parser.parse_args()
+
+    report = replay(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.report:
+        Path(args.report).write_text(text + "\n", encoding="utf-8")
+        print(f"[回放] 报告已写入 {args.report}")
+    print(text)
+    if report["dropped"]:
+        print(f"[回放] 警告: 接入队列丢弃了 {report['dropped']} 条消息，本次报告不能作为基线")
+
+    if args.compare:
+        diffs = compare(report, json.loads(Path(args.compare).read_text(encoding="utf-8")))
+        for line in diffs:
+            print(f"[回放] 差异 {line}")
+        if diffs:
+            sys.exit(1)
+        print("[回放] 输出与基线一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+模拟屏幕：订阅 screen/+/play 与 screen/+/preload，模拟加载视频后在 screen/{id}/status 回报
+{"cmd_id": .., "status": "playing", "video": ..}，不接硬件即可验证播放确认与送达延迟统计
+
+- 视频在屏幕缓存（LRU，收到预加载提示或播放过即缓存）中时按 --warm-ms 确认，否则按 --load-ms
+- --drop 按比例不回报（模拟离线/丢包），--error 按比例回报 status=error
+
+用法（在 app/backend 目录下）:
+    # 对接本地 broker 与正在运行的后端，之后查看 GET /api/screens/acks 与 /api/screens/unacked
+    uv run python tools/stub_screen.py --host localhost --load-ms 400 --warm-ms 50 --drop 0.05
+
+    # 压测时让 loadgen 同时启动模拟屏幕，报告中附带屏幕确认统计
+    uv run python tools/loadgen.py --stub-screens
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scheduler import DeadlineScheduler  # noqa: E402
+from transport import Message, MQTTTransport, PahoTransport  # noqa: E402
+
+
+class StubScreen:
+    """一个 MQTT 连接模拟任意多个屏幕；screens 为空时应答所有屏幕"""
+
+    def __init__(
+        self,
+        client: MQTTTransport,
+        screens: Optional[set[str]] = None,
+        load_ms: float = 300.0,
+        warm_ms: float = 40.0,
+        jitter: float = 0.2,
+        drop: float = 0.0,
+        error: float = 0.0,
+        cache: int = 8,
+        seed: int = 1,
+    ):
+        self.client = client
+        self.screens = screens or set()
+        self.load_ms = load_ms
+        self.warm_ms = warm_ms
+        self.jitter = jitter
+        self.drop = drop
+        self.error = error
+        self.cache = cache
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._caches: dict[str, OrderedDict[str, None]] = {}
+        self._acks: dict[str, tuple[str, str, str]] = {}  # cmd_id → (屏幕, 视频, 状态)
+        self._scheduler = DeadlineScheduler(self._send_ack, name="stub-screen")
+
+        self.plays = 0
+        self.warm = 0
+        self.preloads = 0
+        self.acked = 0
+        self.dropped = 0
+        self.errors = 0
+
+        client.on_message = self._on_message
+
+    def start(self):
+        self._scheduler.start()
+        self.client.subscribe("screen/+/play")
+        self.client.subscribe("screen/+/preload")
+
+    def stop(self):
+        self._scheduler.stop()
+
+    def _cached(self, screen: str, video: str) -> bool:
+        """视频是否已在屏幕缓存中；不在时加入缓存"""
+        videos = self._caches.get(screen)
+        if videos is None:
+            videos = self._caches[screen] = OrderedDict()
+        hit = video in videos
+        videos[video] = None
+        videos.move_to_end(video)
+        while len(videos) > self.cache:
+            videos.popitem(last=False)
+        return hit
+
+    def _on_message(self, msg: Message):
+        parts = msg.topic.split("/")
+        if len(parts) != 3 or (self.screens and parts[1] not in self.screens):
+            return
+        try:
+            body = json.loads(msg.payload)
+        except ValueError:
+            return
+        if not isinstance(body, dict):
+            return
+        screen, kind = parts[1], parts[2]
+        video = str(body.get("video", ""))
+
+        with self._lock:
+            if kind == "preload":
+                self.preloads += 1
+                self._cached(screen, video)
+                return
+            if kind != "play":
+                return
+            self.plays += 1
+            warm = self._cached(screen, video)
+            self.warm += warm
+            cmd_id = body.get("cmd_id")
+            if not cmd_id:
+                return
+            if self._rng.random() < self.drop:
+                self.dropped += 1
+                return
+            status = "error" if self._rng.random() < self.error else "playing"
+            delay_ms = self.warm_ms if warm else self.load_ms
+            delay_ms *= 1.0 + self._rng.uniform(-self.jitter, self.jitter)
+            self._acks[cmd_id] = (screen, video, status)
+        self._scheduler.schedule(cmd_id, max(0.0, delay_ms / 1000))
+
+    def _send_ack(self, cmd_id: str):
+        with self._lock:
+            entry = self._acks.pop(cmd_id, None)
+        if entry is None:
+            return
+        screen, video, status = entry
+        if self.client.publish(
+            f"screen/{screen}/status",
+            json.dumps({"cmd_id": cmd_id, "status": status, "video": video}),
+        ):
+            with self._lock:
+                self.acked += 1
+                self.errors += status == "error"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "plays": self.plays,
+                "warm_plays": self.warm,
+                "preloads": self.preloads,
+                "acked": self.acked,
+                "errors": self.errors,
+                "dropped": self.dropped,
+                "waiting": len(self._acks),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟屏幕：回报播放确认")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--screens", default="", help="只应答这些屏幕（逗号分隔），默认全部")
+    parser.add_argument("--load-ms", type=float, default=300.0, help="未缓存视频的加载时间（毫秒）")
+    parser.add_argument("--warm-ms", type=float, default=40.0, help="已缓存视频的起播时间（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="延迟随机抖动比例")
+    parser.add_argument("--drop", type=float, default=0.0, help="不回报确认的比例")
+    parser.add_argument("--error", type=float, default=0.0, help="回报 status=error 的比例")
+    parser.add_argument("--cache", type=int, default=8, help="每个屏幕缓存的视频数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    client = PahoTransport(args.host, args.port)
+    stub = StubScreen(
+        client,
+        {s for s in args.screens.split(",") if s},
+        args.load_ms, args.warm_ms, args.jitter, args.drop, args.error, args.cache, args.seed,
+    )
+    client.on_connect = stub.start
+    client.start()
+    print(f"[模拟屏幕] 连接 {client.endpoint}，Ctrl+C 退出")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"[模拟屏幕] {json.dumps(stub.stats(), ensure_ascii=False)}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.stop()
+        stub.stop()
+        print(f"[模拟屏幕] {json.dumps(stub.stats(), ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+去重窗口 / 超时参数离线扫描
+读取录制的运动流（capture 文件或事件日志），按后端 handle_sensor_event 的规则，
+用 NumPy 对每组 (dedup_window, sensor_timeout) 向量化计算会产生的提起、播放、未知 MAC、
+被去重抑制的重复触发、放下和超时次数
+
+用法（在 app/backend 目录下，需要 numpy）:
+    uv run --with numpy python tools/sweep.py --capture data/captures/saturday.cap.gz \\
+        --dedup 0.5,1,2,3,5 --timeout 2:10:1 --report sweep.json
+    uv run --with numpy python tools/sweep.py --journal data/journal --dedup 1,2,3
+
+规则（与后端一致）:
+    提起   motion=true，且上一条不是 motion=true，或与上一条间隔超过超时（期间已超时放下）
+    放下   motion=false，且上一条是 motion=true 且未超时；首次出现即 motion=false 也记一次
+    超时   motion=true 之后超时时间内没有新消息（录制结束前）
+    去重   提起距上一次「未被抑制」的触发不足 dedup_window 则抑制；产品级 timeout_s 优先于全局超时
+
+事件日志只记录状态变化，没有中间的 motion=true 刷新，用它扫描超时会偏多，建议优先使用 capture 文件
+"""
+
+import argparse
+import csv
+import json
+import sys
+import time
+from pathlib import Path
+
+try:
+    import numpy as np
+except ImportError:  # numpy 只有这个离线工具需要，不是后端依赖
+    sys.exit("tools/sweep.py 需要 numpy：uv run --with numpy python tools/sweep.py ...")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from capture import iter_capture  # noqa: E402
+from journal import SEGMENT_PREFIX  # noqa: E402
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+PAYLOAD_CACHE = 65536  # 载荷重复率高（运动状态 × RSSI × 网关），缓存解析结果
+
+
+# ============================================
+# 输入
+# ============================================
+def parse_grid(spec: str) -> list[float]:
+    """"1,2,3" 或 "start:stop:step"（含 stop）"""
+    values = []
+    for part in spec.split(","):
+        if ":" in part:
+            start, stop, step = (float(x) for x in part.split(":"))
+            values.extend(np.round(np.arange(start, stop + step / 2, step), 6).tolist())
+        elif part.strip():
+            values.append(float(part))
+    return sorted(set(values))
+
+
+class MotionStream:
+    """按 (MAC, 时间) 排序的运动消息：mac[i] 为 MAC 编号，t[i] 为接收时间，motion[i] 为运动状态"""
+
+    def __init__(self, macs: list[str], mac_idx, t, motion):
+        order = np.lexsort((np.arange(len(t)), t, mac_idx))  # 同一时刻保持到达顺序
+        self.macs = macs
+        self.mac = mac_idx[order]
+        self.t = t[order]
+        self.motion = motion[order]
+        self.t_end = float(t.max()) if len(t) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.t)
+
+
+def load_capture(path: Path) -> MotionStream:
+    index: dict[str, int] = {}
+    topic_mac: dict[str, int] = {}  # 主题 → MAC 编号，-1 表示不是传感器主题
+    payload_motion: dict[bytes, bool | None] = {}  # 载荷 → motion，None 表示后端会丢弃
+    mac_idx, ts, motion = [], [], []
+    for t, topic, payload in iter_capture(path):
+        idx = topic_mac.get(topic)
+        if idx is None:
+            parts = topic.split("/")
+            if parts[0] == "bthome" and len(parts) == 3:
+                idx = index.setdefault(parts[1].lower(), len(index))
+            else:
+                idx = -1
+            topic_mac[topic] = idx
+        if idx < 0:
+            continue
+        value = payload_motion.get(payload, ...)
+        if value is ...:
+            try:
+                data = json.loads(payload)
+            except ValueError:
+                data = None  # 后端同样丢弃无法解析的消息
+            value = bool(data.get("motion", False)) if isinstance(data, dict) else None
+            if len(payload_motion) < PAYLOAD_CACHE:
+                payload_motion[payload] = value
+        if value is None:
+            continue
+        mac_idx.append(idx)
+        ts.append(t)
+        motion.append(value)
+    return MotionStream(
+        list(index),
+        np.array(mac_idx, dtype=np.int64),
+        np.array(ts, dtype=np.float64),
+        np.array(motion, dtype=bool),
+    )
+
+
+def load_journal(directory: Path) -> MotionStream:
+    index: dict[str, int] = {}
+    mac_idx, ts, motion = [], [], []
+    for path in sorted(directory.glob(f"{SEGMENT_PREFIX}*.jsonl")):
+        with open(path, "rb") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                kind = event.get("type")
+                if kind not in ("picked_up", "put_down"):
+                    continue
+                mac_idx.append(index.setdefault(event["mac"], len(index)))
+                ts.append(event["ts"])
+                motion.append(kind == "picked_up")
+    return MotionStream(
+        list(index),
+        np.array(mac_idx, dtype=np.int64),
+        np.array(ts, dtype=np.float64),
+        np.array(motion, dtype=bool),
+    )
+
+
+def load_products(path: Path) -> dict[str, float | None]:
+    """MAC → 产品级 timeout_s（None 表示使用全局超时）；不在表中的 MAC 视为未映射"""
+    products = {}
+    if not path.exists():
+        return products
+    with open(path, "r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            mac = (row.get("mac") or "").strip().lower().replace(":", "")
+            raw = (row.get("timeout_s") or "").strip()
+            products[mac] = float(raw) if raw else None
+    return products
+
+
+# ============================================
+# 向量化模拟
+# ============================================
+def simulate_timeouts(stream: MotionStream, timeout_per_msg):
+    """给定每条消息适用的超时，返回 (提起掩码, 放下数, 超时数)"""
+    mac, t, motion = stream.mac, stream.t, stream.motion
+    n = len(t)
+    same_prev = np.zeros(n, dtype=bool)
+    same_prev[1:] = mac[1:] == mac[:-1]
+    gap_prev = np.empty(n)
+    gap_prev[0] = np.inf
+    gap_prev[1:] = t[1:] - t[:-1]
+
+    prev_motion = np.zeros(n, dtype=bool)
+    prev_motion[1:] = motion[:-1]
+    prev_active = same_prev & prev_motion & (gap_prev <= timeout_per_msg)
+
+    pickups = motion & ~prev_active
+    put_downs = ~motion & (prev_active | ~same_prev)
+
+    same_next = np.zeros(n, dtype=bool)
+    same_next[:-1] = same_prev[1:]
+    gap_next = np.empty(n)
+    gap_next[-1:] = np.inf
+    gap_next[:-1] = gap_prev[1:]
+    expired = np.where(same_next, gap_next > timeout_per_msg, t + timeout_per_msg <= stream.t_end)
+    timeouts = int(np.count_nonzero(motion & expired))
+    return pickups, int(np.count_nonzero(put_downs)), timeouts
+
+
+def dedup_chain(pick_mac, pick_t, window: float):
+    """
+    去重链：每个 MAC 从第一次提起开始，下一次被接受的是第一个 >= 上次接受时间 + window 的提起。
+    所有簇同时推进，每轮对全部未结束的簇做一次 searchsorted
+    """
+    n = len(pick_t)
+    accepted = np.ones(n, dtype=bool)
+    if n == 0 or window <= 0:
+        return accepted
+
+    # 与前一次提起间隔不小于 window 的一定被接受（上次接受时间不晚于前一次提起），
+    # 链只在间隔过近的连续提起（簇）内传递，按簇而不是按 MAC 推进
+    close = np.zeros(n, dtype=bool)
+    close[1:] = (pick_mac[1:] == pick_mac[:-1]) & (pick_t[1:] - pick_t[:-1] < window)
+    if not close.any():
+        return accepted
+
+    starts = np.flatnonzero(~close)
+    ends = np.append(starts[1:], n)
+    seg_of = np.cumsum(~close) - 1
+    chain_segs = np.unique(seg_of[close])
+    accepted[np.isin(seg_of, chain_segs)] = False
+
+    # 组合键：簇号 * 跨度 + 相对时间，在整个数组上 searchsorted 即可分段查找
+    rel = pick_t - pick_t.min()
+    span = float(rel.max()) + window + 1.0
+    key = seg_of * span + rel
+    cursor = starts[chain_segs]
+    seg_end = ends[chain_segs]
+    seg_base = chain_segs * span
+    while len(cursor):
+        accepted[cursor] = True
+        nxt = np.searchsorted(key, seg_base + rel[cursor] + window, side="left")
+        nxt = _settle(pick_t, cursor, nxt, seg_end, window)
+        alive = nxt < seg_end
+        cursor, seg_end, seg_base = nxt[alive], seg_end[alive], seg_base[alive]
+    return accepted
+
+
+def _settle(pick_t, cursor, nxt, seg_end, window: float):
+    """组合键有舍入误差，在边界附近按后端的判定（now - last_trigger < window）逐个校正"""
+    while True:
+        back = (nxt - 1 > cursor) & (pick_t[np.maximum(nxt - 1, 0)] - pick_t[cursor] >= window)
+        if not back.any():
+            break
+        nxt = nxt - back
+    while True:
+        idx = np.minimum(nxt, len(pick_t) - 1)
+        forward = (nxt < seg_end) & (pick_t[idx] - pick_t[cursor] < window)
+        if not forward.any():
+            break
+        nxt = nxt + forward
+    return nxt
+
+
+def sweep(stream: MotionStream, products: dict, dedups: list[float], timeouts: list[float],
+          use_product_timeouts: bool = True) -> list[dict]:
+    mapped = np.array([m in products for m in stream.macs], dtype=bool)
+    override = np.array(
+        [products.get(m) if use_product_timeouts and products.get(m) is not None else np.nan
+         for m in stream.macs],
+        dtype=np.float64,
+    )
+    msg_override = override[stream.mac] if len(stream.macs) else np.empty(0)
+    has_override = ~np.isnan(msg_override)
+
+    results = []
+    for timeout in timeouts:
+        timeout_per_msg = np.where(has_override, msg_override, timeout)
+        pickups, put_downs, n_timeouts = simulate_timeouts(stream, timeout_per_msg)
+        pick_mac = stream.mac[pickups]
+        pick_t = stream.t[pickups]
+        pick_mapped = mapped[pick_mac]
+        for window in dedups:
+            accepted = dedup_chain(pick_mac, pick_t, window)
+            plays = int(np.count_nonzero(accepted & pick_mapped))
+            results.append({
+                "dedup_window": window,
+                "sensor_timeout": timeout,
+                "pickups": int(len(pick_t)),
+                "plays": plays,
+                "unknown": int(np.count_nonzero(accepted)) - plays,
+                "suppressed": int(len(pick_t) - np.count_nonzero(accepted)),
+                "put_downs": put_downs,
+                "timeouts": n_timeouts,
+            })
+    return results
+
+
+# ============================================
+# 输出
+# ============================================
+COLUMNS = ["dedup_window", "sensor_timeout", "pickups", "plays", "unknown", "suppressed", "put_downs", "timeouts"]
+
+
+def print_table(results: list[dict], current: tuple[float, float]):
+    print("  ".join(f"{c:>14}" for c in COLUMNS))
+    for r in results:
+        mark = "  ← 当前" if (r["dedup_window"], r["sensor_timeout"]) == current else ""
+        print("  ".join(f"{r[c]:>14}" for c in COLUMNS) + mark)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="去重窗口 / 超时参数离线扫描")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--capture", help="录制文件（.cap / .cap.gz）")
+    source.add_argument("--journal", help="事件日志目录（只有状态变化，超时结果偏多）")
+    parser.add_argument("--dedup", default="0.5,1,2,3,5", help='去重窗口取值，如 "1,2,3" 或 "0.5:5:0.5"')
+    parser.add_argument("--timeout", default="2,3,5,8,10", help="全局超时取值，格式同上")
+    parser.add_argument("--products", default=str(BACKEND_DIR / "data" / "product_map.csv"),
+                        help="产品映射 CSV（决定已映射 MAC 与产品级 timeout_s）")
+    parser.add_argument("--ignore-product-timeouts", action="store_true", help="忽略产品级 timeout_s，只用全局超时")
+    parser.add_argument("--current", default="2.0,5.0", help="当前 dedup_window,sensor_timeout，在表中标出")
+    parser.add_argument("--report", help="结果输出路径（.json 或 .csv）")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stream = load_capture(Path(args.capture)) if args.capture else load_journal(Path(args.journal))
+    loaded = time.perf_counter()
+    products = load_products(Path(args.products))
+    dedups, timeouts = parse_grid(args.dedup), parse_grid(args.timeout)
+    results = sweep(stream, products, dedups, timeouts, not args.ignore_product_timeouts)
+    finished = time.perf_counter()
+
+    print(
+        f"[扫描] {len(stream)} 条运动消息，{len(stream.macs)} 个 MAC，"
+        f"{len(dedups) * len(timeouts)} 组参数；加载 {loaded - started:.2f}s，计算 {finished - loaded:.2f}s"
+    )
+    current = tuple(float(x) for x in args.current.split(","))
+    print_table(results, current)
+
+    if args.report:
+        path = Path(args.report)
+        if path.suffix == ".csv":
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=COLUMNS)
+                writer.writeheader()
+                writer.writerows(results)
+        else:
+            path.write_text(json.dumps({
+                "source": args.capture or args.journal,
+                "messages": len(stream),
+                "macs": len(stream.macs),
+                "results": results,
+            }, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"[扫描] 结果已写入 {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""
+MQTT 传输层
+- MQTTTransport: 后端使用的接口（连接/断开回调、订阅、发布），与具体客户端库解耦
+- PahoTransport: 真实 broker，paho-mqtt 客户端 + 断线重连线程
+- InMemoryBroker / InMemoryTransport: 进程内发布订阅（支持 + / # 通配符），不需要网络即可运行和压测整个后端
+"""
+
+import abc
+import itertools
+import threading
+import time
+from typing import Callable, Optional
+
+
+class Message:
+    """与 paho MQTTMessage 同名属性的最小消息对象"""
+
+    __slots__ = ("topic", "payload", "qos", "retain")
+
+    def __init__(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+def to_bytes(payload) -> bytes:
+    if payload is None:
+        return b""
+    if isinstance(payload, str):
+        return payload.encode("utf-8")
+    return bytes(payload)
+
+
+class MQTTTransport(abc.ABC):
+    """传输层接口；回调在传输层自己的线程中调用，处理要快"""
+
+    name = "base"
+
+    def __init__(self):
+        self.on_connect: Optional[Callable[[], None]] = None
+        self.on_disconnect: Optional[Callable[[], None]] = None
+        self.on_message: Optional[Callable[[Message], None]] = None
+        self.on_published: Optional[Callable[[int], None]] = None
+        self.connected = False
+
+    @property
+    def endpoint(self) -> str:
+        return self.name
+
+    @abc.abstractmethod
+    def start(self):
+        """开始连接（后台保持连接，断线自动重连）"""
+
+    @abc.abstractmethod
+    def stop(self):
+        ...
+
+    @abc.abstractmethod
+    def subscribe(self, topic: str, qos: int = 0):
+        ...
+
+    @abc.abstractmethod
+    def unsubscribe(self, topic: str):
+        ...
+
+    def subscribe_many(self, topics: list[str], qos: int = 0) -> bool:
+        """一次 SUBSCRIBE 订阅多个主题；返回是否已交给传输层"""
+        for topic in topics:
+            self.subscribe(topic, qos)
+        return True
+
+    def unsubscribe_many(self, topics: list[str]) -> bool:
+        for topic in topics:
+            self.unsubscribe(topic)
+        return True
+
+    @abc.abstractmethod
+    def publish(self, topic: str, payload, qos: int = 0, retain: bool = False) -> bool:
+        """返回是否已交给传输层发送"""
+
+    @abc.abstractmethod
+    def publish_tracked(self, topic: str, payload, qos: int = 1, retain: bool = False) -> Optional[int]:
+        """发布并返回消息 ID（失败为 None）；broker 确认后以该 ID 回调 on_published，回调可能早于本方法返回"""
+
+    def _connected(self):
+        self.connected = True
+        if self.on_connect:
+            self.on_connect()
+
+    def _disconnected(self):
+        self.connected = False
+        if self.on_disconnect:
+            self.on_disconnect()
+
+
+# ============================================
+# paho-mqtt
+# ============================================
+class PahoTransport(MQTTTransport):
+    name = "paho"
+
+    def __init__(self, host: str, port: int, keepalive: int = 60, retry_delay: float = 5.0):
+        super().__init__()
+        import paho.mqtt.client as mqtt
+
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.retry_delay = retry_delay
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+        self.client.on_publish = self._on_publish
+
+    @property
+    def endpoint(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        if reason_code == 0:
+            self._connected()
+        else:
+            self.connected = False
+            print(f"[MQTT] 连接失败, rc={reason_code}")
+
+    def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties):
+        self._disconnected()
+
+    def _on_message(self, client, userdata, msg):
+        if self.on_message:
+            self.on_message(msg)
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties):
+        if self.on_published:
+            self.on_published(mid)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="mqtt", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while self._running:
+            try:
+                self.client.connect(self.host, self.port, self.keepalive)
+                self.client.loop_forever()
+            except Exception as e:
+                print(f"[MQTT] 连接错误: {e}, {self.retry_delay:g}秒后重试...")
+            if self._running:
+                time.sleep(self.retry_delay)
+
+    def stop(self):
+        self._running = False
+        self.client.disconnect()
+
+    def subscribe(self, topic: str, qos: int = 0):
+        self.client.subscribe(topic, qos)
+
+    def unsubscribe(self, topic: str):
+        self.client.unsubscribe(topic)
+
+    def subscribe_many(self, topics: list[str], qos: int = 0) -> bool:
+        import paho.mqtt.client as mqtt
+
+        rc, _ = self.client.subscribe([(topic, qos) for topic in topics])
+        return rc == mqtt.MQTT_ERR_SUCCESS
+
+    def unsubscribe_many(self, topics: list[str]) -> bool:
+        import paho.mqtt.client as mqtt
+
+        rc, _ = self.client.unsubscribe(list(topics))
+        return rc == mqtt.MQTT_ERR_SUCCESS
+
+    def publish(self, topic: str, payload, qos: int = 0, retain: bool = False) -> bool:
+        import paho.mqtt.client as mqtt
+
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        return info.rc == mqtt.MQTT_ERR_SUCCESS
+
+    def publish_tracked(self, topic: str, payload, qos: int = 1, retain: bool = False) -> Optional[int]:
+        import paho.mqtt.client as mqtt
+
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        return info.mid if info.rc == mqtt.MQTT_ERR_SUCCESS else None
+
+
+# ============================================
+# 进程内 broker
+# ============================================
+class _TopicNode:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self):
+        self.children: dict[str, "_TopicNode"] = {}
+        self.subscribers: dict["InMemoryTransport", int] = {}
+
+
+class InMemoryBroker:
+    """
+    进程内 MQTT broker 替身：订阅按主题层级存成前缀树，发布时只遍历可能匹配的分支。
+    消息在发布者的线程里同步投递给订阅者（对应 paho 网络线程调用 on_message）
+    """
+
+    def __init__(self):
+        self._root = _TopicNode()
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def subscribe(self, client: "InMemoryTransport", topic_filter: str, qos: int = 0):
+        with self._lock:
+            node = self._root
+            for part in topic_filter.split("/"):
+                node = node.children.setdefault(part, _TopicNode())
+            node.subscribers[client] = qos
+
+    def unsubscribe(self, client: "InMemoryTransport", topic_filter: str):
+        with self._lock:
+            path = [self._root]
+            for part in topic_filter.split("/"):
+                node = path[-1].children.get(part)
+                if node is None:
+                    return
+                path.append(node)
+            path[-1].subscribers.pop(client, None)
+            # 清理空分支
+            parts = topic_filter.split("/")
+            for depth in range(len(parts), 0, -1):
+                node = path[depth]
+                if node.subscribers or node.children:
+                    break
+                del path[depth - 1].children[parts[depth - 1]]
+
+    def remove_client(self, client: "InMemoryTransport"):
+        with self._lock:
+            stack = [self._root]
+            while stack:
+                node = stack.pop()
+                node.subscribers.pop(client, None)
+                stack.extend(node.children.values())
+
+    def _match(self, topic: str) -> dict["InMemoryTransport", int]:
+        parts = topic.split("/")
+        matched: dict[InMemoryTransport, int] = {}
+
+        def walk(node: _TopicNode, i: int):
+            wildcard = node.children.get("#")
+            if wildcard:
+                matched.update(wildcard.subscribers)
+            if i == len(parts):
+                matched.update(node.subscribers)
+                return
+            child = node.children.get(parts[i])
+            if child:
+                walk(child, i + 1)
+            child = node.children.get("+")
+            if child:
+                walk(child, i + 1)
+
+        with self._lock:
+            walk(self._root, 0)
+        return matched
+
+    def publish(self, topic: str, payload, qos: int = 0, retain: bool = False):
+        self.published += 1
+        payload = to_bytes(payload)
+        for client, sub_qos in self._match(topic).items():
+            client._deliver(Message(topic, payload, min(qos, sub_qos), retain))
+            self.delivered += 1
+
+
+class InMemoryTransport(MQTTTransport):
+    name = "memory"
+
+    def __init__(self, broker: InMemoryBroker):
+        super().__init__()
+        self.broker = broker
+        self._mids = itertools.count(1)
+
+    @property
+    def endpoint(self) -> str:
+        return "进程内 broker"
+
+    def start(self):
+        if not self.connected:
+            self._connected()
+
+    def stop(self):
+        if self.connected:
+            self.broker.remove_client(self)
+            self._disconnected()
+
+    def subscribe(self, topic: str, qos: int = 0):
+        self.broker.subscribe(self, topic, qos)
+
+    def unsubscribe(self, topic: str):
+        self.broker.unsubscribe(self, topic)
+
+    def publish(self, topic: str, payload, qos: int = 0, retain: bool = False) -> bool:
+        if not self.connected:
+            return False
+        self.broker.publish(topic, payload, qos, retain)
+        return True
+
+    def publish_tracked(self, topic: str, payload, qos: int = 1, retain: bool = False) -> Optional[int]:
+        if not self.connected:
+            return None
+        mid = next(self._mids)
+        self.broker.publish(topic, payload, qos, retain)
+        if self.on_published:
+            self.on_published(mid)  # 同步投递即视为 broker 已确认
+        return mid
+
+    def _deliver(self, message: Message):
+        if self.on_message:
+            self.on_message(message)
+
+
+# 进程内共享的 broker：MQTT_TRANSPORT=memory 时后端连到这里，压测工具在同一进程里连同一个实例
+memory_broker = InMemoryBroker()
+
+
+def create_transport(settings) -> MQTTTransport:
+    if settings.mqtt_transport == "memory":
+        return InMemoryTransport(memory_broker)
+    return PahoTransport(settings.mqtt_broker, settings.mqtt_port)
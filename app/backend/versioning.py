@@ -0,0 +1,60 @@
+"""
+状态版本号与响应缓存
+每次修改递增全局版本号，并记录受影响资源的最新版本；
+读接口按资源版本生成 ETag，同一版本的 JSON 只序列化一次，供所有请求共享
+"""
+
+import json
+import os
+import threading
+from typing import Any, Callable
+
+from fastapi.encoders import jsonable_encoder
+
+
+class StateVersions:
+    def __init__(self):
+        self.version = 0
+        # 进程启动标识，避免重启后版本号从 0 开始与客户端缓存的 ETag 撞车
+        self.boot_id = os.urandom(4).hex()
+        self._resources: dict[str, int] = {}
+        self._cache: dict[str, tuple[int, str, bytes]] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def bump(self, *resources: str):
+        with self._lock:
+            self.version += 1
+            for resource in resources:
+                self._resources[resource] = self.version
+
+    def etag(self, resource: str) -> str:
+        return self._make_etag(resource, self._resources.get(resource, 0))
+
+    def _make_etag(self, resource: str, version: int) -> str:
+        return f'W/"{self.boot_id}-{resource}-{version}"'
+
+    def render(self, resource: str, build: Callable[[], Any]) -> tuple[str, bytes]:
+        """返回 (ETag, JSON 字节)；版本未变时直接复用缓存"""
+        version = self._resources.get(resource, 0)
+        cached = self._cache.get(resource)
+        if cached and cached[0] == version:
+            self.hits += 1
+            return cached[1], cached[2]
+
+        self.misses += 1
+        body = json.dumps(
+            jsonable_encoder(build()), ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        etag = self._make_etag(resource, version)
+        self._cache[resource] = (version, etag, body)
+        return etag, body
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
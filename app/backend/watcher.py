@@ -0,0 +1,70 @@
+"""
+文件变更轮询
+按 (inode, mtime, size) 签名检测外部修改；签名需连续两次轮询保持不变才触发，避免读到写了一半的文件。
+本进程自己写盘后调用 remember() 记下新签名，不会把自己的写入当成外部修改
+"""
+
+import threading
+from typing import Callable, Optional
+
+
+class FileWatcher:
+    def __init__(
+        self,
+        name: str,
+        signature: Callable[[], Optional[tuple]],
+        on_change: Callable[[], None],
+        interval: float,
+    ):
+        self.name = name
+        self.signature = signature
+        self.on_change = on_change
+        self.interval = interval
+
+        self._seen: Optional[tuple] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.reloads = 0
+
+    def remember(self):
+        """记下当前签名为已知状态（加载或本进程写盘之后调用）"""
+        with self._lock:
+            self._seen = self.signature()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self.remember()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"watch-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def _run(self):
+        pending: Optional[tuple] = None
+        while not self._stop.wait(self.interval):
+            current = self.signature()
+            with self._lock:
+                if current == self._seen:
+                    pending = None
+                    continue
+            if current != pending:
+                pending = current  # 等下一轮确认文件已写完
+                continue
+            pending = None
+            try:
+                self.on_change()
+                self.reloads += 1
+            except Exception as e:
+                print(f"[热加载] {self.name} 处理失败: {e}")
+            with self._lock:
+                self._seen = current